@@ -0,0 +1,79 @@
+"""
+Measures Bot API throughput at different connection pool sizes against a local stand-in server
+
+The stand-in answers every call like telegram does after a fixed delay, and a fixed number of
+threads make api calls through one InstrumentedRequest, like the dispatcher and outbound workers.
+
+usage: python -m benchmarks.bench_bot_request [threads] [calls per thread] [server delay in ms]
+"""
+import sys
+import json
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from bot_request import InstrumentedRequest
+
+pool_sizes = (1, 2, 4, 8, 16, 32)
+
+
+class StandInBotApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.02
+    body = json.dumps({'ok': True, 'result': True}).encode()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length'] or 0))
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(url: str, pool_size: int, threads: int, calls: int) -> tuple[float, dict]:
+    """Returns the calls per second and the endpoint stats for one pool size"""
+    request = InstrumentedRequest(con_pool_size=pool_size)
+
+    def make_calls():
+        for _ in range(calls):
+            request.post(url, {'chat_id': 1, 'text': 'hi'})
+
+    workers = [threading.Thread(target=make_calls) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    request.stop()
+
+    return threads * calls / elapsed, request.endpoint_stats()['sendMessage']
+
+
+def main() -> None:
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    StandInBotApiHandler.delay = (float(sys.argv[3]) if len(sys.argv) > 3 else 20) / 1000
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInBotApiHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/bot123:token/sendMessage'
+
+    print(f'{threads} threads, {calls} calls each, {StandInBotApiHandler.delay * 1000:.0f}ms server delay')
+    for pool_size in pool_sizes:
+        throughput, stats = run(url, pool_size, threads, calls)
+        print(f'pool size {pool_size:>2}: {throughput:8.1f} calls/s, '
+              f'{stats["connects"]} connections opened, '
+              f'mean response {stats["response_seconds"] / stats["requests"] * 1000:.1f}ms')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
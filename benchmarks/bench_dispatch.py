@@ -0,0 +1,55 @@
+"""
+Measures how long it takes to find the handler for an update, with registry.CommandDispatcher
+and with every handler added to the dispatcher in turn, the way they were registered before
+
+usage: python -m benchmarks.bench_dispatch [iterations]
+"""
+import sys
+import datetime as dt
+import time
+
+from unittest import mock
+
+from telegram import Update, Message, Chat, User, MessageEntity
+
+import registry
+
+bot = mock.Mock(username='gfhelper_bot')
+
+
+def make_update(text: str) -> Update:
+    entities = []
+    if text.startswith('/'):
+        entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text.split(' ')[0]))]
+    message = Message(message_id=1, date=dt.datetime.now(), chat=Chat(id=1, type='private'), text=text,
+                      from_user=User(id=1, first_name='test', is_bot=False), entities=entities, bot=bot)
+    return Update(update_id=1, message=message)
+
+
+def linear_match(handlers: list, update: Update):
+    for handler in handlers:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            return handler, check
+    return None
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    commands = registry.CommandRegistry('commands')
+    handlers = [handler for command in commands.all() for handler in command.handlers]
+    dispatcher = registry.CommandDispatcher(commands)
+
+    for text in ('/timezone', '/start', '/sleep 7a', '930a', '/unknown'):
+        update = make_update(text)
+        for label, match in (('linear', lambda: linear_match(handlers, update)),
+                             ('registry', lambda: dispatcher.check_update(update))):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                match()
+            elapsed = time.perf_counter() - start
+            print(f'{text:<12} {label:<10} {elapsed / iterations * 1e6:7.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Microbenchmarks of the utils parsers and the /sleep and /est calculators
+
+Every benchmark runs one function over a generated corpus, valid and invalid inputs across all
+1440 minutes of the day, and reports calls per second of the fastest pass over the corpus and
+the peak number of bytes allocated during a call, measured with tracemalloc. The lru caches of
+the functions are cleared before each pass over a corpus, so the numbers are for uncached calls.
+
+Results can be saved as a baseline and later runs compared against it. A benchmark regresses
+when its calls per second drop, or its allocated bytes grow, by more than the threshold, and
+the comparison exits with status 1 if any benchmark regressed.
+
+usage: python -m benchmarks.bench_hot_paths [--min-time SECONDS] [--filter SUBSTRING]
+                                            [--save FILE] [--compare FILE] [--threshold FRACTION]
+"""
+import argparse
+import datetime as dt
+import json
+import sys
+import time
+import tracemalloc
+
+from typing import Callable, NamedTuple
+
+import utils
+from commands import est, sleep
+
+MINUTES_PER_DAY = 24 * 60
+now = dt.datetime(2022, 1, 1, 4, 0, tzinfo=utils.UTC)
+
+
+class Benchmark(NamedTuple):
+    name: str
+    func: Callable
+    corpus: list
+
+
+class Result(NamedTuple):
+    ops_per_sec: float
+    bytes_per_call: float
+
+
+def clock_texts() -> list[str]:
+    """Every minute of the day in the formats users send, e.g. 930a and 0930 p"""
+    texts = []
+    for minute in range(MINUTES_PER_DAY):
+        hour, minute = divmod(minute, 60)
+        raw_hour = hour % 12 or 12
+        period = 'a' if hour < 12 else 'p'
+        texts.append(f'{raw_hour}{minute:02d}{period}')
+        texts.append(f'{raw_hour:02d}{minute:02d} {period}')
+    return texts
+
+
+def invalid_clock_texts() -> list[str]:
+    """Clock times that match the input format but are not times, e.g. 1360a and 1375p"""
+    return [f'{hour}{minute:02d}{period}' for hour in (0, 13, 19) for minute in range(60, 100)
+            for period in 'ap']
+
+
+def duration_texts() -> list[str]:
+    return [f'{amount}{unit}' for amount in range(0, 1000) for unit in 'hm']
+
+
+def hm_texts() -> list[str]:
+    return [f'{hours}h {minutes}m' for hours in range(0, 25) for minutes in range(0, 61)]
+
+
+def day_minutes() -> list[dt.datetime]:
+    return [now + dt.timedelta(minutes=minute) for minute in range(MINUTES_PER_DAY)]
+
+
+def ignore_errors(func: Callable) -> Callable:
+    def call(arg):
+        try:
+            func(arg)
+        except ValueError:
+            pass
+    return call
+
+
+def clear_caches() -> None:
+    utils.parse_input.cache_clear()
+    sleep.sleep_now_text_for_minute.cache_clear()
+    sleep.sleep_wake_text_for_minutes.cache_clear()
+
+
+def make_benchmarks() -> list[Benchmark]:
+    # (now, wake time) pairs
+    wake_times = [(minute, minute + dt.timedelta(hours=9)) for minute in day_minutes()]
+    sleep_times = [(sleep.get_sleeptimes_from_wake(wake_time, now), wake_time) for _, wake_time in wake_times]
+    reach_times = day_minutes()
+    travel = dt.timedelta(minutes=-45)
+    ready = dt.timedelta(hours=-1)
+
+    return [
+        Benchmark('utils.parse_input', utils.parse_input,
+                  clock_texts() + duration_texts() + hm_texts() + ['maybe 10 minutes?'] * 100),
+        Benchmark('utils.process_hhmm_time', ignore_errors(lambda txt: utils.process_hhmm_time(txt, now=now)),
+                  clock_texts()),
+        Benchmark('utils.process_hhmm_time (invalid)',
+                  ignore_errors(lambda txt: utils.process_hhmm_time(txt, now=now)), invalid_clock_texts()),
+        Benchmark('utils.process_h_or_m_time', ignore_errors(utils.process_h_or_m_time), duration_texts()),
+        Benchmark('utils.process_hm_time', ignore_errors(utils.process_hm_time), hm_texts()),
+        Benchmark('sleep.get_sleeptimes_from_wake',
+                  lambda args: sleep.get_sleeptimes_from_wake(args[1], args[0]), wake_times),
+        Benchmark('sleep.sleep_time_arr_to_str',
+                  lambda args: sleep.sleep_time_arr_to_str(args[0]), sleep_times),
+        Benchmark('sleep.process_sleep_times_text',
+                  lambda args: sleep.process_sleep_times_text(*args, utils.DEFAULT_TIMEZONE), sleep_times),
+        Benchmark('sleep.build_sleep_now_text', sleep.build_sleep_now_text, day_minutes()),
+        Benchmark('est.reach_text', est.reach_text, reach_times),
+        Benchmark('est.leave_text', lambda reach_time: est.leave_text(reach_time, travel), reach_times),
+        Benchmark('est.ready_text', lambda reach_time: est.ready_text(reach_time, travel, ready), reach_times),
+    ]
+
+
+def measure(benchmark: Benchmark, min_time: float) -> Result:
+    """
+    Runs passes over the corpus for at least `min_time` seconds and keeps the fastest pass, which
+    is the least disturbed by the rest of the machine, then measures the allocations of one pass
+    """
+    func, corpus = benchmark.func, benchmark.corpus
+    fastest = float('inf')
+    elapsed = 0.0
+    while elapsed < min_time:
+        clear_caches()
+        start = time.perf_counter()
+        for arg in corpus:
+            func(arg)
+        duration = time.perf_counter() - start
+        fastest = min(fastest, duration)
+        elapsed += duration
+
+    clear_caches()
+    peak_bytes = 0
+    tracemalloc.start()
+    for arg in corpus:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        func(arg)
+        peak_bytes += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return Result(len(corpus) / fastest, peak_bytes / len(corpus))
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Returns the names of the benchmarks that regressed against the baseline"""
+    regressed = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = Result(**baseline[name])
+        if (result.ops_per_sec < old.ops_per_sec * (1 - threshold)
+                or result.bytes_per_call > old.bytes_per_call * (1 + threshold) + 1):
+            regressed.append(name)
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the parsers and calculators')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds to run each benchmark for')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--save', help='file to save the results to as a baseline')
+    parser.add_argument('--compare', help='baseline file to compare the results against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fraction a benchmark may get worse by before it counts as a regression')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    for benchmark in make_benchmarks():
+        if args.filter not in benchmark.name:
+            continue
+        result = results[benchmark.name] = measure(benchmark, args.min_time)
+        line = f'{benchmark.name:<36} {result.ops_per_sec:>12,.0f} ops/s {result.bytes_per_call:>8,.0f} B/call'
+        if benchmark.name in baseline:
+            old = Result(**baseline[benchmark.name])
+            line += f'  {result.ops_per_sec / old.ops_per_sec - 1:+7.1%} ops/s'
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({name: result._asdict() for name, result in results.items()}, f, indent=2)
+
+    if args.compare:
+        regressed = compare(results, baseline, args.threshold)
+        for name in regressed:
+            print(f'REGRESSION: {name}')
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares routing a message in the EST_TRAVEL state through the old stacked Filters.regex chain
+against the single pass `common.InputFilter`
+
+Each message is routed to either the travel handler or the catch-all handler, and messages that
+reach the travel handler are turned into a timedelta the way the handler does it.
+
+usage: python -m benchmarks.bench_input_classifier [number of messages]
+"""
+import sys
+import random
+import time
+import datetime
+
+from telegram import Update, Message, Chat, User
+from telegram.ext import Filters
+
+import common
+import utils
+
+old_travel_filter = Filters.regex(common.h_or_m_regex) | Filters.regex(common.h_m_regex)
+old_except_filter = (~Filters.command) & Filters.regex('.*')
+new_travel_filter = common.InputFilter(utils.DURATION)
+new_except_filter = (~Filters.command) & Filters.text
+
+
+def make_corpus(size: int) -> list[Update]:
+    """Generates distinct duration, time and free text messages"""
+    rng = random.Random(0)
+    user = User(id=1, first_name='bench', is_bot=False)
+    chat = Chat(id=1, type='private')
+    date = datetime.datetime.now()
+    texts = []
+    for i in range(size):
+        choice = i % 4
+        if choice == 0:
+            texts.append(f'{rng.randint(0, 23)}h {rng.randint(0, 59)}m')
+        elif choice == 1:
+            texts.append(f'{rng.randint(1, 999)}{rng.choice("hm")}')
+        elif choice == 2:
+            texts.append(f'{rng.randint(1, 12)}{rng.randint(0, 59):02d}{rng.choice("ap")}')
+        else:
+            texts.append(f'maybe around {rng.randint(1, 99)} minutes?')
+    return [
+        Update(i, message=Message(i, date, chat=chat, from_user=user, text=text))
+        for i, text in enumerate(texts)
+    ]
+
+
+def old_chain(update: Update) -> None:
+    if old_travel_filter(update):
+        txt = update.message.text
+        try:
+            if 'h' in txt and 'm' in txt:
+                utils.process_hm_time(txt)
+            else:
+                utils.process_h_or_m_time(txt)
+        except ValueError:
+            pass
+    else:
+        old_except_filter(update)
+
+
+def new_classifier(update: Update) -> None:
+    if new_travel_filter(update):
+        try:
+            utils.parsed_to_timedelta(utils.parse_input(update.message.text))
+        except ValueError:
+            pass
+    else:
+        new_except_filter(update)
+
+
+def bench(func, corpus: list[Update]) -> float:
+    """Returns the mean time per message in microseconds"""
+    utils.parse_input.cache_clear()
+    start = time.perf_counter()
+    for update in corpus:
+        func(update)
+    return (time.perf_counter() - start) / len(corpus) * 1e6
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    corpus = make_corpus(size)
+    old = bench(old_chain, corpus)
+    new = bench(new_classifier, corpus)
+    print(f'messages: {size}')
+    print(f'stacked Filters.regex chain: {old:.2f} us/message')
+    print(f'single pass classifier: {new:.2f} us/message')
+    print(f'speedup: {old / new:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+"""
+Load tests the bot offline, with recorded traffic or with virtual users going through /est and /sleep
+
+The updater is built by main.build_updater, like in production, and updates are queued to the
+workers of a webhook.WebhookServer, which hand them to the dispatcher the way run_webhook does.
+Every Bot API call the bot makes goes to a stand-in for the Bot API in this process, which
+answers like telegram after a fixed delay and notes when each reply arrives.
+
+Virtual users go through conversations one message at a time, each sending its next message
+once all the replies to the previous one arrived, so the bot is as busy as the users can keep
+it. Recorded traffic, see traffic.TrafficRecorder, is sent at the pace it was recorded times
+--speed, or as fast as the bot takes it with --speed 0.
+
+The latency of an update is the time from queueing it to the stand-in receiving the bot's last
+reply to it. The replies to recorded updates are not known in advance, so for them it is the
+time to the first reply to the update's chat. Reported are the updates handled per second, over
+the whole run and the median of its seconds, the latency percentiles and the memory the process
+gained. Telegram's flood limits are lifted by default, so the bot's own throughput is measured,
+pass --outbound-rate 30 to measure it behind them.
+
+usage: python -m benchmarks.bench_load [--users N] [--conversations N] [--replay FILE] [--speed X]
+                                       [--api-delay MS] [--outbound-rate N] [--timeout SECONDS]
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import queue
+import random
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import datetime as dt
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable
+
+import traffic
+import utils
+import webhook
+
+# a token in the format telegram uses, nothing is sent to telegram
+API_KEY = '1234567890:ABCDEFGHIJKLMNOPQRSTUVWXYZNOWIKNOWMYABC'
+BOT_USER = {'id': 1234567890, 'is_bot': True, 'first_name': 'gfhelper', 'username': 'gfhelper_bot'}
+
+
+class StandInBotApi:
+    """
+    Answers the Bot API calls of the bot like telegram, after `delay` seconds
+
+    `on_reply` is called with the chat id, or the inline query id, of every message sent and
+    inline query answered, when the call arrives.
+    """
+
+    def __init__(self, delay: float, on_reply: Callable[[object], None] = lambda key: None):
+        self.delay = delay
+        self.on_reply = on_reply
+        self.calls = collections.Counter()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_request_handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, args=(0.1,), name='StandInBotApi', daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_address[1]}/bot'
+
+    def result(self, method: str, payload: dict) -> object:
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'sendMessage':
+            chat_id = int(payload['chat_id'])
+            self.on_reply(chat_id)
+            return {'message_id': 1, 'date': int(time.time()), 'text': payload.get('text', ''),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER}
+        if method == 'answerInlineQuery':
+            self.on_reply(payload['inline_query_id'])
+        return True
+
+    def _make_request_handler(self) -> type:
+        api = self
+
+        class StandInRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length'] or 0))
+                method = self.path.rsplit('/', 1)[-1]
+                api.calls[method] += 1
+                time.sleep(api.delay)
+                response = json.dumps({'ok': True, 'result': api.result(method, json.loads(body or b'{}'))}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        return StandInRequestHandler
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+class LoadStats:
+    """The latencies of the updates that were answered and when they were answered"""
+
+    def __init__(self):
+        self.latencies = []
+        self.answered = []
+        self.sent = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def record(self, sent: float) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            self.latencies.append(now - sent)
+            self.answered.append(now)
+
+
+class Injector:
+    """Queues updates to the webhook server's workers from one thread, waiting while their queues are full"""
+
+    def __init__(self, enqueue: Callable[[dict], bool], stats: LoadStats):
+        self.enqueue = enqueue
+        self.stats = stats
+        self._updates = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='Injector', daemon=True)
+        self._thread.start()
+
+    def send(self, data: dict, on_sent: Callable[[float], None]) -> None:
+        self._updates.put((data, on_sent))
+
+    def _run(self) -> None:
+        for data, on_sent in iter(self._updates.get, None):
+            on_sent(time.perf_counter())
+            while not self.enqueue(data):
+                # what telegram is told with a 503
+                self.stats.rejected += 1
+                time.sleep(0.001)
+            self.stats.sent += 1
+
+    def stop(self) -> None:
+        self._updates.put(None)
+        self._thread.join()
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    entities = []
+    if text.startswith('/'):
+        entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split(' ')[0])}]
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'text': text, 'entities': entities,
+        'chat': {'id': user_id, 'type': 'private'}, 'from': {'id': user_id, 'first_name': 'user', 'is_bot': False}}}
+
+
+def conversations(time_text: str) -> list[list[tuple[str, int]]]:
+    """The conversations of the virtual users, as the messages they send and the number of replies to each"""
+    return [
+        [('/est', 1), (time_text, 1), ('45m', 1), ('30m', 2)],
+        [('/est', 1), (time_text, 1), ('1h 15m', 1), ('/skip', 1)],
+        [('/sleep', 1), ('Sleep Now', 1)],
+        [('/sleep', 1), ('Wake Time', 1), (time_text, 1)],
+        [('/sleep 7a', 1)],
+    ]
+
+
+def far_time_text(now: dt.datetime) -> str:
+    """A time like 930p half a day from now, so that the reminders /est arms are not due during the run"""
+    later = now + dt.timedelta(hours=12)
+    return f'{later.hour % 12 or 12}{later.minute:02d}{"a" if later.hour < 12 else "p"}'
+
+
+class VirtualUsers:
+    """Users that each go through `count` random conversations, sending a message once the last is answered"""
+
+    def __init__(self, users: int, count: int, injector: Injector, stats: LoadStats, time_text: str):
+        self.injector = injector
+        self.stats = stats
+        self.conversations = conversations(time_text)
+        self.done = threading.Event()
+        self._update_ids = iter(range(1, 1 << 62))
+        self._lock = threading.Lock()
+        # user id -> [messages left, replies left to the last message, conversations left, when it was sent]
+        self._users = {user_id: [[], 0, count, 0.0] for user_id in range(1, users + 1)}
+        self._active = users
+
+    def start(self) -> None:
+        for user_id in list(self._users):
+            with self._lock:
+                self._send_next(user_id)
+
+    def _set_sent(self, user_id: int, sent: float) -> None:
+        self._users[user_id][3] = sent
+
+    def _send_next(self, user_id: int) -> None:
+        state = self._users[user_id]
+        if not state[0]:
+            if state[2] == 0:
+                self._active -= 1
+                if self._active == 0:
+                    self.done.set()
+                return
+            state[2] -= 1
+            state[0] = list(random.choice(self.conversations))
+        text, state[1] = state[0].pop(0)
+        data = message_update(next(self._update_ids), user_id, text)
+        self.injector.send(data, lambda sent: self._set_sent(user_id, sent))
+
+    def on_reply(self, chat_id: int) -> None:
+        with self._lock:
+            state = self._users.get(chat_id)
+            if state is None or state[1] == 0:
+                return
+            state[1] -= 1
+            if state[1] == 0:
+                self.stats.record(state[3])
+                self._send_next(chat_id)
+
+
+class Replay:
+    """Sends recorded updates at the pace they were recorded, times `speed`, or as fast as possible if it is 0"""
+
+    def __init__(self, filename: str, speed: float, injector: Injector, stats: LoadStats):
+        self.filename = filename
+        self.speed = speed
+        self.injector = injector
+        self.stats = stats
+        self.done = threading.Event()
+        # chat or inline query id -> when its updates that were not answered yet were sent
+        self._pending = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self._last_reply = time.monotonic()
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name='Replay', daemon=True).start()
+
+    def _run(self) -> None:
+        start = time.perf_counter()
+        first = None
+        sent = 0
+        for received, data in traffic.read_traffic(self.filename):
+            first = received if first is None else first
+            if self.speed:
+                time.sleep(max(0.0, start + (received - first) / self.speed - time.perf_counter()))
+            inline_query = data.get('inline_query')
+            key = inline_query['id'] if inline_query else webhook.update_chat_id(data)
+            self.injector.send(data, lambda queued, key=key: self._set_sent(key, queued))
+            sent += 1
+
+        # updates that get no reply are given up on once the bot has gone quiet
+        self._last_reply = time.monotonic()
+        while self.stats.sent < sent or time.monotonic() - self._last_reply < 2:
+            time.sleep(0.1)
+        self.done.set()
+
+    def _set_sent(self, key: object, sent: float) -> None:
+        with self._lock:
+            self._pending[key].append(sent)
+
+    def on_reply(self, key: object) -> None:
+        self._last_reply = time.monotonic()
+        with self._lock:
+            pending = self._pending.get(key)
+            if not pending:
+                return
+            sent = pending.popleft()
+        self.stats.record(sent)
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # the peak, on platforms without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: list[float], p: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def report(stats: LoadStats, start: float, rss: list[int], user_data_bytes: int, calls: dict) -> None:
+    elapsed = (stats.answered[-1] if stats.answered else time.perf_counter()) - start
+    per_second = collections.Counter(int(answered - start) for answered in stats.answered)
+    # the last second is cut short by the end of the run
+    full_seconds = [per_second[second] for second in range(int(elapsed))]
+    latencies = sorted(stats.latencies)
+
+    print(f'{stats.sent} updates sent, {len(latencies)} answered in {elapsed:.1f}s, '
+          f'{stats.rejected} times a full queue was waited for')
+    print(f'throughput: {len(latencies) / elapsed:.1f} updates/s overall, '
+          f'{statistics.median(full_seconds) if full_seconds else 0:.1f} updates/s in the median second')
+    if latencies:
+        print('latency: ' + ', '.join(f'p{p} {percentile(latencies, p) * 1000:.1f}ms' for p in (50, 90, 99)) +
+              f', max {latencies[-1] * 1000:.1f}ms')
+    print(f'memory: {rss[0] / 2 ** 20:.1f}MiB before, {rss[-1] / 2 ** 20:.1f}MiB after, peak {max(rss) / 2 ** 20:.1f}MiB, '
+          f'grew {(rss[-1] - rss[0]) / 2 ** 20:+.1f}MiB, user_data {user_data_bytes / 2 ** 20:.2f}MiB')
+    print('api calls: ' + ', '.join(f'{method} {count}' for method, count in sorted(calls.items())))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000, help='virtual users')
+    parser.add_argument('--conversations', type=int, default=3, help='conversations each virtual user goes through')
+    parser.add_argument('--replay', help='traffic recorded by traffic.TrafficRecorder, sent instead of virtual users')
+    parser.add_argument('--speed', type=float, default=1.0, help='pace of the replay, 0 for as fast as possible')
+    parser.add_argument('--api-delay', type=float, default=20, help="milliseconds the Bot API's stand-in takes to answer")
+    parser.add_argument('--outbound-rate', type=float, default=1e6, help='messages sent per second, and per chat')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds after which the run is cut short')
+    args = parser.parse_args()
+
+    stats = LoadStats()
+    api = StandInBotApi(args.api_delay / 1000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # main reads its settings when it is imported
+        os.environ.update(API_KEY=API_KEY, DEV='', BOT_API_URL=api.url,
+                          PERSISTENCE_FILE=os.path.join(directory, 'load.sqlite3'),
+                          OUTBOUND_RATE=str(args.outbound_rate), OUTBOUND_CHAT_RATE=str(args.outbound_rate))
+        os.environ.pop('TRAFFIC_RECORD_FILE', None)
+        import main as bot_main
+        logging.getLogger().setLevel(logging.WARNING)
+
+        updater = bot_main.build_updater()
+        bot_main.start_dispatcher(updater)
+        updater.job_queue.start()
+        dispatcher, bot = updater.dispatcher, updater.bot
+
+        def process_update(data: dict) -> None:
+            dispatcher.process_update(bot_main.Update.de_json(data, bot))
+
+        server = webhook.WebhookServer('127.0.0.1', 0, API_KEY, process_update,
+                                       queue_size=bot_main.WEBHOOK_QUEUE_SIZE, workers=bot_main.WEBHOOK_WORKERS)
+        server.start()
+        injector = Injector(server.enqueue, stats)
+        if args.replay:
+            load = Replay(args.replay, args.speed, injector, stats)
+            print(f'replaying {args.replay} at {args.speed or "full"} speed')
+        else:
+            load = VirtualUsers(args.users, args.conversations, injector, stats,
+                                far_time_text(utils.get_datetime_local_now()))
+            print(f'{args.users} virtual users, {args.conversations} conversations each')
+        api.on_reply = load.on_reply
+        print(f'{args.api_delay:.0f}ms Bot API delay, {args.outbound_rate:g} messages/s outbound rate')
+
+        rss = [rss_bytes()]
+        start = time.perf_counter()
+        load.start()
+        deadline = time.monotonic() + args.timeout
+        while not load.done.wait(0.5) and time.monotonic() < deadline:
+            rss.append(rss_bytes())
+        rss.append(rss_bytes())
+        if not load.done.is_set():
+            print(f'cut short after {args.timeout:.0f}s')
+
+        injector.stop()
+        server.stop()
+        user_data_bytes = updater.persistence.user_data_bytes
+        bot_main.stop_updater(updater)
+        api.stop()
+
+    report(stats, start, rss, user_data_bytes, api.calls)
+
+
+if __name__ == '__main__':
+    main()
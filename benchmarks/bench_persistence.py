@@ -0,0 +1,54 @@
+"""
+Measures the latency that SqlitePersistence adds to every handled update
+
+Simulates the persistence calls the dispatcher makes after an /est step (one conversation state
+and one user_data write) and reports the per-update latency of the handler hot path.
+
+usage: python -m benchmarks.bench_persistence [number of updates]
+"""
+import sys
+import datetime as dt
+import tempfile
+import time
+import os
+import statistics
+
+from persistence import SqlitePersistence
+
+
+def run(updates: int) -> list[float]:
+    """Returns the latency in microseconds of each simulated update"""
+    reach_time = dt.datetime.now(dt.timezone.utc)
+    latencies = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        persistence = SqlitePersistence(os.path.join(tmp_dir, 'bench.sqlite3'))
+        for i in range(updates):
+            user_id = i % 1000
+            start = time.perf_counter()
+            persistence.update_conversation('est', (user_id, user_id), i % 3)
+            persistence.update_user_data(user_id, {
+                'reach_time': reach_time,
+                'travel_timedelta': dt.timedelta(minutes=-(i % 120 + 1))
+            })
+            latencies.append((time.perf_counter() - start) * 1e6)
+
+        start = time.perf_counter()
+        persistence.flush()
+        flush_ms = (time.perf_counter() - start) * 1e3
+
+    print(f'final flush: {flush_ms:.1f} ms')
+    return latencies
+
+
+def main() -> None:
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    latencies = sorted(run(updates))
+    print(f'updates: {updates}')
+    print(f'mean: {statistics.fmean(latencies):.1f} us')
+    print(f'p50: {latencies[len(latencies) // 2]:.1f} us')
+    print(f'p99: {latencies[int(len(latencies) * 0.99)]:.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Measures scheduling, cancelling, firing and reloading a large number of pending reminders
+
+usage: python -m benchmarks.bench_reminders [number of reminders]
+"""
+import sys
+import datetime as dt
+import os
+import random
+import tempfile
+import time
+
+from clock import FrozenClock
+from reminders import ReminderScheduler
+
+
+def timed(label: str, count: int, func) -> object:
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<32} {elapsed:7.3f}s {elapsed / count * 1e6:7.2f} us each')
+    return result
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    rng = random.Random(0)
+    clock = FrozenClock(dt.datetime(2022, 1, 1, tzinfo=dt.timezone.utc))
+    now = clock.now()
+    dues = [now + dt.timedelta(seconds=rng.randrange(24 * 60 * 60)) for _ in range(size)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'reminders.sqlite3')
+        scheduler = ReminderScheduler(filename, fire=None, clock=clock)
+
+        ids = timed(f'schedule {size}', size,
+                    lambda: [scheduler.schedule(due, i, 'leave') for i, due in enumerate(dues)])
+        timed(f'cancel {size // 2}', size // 2, lambda: [scheduler.cancel(i) for i in ids[::2]])
+        timed('write to disk', size, scheduler.write_pending)
+        scheduler.stop()
+
+        scheduler = timed('load', size // 2, lambda: ReminderScheduler(filename, fire=None, clock=clock))
+        clock.advance(dt.timedelta(hours=1))
+        due = timed('pop the first hour', size // 48, scheduler.pop_due)
+        print(f'{len(due)} reminders due in the first hour, {len(scheduler)} still pending')
+        scheduler.stop()
+
+
+if __name__ == '__main__':
+    main()
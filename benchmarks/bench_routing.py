@@ -0,0 +1,147 @@
+"""
+Measures loading a city-sized transit network and routing on it
+
+The feed is made up: a grid of bus stops, bus lines that wander across it in both directions and
+rail lines straight across the city, with trips all day long.
+
+usage: python -m benchmarks.bench_routing [grid side] [bus lines] [queries]
+"""
+import csv
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import datetime as dt
+
+import routing
+
+# a corner of the made up city, near Singapore, and the metres between neighbouring stops
+origin_lat, origin_lon = 1.30, 103.75
+spacing = 300
+# seconds
+bus_hop, rail_hop = 75, 120
+bus_headway, rail_headway = 12 * 60, 5 * 60
+first_departure, last_departure = 6 * 60 * 60, 24 * 60 * 60
+
+
+def timed(label: str, func) -> object:
+    start = time.perf_counter()
+    result = func()
+    print(f'{label:<32} {time.perf_counter() - start:8.3f}s')
+    return result
+
+
+def gtfs_time(seconds: int) -> str:
+    return f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+def wander_bus_line(rng: random.Random, side: int, line_length: int) -> list[str]:
+    """Returns the stop ids of a bus line that wanders across the grid from a random stop, never stopping twice"""
+    row, column = rng.randrange(side), rng.randrange(side)
+    direction = rng.choice(((0, 1), (1, 0), (0, -1), (-1, 0)))
+    stops = [(row, column)]
+    attempts = 0
+    # lines that wander into a corner they can not get out of end there
+    while len(stops) < line_length and attempts < 20:
+        if rng.random() < 0.2:
+            direction = rng.choice(((0, 1), (1, 0), (0, -1), (-1, 0)))
+        row, column = row + direction[0], column + direction[1]
+        if not (0 <= row < side and 0 <= column < side) or (row, column) in stops:
+            row, column = stops[-1]
+            direction = rng.choice(((0, 1), (1, 0), (0, -1), (-1, 0)))
+            attempts += 1
+            continue
+        stops.append((row, column))
+    return [f'{row}-{column}' for row, column in stops]
+
+
+def write_city_feed(directory: str, side: int, bus_lines: int, line_length: int = 40, rail_lines: int = 4,
+                    seed: int = 0) -> int:
+    """Writes the feed of a made up city with side * side bus stops, returns the number of stop times"""
+    rng = random.Random(seed)
+    lat_step = spacing / routing.METRES_PER_DEGREE
+    lon_step = lat_step
+
+    with open(os.path.join(directory, 'stops.txt'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon'])
+        for row in range(side):
+            for column in range(side):
+                writer.writerow([f'{row}-{column}', f'{row * side + column:05d}', f'Street {row} / Avenue {column}',
+                                 f'{origin_lat + row * lat_step:.6f}', f'{origin_lon + column * lon_step:.6f}'])
+        for line in range(rail_lines):
+            for station in range(side // 4):
+                track = line * side // rail_lines
+                row, column = (station * 4, track) if line % 2 else (track, station * 4)
+                writer.writerow([f'R{line}-{station}', '', f'Rail {line} Station {station}',
+                                 f'{origin_lat + row * lat_step + 0.0005:.6f}', f'{origin_lon + column * lon_step:.6f}'])
+
+    lines = [(f'B{line}', wander_bus_line(rng, side, line_length), bus_hop, bus_headway) for line in range(bus_lines)]
+    for line in range(rail_lines):
+        lines.append((f'R{line}', [f'R{line}-{station}' for station in range(side // 4)], rail_hop, rail_headway))
+
+    stop_times = 0
+    with open(os.path.join(directory, 'trips.txt'), 'w', newline='') as trips_file, \
+            open(os.path.join(directory, 'stop_times.txt'), 'w', newline='') as stop_times_file:
+        trips = csv.writer(trips_file)
+        trips.writerow(['route_id', 'service_id', 'trip_id'])
+        times = csv.writer(stop_times_file)
+        times.writerow(['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'])
+        for route_id, stop_ids, hop, headway in lines:
+            for direction, sequence in (('a', stop_ids), ('b', stop_ids[::-1])):
+                for departure in range(first_departure, last_departure, headway):
+                    trip_id = f'{route_id}{direction}{departure}'
+                    trips.writerow([route_id, 'weekday', trip_id])
+                    for i, stop_id in enumerate(sequence):
+                        times.writerow([trip_id, gtfs_time(departure + i * hop), gtfs_time(departure + i * hop),
+                                        stop_id, i + 1])
+                    stop_times += len(sequence)
+    return stop_times
+
+
+def main() -> None:
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 70
+    bus_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    query_count = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        stop_times = timed('write the feed', lambda: write_city_feed(directory, side, bus_lines))
+        index_file = os.path.join(directory, 'routes.index')
+        planner = routing.RoutePlanner(directory, index_file=index_file)
+        timed(f'load {stop_times} stop times', planner.load)
+        network = planner.network
+        print(f'{len(network.stops)} stops, {len(network.forward.patterns)} patterns, '
+              f'{sum(map(len, network.forward.footpaths))} footpaths, index {os.path.getsize(index_file) >> 20}MB')
+        planner = routing.RoutePlanner(directory, index_file=index_file)
+        timed('load the saved index', planner.load)
+
+        stop_count = side * side
+        day = dt.date(2022, 1, 3)
+        active = planner.active_services(day)
+        queries = [(rng.randrange(stop_count), rng.randrange(stop_count), rng.randrange(7 * 3600, 22 * 3600))
+                   for _ in range(query_count)]
+        for label, timetable, sign in (('leave at', network.forward, 1), ('reach by', network.backward, -1)):
+            durations = []
+            for source, target, seconds in queries:
+                start = time.perf_counter()
+                timetable.earliest_arrival({source: sign * seconds}, (target,), active)
+                durations.append(time.perf_counter() - start)
+            durations.sort()
+            print(f'{query_count} {label} queries: median {statistics.median(durations) * 1000:.2f}ms, '
+                  f'p99 {durations[int(query_count * 0.99) - 1] * 1000:.2f}ms, max {durations[-1] * 1000:.2f}ms')
+
+        reach = dt.datetime(2022, 1, 3, 1, 30, tzinfo=dt.timezone.utc)
+        names = [(network.stops[source].name, network.stops[target].name) for source, target, _ in queries[:100]]
+
+        def reach_by_names():
+            return [planner.reach_by(origin, destination, reach) for origin, destination in names]
+
+        timed('100 reach by queries by name', reach_by_names)
+        timed('100 cached queries by name', reach_by_names)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Measures how long the bot takes to start, from importing main to routing its first update
+
+Each run starts a fresh interpreter, imports main, builds the updater and routes a /help update
+through the dispatcher's handlers, with the command modules imported lazily and eagerly. The
+fastest of the runs is reported for each mode, followed by the import time of every top level
+package main imports, measured with `python -X importtime`.
+
+The comparison exits with status 1 if starting with lazily imported commands takes longer than
+the budget.
+
+usage: python -m benchmarks.bench_startup [--runs N] [--top N] [--budget SECONDS]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from collections import defaultdict
+
+# a token in the format telegram uses, nothing is sent to the Bot API
+API_KEY = '1234567890:ABCDEFGHIJKLMNOPQRSTUVWXYZNOWIKNOWMYABC'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+child_code = '''
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+updater = main.build_updater()
+built = time.perf_counter()
+# what get_me would return, so that checking commands does not call the Bot API
+updater.bot._bot = main.telegram.User(1, "gfhelper_bot", True, username="gfhelper_bot")
+update = main.Update.de_json({"update_id": 1, "message": {
+    "message_id": 1, "date": 0, "text": "/help", "chat": {"id": 1, "type": "private"},
+    "from": {"id": 1, "first_name": "test", "is_bot": False},
+    "entities": [{"type": "bot_command", "offset": 0, "length": 5}]}}, updater.bot)
+for handler in updater.dispatcher.handlers[0]:
+    if handler.check_update(update):
+        break
+routed = time.perf_counter()
+main.stop_updater(updater)
+print(json.dumps({"import": imported - start, "build": built - imported, "route": routed - built}))
+'''
+
+
+def child_env(directory: str, lazy_commands: bool) -> dict:
+    return dict(os.environ, API_KEY=API_KEY, DEV='', LAZY_COMMANDS='1' if lazy_commands else '0',
+                PERSISTENCE_FILE=os.path.join(directory, 'startup.sqlite3'))
+
+
+def measure_startup(lazy_commands: bool, runs: int) -> dict:
+    """Returns the fastest time of each startup phase over `runs` fresh interpreters"""
+    fastest = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-c', child_code], cwd=ROOT, check=True, capture_output=True,
+                                    text=True, env=child_env(directory, lazy_commands)).stdout
+            for phase, seconds in json.loads(output.splitlines()[-1]).items():
+                fastest[phase] = min(fastest.get(phase, seconds), seconds)
+    return fastest
+
+
+def import_times() -> dict:
+    """Returns the seconds spent importing each top level package when main is imported"""
+    with tempfile.TemporaryDirectory() as directory:
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=ROOT, check=True,
+                                capture_output=True, text=True, env=child_env(directory, True)).stderr
+
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        totals[name.strip().split('.')[0]] += int(own) / 1e6
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Startup time of the bot')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to start in each mode')
+    parser.add_argument('--top', type=int, default=15, help='number of packages to list import times for')
+    parser.add_argument('--budget', type=float, help='seconds a lazy startup may take')
+    args = parser.parse_args()
+
+    lazy_total = 0.0
+    for lazy_commands in (True, False):
+        phases = measure_startup(lazy_commands, args.runs)
+        total = sum(phases.values())
+        if lazy_commands:
+            lazy_total = total
+        print(f'{"lazy" if lazy_commands else "eager"} commands: ' +
+              ' '.join(f'{phase}={seconds * 1000:.1f}ms' for phase, seconds in phases.items()) +
+              f' total={total * 1000:.1f}ms')
+
+    print()
+    totals = import_times()
+    for name, seconds in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'{name:<32} {seconds * 1000:8.1f}ms')
+    print(f'{"all imports":<32} {sum(totals.values()) * 1000:8.1f}ms')
+
+    if args.budget is not None and lazy_total > args.budget:
+        print(f'OVER BUDGET: {lazy_total:.3f}s > {args.budget:.3f}s')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures update throughput with different numbers of worker processes
+
+Every update does a fixed amount of CPU bound work, building /sleep replies without the reply
+tables, so throughput is limited by the GIL in a single process and should grow with the number
+of worker processes up to the number of cores.
+
+usage: python -m benchmarks.bench_supervisor [updates] [replies built per update] [max processes]
+"""
+import sys
+import datetime as dt
+import functools
+import multiprocessing
+import os
+import time
+
+import utils
+from commands import sleep
+from supervisor import Supervisor
+
+
+def build_replies(done, replies: int, index: int, processes: int, update_queue) -> None:
+    for data in iter(update_queue.get, None):
+        now = dt.datetime(2022, 1, 1, tzinfo=utils.UTC) + dt.timedelta(minutes=data['update_id'])
+        for i in range(replies):
+            sleep.build_sleep_now_text(now + dt.timedelta(seconds=i))
+        done.put(data['update_id'])
+
+
+def run(processes: int, updates: int, replies: int) -> float:
+    """Returns the updates handled per second with `processes` worker processes"""
+    done = multiprocessing.get_context('spawn').Queue()
+    supervisor = Supervisor(functools.partial(build_replies, done, replies), processes)
+    supervisor.start()
+    # let the workers finish starting up before timing
+    supervisor.dispatch({'update_id': 0, 'message': {'chat': {'id': 0}}})
+    done.get()
+
+    start = time.perf_counter()
+    for update_id in range(1, updates + 1):
+        supervisor.dispatch({'update_id': update_id, 'message': {'chat': {'id': update_id}}})
+    for _ in range(updates):
+        done.get()
+    elapsed = time.perf_counter() - start
+
+    supervisor.stop()
+    return updates / elapsed
+
+
+def main() -> None:
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    replies = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    max_processes = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    print(f'{updates} updates, {replies} replies built per update, {os.cpu_count()} cores')
+    baseline = None
+    processes = 1
+    while processes <= max_processes:
+        throughput = run(processes, updates, replies)
+        baseline = baseline or throughput
+        print(f'{processes:>2} processes: {throughput:8.1f} updates/s ({throughput / baseline:.2f}x)')
+        processes *= 2
+
+
+if __name__ == '__main__':
+    main()
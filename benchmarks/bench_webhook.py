@@ -0,0 +1,68 @@
+"""
+Measures how quickly the webhook server acknowledges updates while handlers are slow
+
+Client threads post updates of different chats like telegram does, and every update takes a
+fixed time to handle. The acknowledgement latency stays flat because handling happens behind
+the queue, until the queue fills up and updates are answered with 503.
+
+usage: python -m benchmarks.bench_webhook [client threads] [updates per thread] [handler delay in ms] [queue size]
+"""
+import sys
+import json
+import threading
+import time
+
+from http.client import HTTPConnection
+
+from webhook import WebhookServer
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def main() -> None:
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    delay = (float(sys.argv[3]) if len(sys.argv) > 3 else 5) / 1000
+    queue_size = int(sys.argv[4]) if len(sys.argv) > 4 else 1000
+
+    server = WebhookServer('127.0.0.1', 0, 'token', lambda data: time.sleep(delay), queue_size=queue_size)
+    server.start()
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+
+    def post_updates(thread: int) -> None:
+        connection = HTTPConnection('127.0.0.1', server.port)
+        for i in range(updates):
+            body = json.dumps({'update_id': thread * updates + i,
+                               'message': {'chat': {'id': thread * updates + i}, 'text': 'hi'}})
+            start = time.perf_counter()
+            connection.request('POST', '/token', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(response.status)
+        connection.close()
+
+    clients = [threading.Thread(target=post_updates, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+    server.stop()
+
+    latencies.sort()
+    print(f'{threads} clients, {updates} updates each, {delay * 1000:.0f}ms handler delay, queue size {queue_size}')
+    print(f'{len(latencies) / elapsed:.0f} updates/s acknowledged, '
+          f'p50 {percentile(latencies, 0.5) * 1000:.2f}ms, p99 {percentile(latencies, 0.99) * 1000:.2f}ms, '
+          f'{statuses.count(503)} answered with 503')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+import logging
+import socket
+import threading
+import time
+
+from telegram.error import NetworkError, TimedOut
+from telegram.utils.request import Request
+import telegram.vendor.ptb_urllib3.urllib3 as urllib3
+from telegram.vendor.ptb_urllib3.urllib3 import connectionpool
+from telegram.vendor.ptb_urllib3.urllib3.exceptions import (
+    ConnectTimeoutError,
+    NewConnectionError,
+    ProtocolError,
+)
+
+logger = logging.getLogger(__name__)
+
+# connection timings of the api call the current thread is making
+_connect_timings = threading.local()
+
+# errors raised before telegram could have received the request, so retrying cannot send twice
+retryable_causes = (ConnectTimeoutError, NewConnectionError)
+# errors raised when a connection breaks after the request may have reached telegram, retried only
+# for the api methods that are safe to call twice, like 502 Bad Gateway answers
+idempotent_causes = (ProtocolError,)
+idempotent_methods = frozenset({'getUpdates', 'getMe', 'getChat', 'getWebhookInfo', 'setWebhook', 'deleteWebhook'})
+
+
+class TimedHTTPConnection(connectionpool.HTTPConnectionPool.ConnectionCls):
+    """HTTPConnection that records how long it takes to open"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _record_connect(time.perf_counter() - start, 0.0)
+
+
+class TimedHTTPSConnection(connectionpool.HTTPSConnectionPool.ConnectionCls):
+    """HTTPSConnection that records how long the TCP connection and the TLS handshake take"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        conn = super()._new_conn()
+        self._tcp_seconds = time.perf_counter() - start
+        return conn
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        total = time.perf_counter() - start
+        tcp_seconds = getattr(self, '_tcp_seconds', total)
+        _record_connect(tcp_seconds, total - tcp_seconds)
+
+
+class TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def _record_connect(connect_seconds: float, tls_seconds: float) -> None:
+    _connect_timings.connects = getattr(_connect_timings, 'connects', 0) + 1
+    _connect_timings.connect_seconds = getattr(_connect_timings, 'connect_seconds', 0.0) + connect_seconds
+    _connect_timings.tls_seconds = getattr(_connect_timings, 'tls_seconds', 0.0) + tls_seconds
+
+
+class EndpointStats:
+    """Totals of the api calls made to one Bot API endpoint, e.g. sendMessage"""
+
+    __slots__ = ('requests', 'errors', 'retries', 'connects',
+                 'connect_seconds', 'tls_seconds', 'response_seconds', 'max_response_seconds')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.tls_seconds = 0.0
+        self.response_seconds = 0.0
+        self.max_response_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class InstrumentedRequest(Request):
+    """
+    Request with a tunable connection pool, a retry policy and timings per Bot API endpoint
+
+    Parameters
+    ----------
+    con_pool_size
+        number of connections kept open to telegram, this should be at least the number of
+        threads making api calls
+    connect_timeout
+        seconds to wait for a connection to open
+    read_timeout
+        seconds to wait for telegram's response
+    max_retries
+        number of times an api call is retried when its connection fails before the request was
+        sent, calls that may have reached telegram are only retried for methods that are safe to
+        call twice, e.g. getUpdates
+    retry_backoff
+        seconds to wait before the first retry, doubled for each retry after it
+    keepalive_idle
+        seconds an idle connection waits before sending TCP keep-alive probes
+    pool_block
+        whether threads wait for a pooled connection instead of opening extra connections that
+        are thrown away after one call when the pool is full
+    """
+
+    __slots__ = ('max_retries', 'retry_backoff', '_endpoint_stats', '_stats_lock')
+
+    def __init__(self, con_pool_size: int = 1, connect_timeout: float = 5.0, read_timeout: float = 5.0,
+                 max_retries: int = 2, retry_backoff: float = 0.5, keepalive_idle: int = 120,
+                 pool_block: bool = True, **kwargs):
+        super().__init__(con_pool_size=con_pool_size, connect_timeout=connect_timeout,
+                         read_timeout=read_timeout, **kwargs)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._endpoint_stats = {}
+        self._stats_lock = threading.Lock()
+
+        if isinstance(self._con_pool, urllib3.PoolManager):
+            self._con_pool.pool_classes_by_scheme = {
+                'http': TimedHTTPConnectionPool,
+                'https': TimedHTTPSConnectionPool,
+            }
+            pool_kw = self._con_pool.connection_pool_kw
+            pool_kw['block'] = pool_block
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                pool_kw['socket_options'] = [
+                    (level, option, keepalive_idle if option == socket.TCP_KEEPIDLE else value)
+                    for level, option, value in pool_kw['socket_options']
+                ]
+
+    def _request_wrapper(self, *args, **kwargs) -> bytes:
+        endpoint = str(args[1]).rsplit('/', 1)[-1] if len(args) > 1 else 'unknown'
+        _connect_timings.connects = 0
+        _connect_timings.connect_seconds = 0.0
+        _connect_timings.tls_seconds = 0.0
+        retries = 0
+        error = False
+        start = time.perf_counter()
+
+        try:
+            while True:
+                try:
+                    return super()._request_wrapper(*args, **kwargs)
+                except (NetworkError, TimedOut) as err:
+                    if retries >= self.max_retries or not self._is_retryable(err, endpoint):
+                        raise
+                    logger.warning('Retrying %s after %s', endpoint, err)
+                    time.sleep(self.retry_backoff * 2 ** retries)
+                    retries += 1
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._record(endpoint, time.perf_counter() - start, retries, error)
+
+    @staticmethod
+    def _is_retryable(err: Exception, endpoint: str) -> bool:
+        idempotent = endpoint in idempotent_methods
+        causes = retryable_causes + idempotent_causes if idempotent else retryable_causes
+        cause = err.__cause__
+        while cause is not None:
+            if isinstance(cause, causes):
+                return True
+            cause = getattr(cause, 'reason', None) or cause.__cause__
+        # telegram's frontend may answer 502 after the request reached the Bot API
+        return idempotent and str(err) == 'Bad Gateway'
+
+    def _record(self, endpoint: str, response_seconds: float, retries: int, error: bool) -> None:
+        with self._stats_lock:
+            stats = self._endpoint_stats.get(endpoint)
+            if stats is None:
+                stats = self._endpoint_stats[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.errors += error
+            stats.retries += retries
+            stats.connects += _connect_timings.connects
+            stats.connect_seconds += _connect_timings.connect_seconds
+            stats.tls_seconds += _connect_timings.tls_seconds
+            stats.response_seconds += response_seconds
+            stats.max_response_seconds = max(stats.max_response_seconds, response_seconds)
+
+    def endpoint_stats(self) -> dict:
+        """Returns the totals of the api calls made so far, per endpoint"""
+        with self._stats_lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self._endpoint_stats.items()}
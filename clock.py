@@ -0,0 +1,36 @@
+import datetime as dt
+
+
+class Clock:
+    """Reads the current time as an 'aware' datetime object in UTC"""
+
+    def now(self) -> dt.datetime:
+        return dt.datetime.now(dt.timezone.utc)
+
+
+class FrozenClock(Clock):
+    """
+    Clock that always reads the time it was set to, for tests and simulations
+
+    Examples
+    --------
+    >>> clock = FrozenClock(datetime(2022, 1, 1, 9, 0, tzinfo=timezone.utc))
+    >>> clock.advance(timedelta(minutes=30))
+    >>> clock.now()
+    datetime(2022, 1, 1, 9, 30, tzinfo=timezone.utc)
+    """
+
+    def __init__(self, now: dt.datetime):
+        self._now = now
+
+    def now(self) -> dt.datetime:
+        return self._now
+
+    def set(self, now: dt.datetime) -> None:
+        self._now = now
+
+    def advance(self, delta: dt.timedelta) -> None:
+        self._now += delta
+
+
+system_clock = Clock()
@@ -1,4 +1,7 @@
 import common
+import registry
+import routing
+import templates
 import utils
 import datetime as dt
 
@@ -13,6 +16,191 @@ from telegram.ext import (
 
 EST_REACH, EST_TRAVEL, EST_READY = range(3)
 
+reminder_armed_txt = "I'll send you a reminder when it's time!\n"
+
+# what the conversation keeps in user_data between its steps
+conversation_keys = ('est',)
+# kept by earlier versions, read once when a conversation started before an upgrade goes on
+legacy_keys = ('reach_time', 'travel_timedelta')
+
+
+class EstState(common.ConversationState):
+    """what the conversation keeps between its steps, the times as whole minutes"""
+
+    __slots__ = ('reach_minute', 'travel_minutes')
+
+    @property
+    def reach_time(self) -> dt.datetime:
+        return utils.from_epoch_minutes(self.reach_minute)
+
+    @reach_time.setter
+    def reach_time(self, reach_time: dt.datetime) -> None:
+        self.reach_minute = utils.to_epoch_minutes(reach_time)
+
+    @property
+    def travel_timedelta(self) -> dt.timedelta:
+        return dt.timedelta(minutes=self.travel_minutes)
+
+    @travel_timedelta.setter
+    def travel_timedelta(self, travel_timedelta: dt.timedelta) -> None:
+        self.travel_minutes = int(travel_timedelta.total_seconds()) // 60
+
+
+def est_state(context: CallbackContext) -> EstState:
+    """returns the user's conversation state, creating it on the first step"""
+    state = context.user_data.get('est')
+    if state is None:
+        state = context.user_data['est'] = EstState()
+        legacy = {key: context.user_data.pop(key) for key in legacy_keys if key in context.user_data}
+        for key, value in legacy.items():
+            setattr(state, key, value)
+    return state
+
+
+reach_template = templates.Template(
+    common.hedgehog +
+    "So you have to reach at {reach:time}\n\n"
+    "How long do you think you will take to get there?\n"
+    "(e.g. 1h or 1h 30m or 15m)"
+)
+ready_prompt_source = (
+    "\n\n"
+    "How long do you think you will need to get ready?\n"
+    "(e.g. 1h or 1h 30m or 15m)\n\n"
+    "send /skip if you wish to skip this step"
+)
+leave_time_source = (
+    common.hedgehog +
+    "You will need to leave the house at __{leave:time}\n__"
+    "to reach on time at {reach:time}"
+)
+leave_time_template = templates.Template(leave_time_source)
+leave_template = templates.Template(leave_time_source + ready_prompt_source)
+route_leave_template = templates.Template(
+    common.hedgehog +
+    "It takes {minutes} min to get from {origin} to {destination} by public transport\n"
+    "so you will need to leave at __{leave:time}\n__"
+    "to reach on time at {reach:time}" +
+    ready_prompt_source
+)
+ready_template = templates.Template(
+    common.hedgehog +
+    "You will need to start to get ready by __{ready:time}\n__"
+    "and leave the house at __{leave:time}\n__"
+    "to reach on time at {reach:time}"
+)
+# reminders are sent as plain text
+leave_reminder_template = templates.Template(
+    common.hedgehog +
+    "It's time to leave the house!\n"
+    "to reach on time at {reach:time}",
+    parse_mode=None
+)
+ready_reminder_template = templates.Template(
+    common.hedgehog +
+    "It's time to start getting ready!\n"
+    "you will need to leave the house at {leave:time}",
+    parse_mode=None
+)
+
+
+def reach_text(reach_time: dt.datetime, tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """builds the reply confirming the time to reach and asking for the travel time"""
+    return reach_template.render(reach=utils.convert_utc_to_local(reach_time, tz_name))
+
+
+def leave_time_text(reach_time: dt.datetime, travel_timedelta: dt.timedelta,
+                    tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """builds the reply with the time to leave"""
+    return leave_time_template.render(
+        leave=utils.convert_utc_to_local(reach_time + travel_timedelta, tz_name),
+        reach=utils.convert_utc_to_local(reach_time, tz_name)
+    )
+
+
+def leave_text(reach_time: dt.datetime, travel_timedelta: dt.timedelta,
+               tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """builds the reply with the time to leave and asking for the time needed to get ready"""
+    return leave_template.render(
+        leave=utils.convert_utc_to_local(reach_time + travel_timedelta, tz_name),
+        reach=utils.convert_utc_to_local(reach_time, tz_name)
+    )
+
+
+def route_leave_text(reach_time: dt.datetime, found: routing.Route, tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """builds the reply with the time to leave for a route and asking for the time needed to get ready"""
+    return route_leave_template.render(
+        minutes=found.minutes, origin=found.origin, destination=found.destination,
+        leave=utils.convert_utc_to_local(found.departure, tz_name),
+        reach=utils.convert_utc_to_local(reach_time, tz_name)
+    )
+
+
+def ready_text(reach_time: dt.datetime, travel_timedelta: dt.timedelta, ready_timedelta: dt.timedelta,
+               tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """builds the reply with the time to start getting ready and the time to leave"""
+    time_to_leave = reach_time + travel_timedelta
+    return ready_template.render(
+        ready=utils.convert_utc_to_local(time_to_leave + ready_timedelta, tz_name),
+        leave=utils.convert_utc_to_local(time_to_leave, tz_name),
+        reach=utils.convert_utc_to_local(reach_time, tz_name)
+    )
+
+
+def parse_args(args: list[str], utc_now: dt.datetime,
+               tz_name: str = utils.DEFAULT_TIMEZONE) -> tuple[dt.datetime, list[dt.timedelta]]:
+    """
+    parses arguments like 930a 45m 30m into the time to reach, the travel time and optionally the
+    time needed to get ready
+
+    Raises
+    ------
+    ValueError
+        If the arguments are not a time followed by one or two durations, or one of them is invalid
+    """
+    reach_time_raw, rest = utils.time_from_args(args)
+    reach_time = utils.parsed_to_datetime(reach_time_raw, tz_name, utc_now)
+    deltas = utils.durations_from_args(rest)
+    if not 1 <= len(deltas) <= 2:
+        raise ValueError('send the time to reach, your travel time and then your time to get ready '
+                         'if you need any (e.g. 930a 45m 30m)')
+    return reach_time, deltas
+
+
+def args_text(args: list[str], utc_now: dt.datetime, tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """builds the final reply from arguments like 930a 45m 30m, see `parse_args`"""
+    reach_time, deltas = parse_args(args, utc_now, tz_name)
+    if len(deltas) == 1:
+        return leave_time_text(reach_time, deltas[0], tz_name)
+    return ready_text(reach_time, deltas[0], deltas[1], tz_name)
+
+
+def arm_reminders(update: Update, context: CallbackContext, reminders: list[tuple[dt.datetime, str]]) -> bool:
+    """
+    replaces the user's pending /est reminders with reminders at the given times, returns whether
+    any reminder was armed
+    """
+    scheduler = context.reminders
+    if scheduler is None:
+        return False
+
+    for reminder_id in context.user_data.pop('reminders', ()):
+        scheduler.cancel(reminder_id)
+    context.user_data['reminders'] = [
+        scheduler.schedule(due, update.effective_chat.id, text)
+        for due, text in reminders if due > context.now
+    ]
+    return bool(context.user_data['reminders'])
+
+
+def leave_reminder_text(reach_time: dt.datetime, tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    return leave_reminder_template.render(reach=utils.convert_utc_to_local(reach_time, tz_name))
+
+
+def ready_reminder_text(reach_time: dt.datetime, time_to_leave: dt.datetime,
+                        tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    return ready_reminder_template.render(leave=utils.convert_utc_to_local(time_to_leave, tz_name))
+
 
 def est(update: Update, context: CallbackContext) -> int:
     """starts the conversation to estimate the time to start getting ready"""
@@ -27,22 +215,43 @@ def est(update: Update, context: CallbackContext) -> int:
     return EST_REACH
 
 
+def est_args(update: Update, context: CallbackContext) -> None:
+    """replies with the time to leave for /est 930a 45m 30m straight away, without a conversation"""
+    tz_name = utils.get_user_timezone(context.user_data)
+    try:
+        reach_time, deltas = parse_args(context.args, context.now, tz_name)
+    except ValueError as err:
+        update.message.reply_text(utils.time_input_err_to_str(err.args[0]))
+        return
+
+    time_to_leave = reach_time + deltas[0]
+    reminders = [(time_to_leave, leave_reminder_text(reach_time, tz_name))]
+    if len(deltas) == 1:
+        text = leave_time_text(reach_time, deltas[0], tz_name)
+    else:
+        text = ready_text(reach_time, deltas[0], deltas[1], tz_name)
+        reminders.insert(0, (time_to_leave + deltas[1], ready_reminder_text(reach_time, time_to_leave, tz_name)))
+    update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN_V2)
+
+    if arm_reminders(update, context, reminders):
+        update.message.reply_text(common.hedgehog + reminder_armed_txt)
+
+
+def est_cancel(update: Update, context: CallbackContext) -> int:
+    """cancels the conversation and forgets what the user sent so far"""
+    common.clear_user_data(context, conversation_keys + legacy_keys)
+    return common.convo_cancel(update, context)
+
+
 def est_reach(update: Update, context: CallbackContext) -> int:
     """processes the time to reach and prompts the user for the time needed to reach"""
-    reach_time = update.message.text
+    tz_name = utils.get_user_timezone(context.user_data)
+    reach_time = utils.parse_input(update.message.text)
 
     try:
-        time = utils.process_hhmm_time(reach_time)
-        sgt_time = utils.convert_utc_to_sgt(time)
-        context.user_data['reach_time'] = time
-        update.message.reply_text(
-            common.hedgehog +
-            "So you have to reach at "
-            f"{sgt_time.strftime(common.time_format)}\n\n"
-            "How long do you think you will take to get there?\n"
-            "\(e\.g\. 1h or 1h 30m or 15m\)",
-            parse_mode=ParseMode.MARKDOWN_V2
-        )
+        time = utils.parsed_to_datetime(reach_time, tz_name, context.now)
+        est_state(context).reach_time = time
+        update.message.reply_text(reach_text(time, tz_name), parse_mode=ParseMode.MARKDOWN_V2)
 
         return EST_TRAVEL
 
@@ -57,31 +266,43 @@ def est_travel(update: Update, context: CallbackContext) -> int:
     """
     Processes the travel time and prompts the user for the time need to get ready or
     whether the user wishes to skip this step"""
-    travel_time = update.message.text
+    tz_name = utils.get_user_timezone(context.user_data)
+    travel_time = utils.parse_input(update.message.text)
     try:
-        if 'h' in travel_time and 'm' in travel_time:
-            delta = utils.process_hm_time(travel_time)
-        else:
-            delta = utils.process_h_or_m_time(travel_time)
+        delta = utils.parsed_to_timedelta(travel_time)
 
-        context.user_data['travel_timedelta'] = delta
+        state = est_state(context)
+        state.travel_timedelta = delta
 
-        reach_time = context.user_data['reach_time']
+        update.message.reply_text(
+            leave_text(state.reach_time, delta, tz_name),
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
 
-        time_to_leave = reach_time + delta
+        return EST_READY
 
-        sgt_reach_time = utils.convert_utc_to_sgt(reach_time)
-        sgt_time_to_leave = utils.convert_utc_to_sgt(time_to_leave)
+    except ValueError as err:
+        update.message.reply_text(
+            utils.time_input_err_to_str(err.args[0])
+        )
+        return EST_TRAVEL
+
+
+def est_travel_route(update: Update, context: CallbackContext) -> int:
+    """
+    processes a route like Bishan to Raffles Place as the travel time, the time to leave is the
+    latest departure by public transport that reaches on time"""
+    planner = context.routes
+    tz_name = utils.get_user_timezone(context.user_data)
+    try:
+        state = est_state(context)
+        reach_time = state.reach_time
+        origin, destination = planner.parse_route(update.message.text)
+        found = planner.reach_by(origin, destination, reach_time)
+        state.travel_timedelta = found.departure - reach_time
 
         update.message.reply_text(
-            common.hedgehog +
-            "You will need to leave the house at "
-            + utils.underline_str(f"{sgt_time_to_leave.strftime(common.time_format)}\n") +
-            "to reach on time at "
-            f"{sgt_reach_time.strftime(common.time_format)}\n\n"
-            "How long do you think you will need to get ready?\n"
-            "\(e\.g\. 1h or 1h 30m or 15m\)\n\n"
-            "send /skip if you wish to skip this step",
+            route_leave_text(reach_time, found, tz_name),
             parse_mode=ParseMode.MARKDOWN_V2
         )
 
@@ -89,15 +310,23 @@ def est_travel(update: Update, context: CallbackContext) -> int:
 
     except ValueError as err:
         update.message.reply_text(
-            utils.time_input_err_to_str(err.args[0])
+            utils.route_input_err_to_str(err.args[0])
         )
         return EST_TRAVEL
 
 
 def est_skip_ready(update: Update, context: CallbackContext) -> int:
     """gives the user the time to leave"""
+    tz_name = utils.get_user_timezone(context.user_data)
+    state = est_state(context)
+    reach_time = state.reach_time
+    time_to_leave = reach_time + state.travel_timedelta
+    armed = arm_reminders(update, context, [(time_to_leave, leave_reminder_text(reach_time, tz_name))])
+    common.clear_user_data(context, conversation_keys)
+
     update.message.reply_text(
         common.hedgehog +
+        (reminder_armed_txt if armed else '') +
         'How else might i /help you?'
     )
 
@@ -106,33 +335,27 @@ def est_skip_ready(update: Update, context: CallbackContext) -> int:
 
 def est_ready(update: Update, context: CallbackContext) -> int:
     """processes the time to get ready and outputs the time to get ready and time to leave"""
-    ready_time = update.message.text
+    tz_name = utils.get_user_timezone(context.user_data)
+    ready_time = utils.parse_input(update.message.text)
     try:
-        if 'h' in ready_time and 'm' in ready_time:
-            delta = utils.process_hm_time(ready_time)
-        else:
-            delta = utils.process_h_or_m_time(ready_time)
-
-        reach_time = context.user_data['reach_time']
-        time_to_leave = reach_time + context.user_data['travel_timedelta']
-        time_to_ready = time_to_leave + delta
-
-        sgt_reach_time = utils.convert_utc_to_sgt(reach_time)
-        sgt_time_to_leave = utils.convert_utc_to_sgt(time_to_leave)
-        sgt_time_to_ready = utils.convert_utc_to_sgt(time_to_ready)
+        delta = utils.parsed_to_timedelta(ready_time)
 
+        state = est_state(context)
+        reach_time = state.reach_time
+        time_to_leave = reach_time + state.travel_timedelta
         update.message.reply_text(
-            common.hedgehog +
-            "You will need to start to get ready by "
-            + utils.underline_str(f"{sgt_time_to_ready.time().strftime(common.time_format)}\n") +
-            f"and leave the house at "
-            + utils.underline_str(f"{sgt_time_to_leave.time().strftime(common.time_format)}\n") +
-            f"to reach on time at "
-            f"{sgt_reach_time.strftime(common.time_format)}", parse_mode=ParseMode.MARKDOWN_V2
+            ready_text(reach_time, state.travel_timedelta, delta, tz_name),
+            parse_mode=ParseMode.MARKDOWN_V2
         )
 
+        armed = arm_reminders(update, context, [
+            (time_to_leave + delta, ready_reminder_text(reach_time, time_to_leave, tz_name)),
+            (time_to_leave, leave_reminder_text(reach_time, tz_name)),
+        ])
+        common.clear_user_data(context, conversation_keys)
         update.message.reply_text(
             common.hedgehog +
+            (reminder_armed_txt if armed else '') +
             f'How else might i /help you?'
         )
 
@@ -145,27 +368,51 @@ def est_ready(update: Update, context: CallbackContext) -> int:
         return EST_READY
 
 
+# /est with arguments is answered without entering the conversation
+est_args_handler = CommandHandler('est', est_args, filters=common.command_args_filter, run_async=True)
+
 convo_except_handler = MessageHandler(
-    (~Filters.command) & Filters.regex('.*'), common.convo_except)
+    (~Filters.command) & Filters.text, common.convo_except)
 
-est_convo_handler = ConversationHandler(
+est_convo_handler = common.ConcurrentConversationHandler(
     entry_points=[CommandHandler('est', est)],
     states={
         EST_REACH: [
-            MessageHandler(Filters.regex(common.hhmm_regex), est_reach),
+            MessageHandler(common.InputFilter(utils.TIME), est_reach),
             convo_except_handler
         ],
         EST_TRAVEL: [
-            MessageHandler(Filters.regex(common.h_or_m_regex) |
-                           Filters.regex(common.h_m_regex), est_travel),
+            MessageHandler(common.InputFilter(utils.DURATION), est_travel),
+            MessageHandler(common.RoutesFilter() & (~Filters.command) & Filters.regex(routing.route_regex),
+                           est_travel_route),
             convo_except_handler
         ],
         EST_READY: [
-            MessageHandler(Filters.regex(common.h_or_m_regex) |
-                           Filters.regex(common.h_m_regex), est_ready),
+            MessageHandler(common.InputFilter(utils.DURATION), est_ready),
             convo_except_handler,
             CommandHandler('skip', est_skip_ready)
         ]
     },
-    fallbacks=[CommandHandler('cancel', common.convo_cancel)]
+    fallbacks=[CommandHandler('cancel', est_cancel)],
+    name='est',
+    persistent=True
+)
+
+command = registry.Command(
+    name='est',
+    description='estimate what time you need to leave ⏱️',
+    help=(
+        common.hedgehog +
+        "Estimates the time to start getting ready\n"
+        "and the time to leave your house to\n"
+        "reach your destination on time\n\n"
+        "or answers straight away with\n"
+        "/est <time to reach> <travel time> <time to get ready>\n"
+        "(e.g. /est 930a 1h 15m 30m)\n\n"
+        "send <from> to <to> as the travel time to\n"
+        "plan it by public transport with /route"
+    ),
+    # before the conversation, so that one-shot commands never create conversation state
+    handlers=[est_args_handler, est_convo_handler],
+    user_data_keys=conversation_keys + legacy_keys
 )
@@ -1,50 +1,54 @@
 import common
+import functools
+import registry
 from telegram import Update, ParseMode, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     CallbackContext,
     CommandHandler,
 )
 
-help_default_txt = (
-    common.hedgehog +
-    "Here's how i can help you!\n\n"
-    "/sleep: Calculate sleep and wake up times 💤\n"
-    "/est: estimate what time you need to leave ⏱️\n"
-    "/help: HELP! 🦮\n\n"
+help_header_txt = common.hedgehog + "Here's how i can help you!\n\n"
+
+help_footer_txt = (
+    "\nType my @username and sleep 700a or est 930p 45m 30m in any chat for a quick answer ⚡\n\n"
     "Use /help <command name> for more information!"
 )
 
-command_mapping = {
-    "est": (
-        common.hedgehog +
-        "Estimates the time to start getting ready\n"
-        "and the time to leave your house to\n"
-        "reach your destination on time"
-    ),
-    "sleep": (
-        common.hedgehog +
-        "Calculates what time you should wake up at\n"
-        "or sleep by using the 90 minute rule\n"
-        "to help you feel less groggy when you wake up!"
-    )
-}
-
 invalid_command_txt = (
     common.hedgehog +
     "Sorry, I did not understand that command :("
 )
 
 
+@functools.lru_cache(maxsize=1)
+def help_default_txt() -> str:
+    """builds the list of commands from the descriptions they declare"""
+    lines = [f"/{command.name}: {command.description}\n"
+             for command in registry.bot_commands.all() if command.description]
+    return help_header_txt + ''.join(lines) + help_footer_txt
+
+
+def command_help_txt(name: str) -> str:
+    """returns the help text a command declares, or `invalid_command_txt`"""
+    command = registry.bot_commands.get(name) if name else None
+    if command is None or command.help is None:
+        return invalid_command_txt
+    return command.help
+
+
 def help(update: Update, context: CallbackContext):
     if not (context.args):
-        text = help_default_txt
+        text = help_default_txt()
     else:
-        help_text = (context.args)[0]
-        if help_text not in command_mapping:
-            text = invalid_command_txt
-        else:
-            text = command_mapping[help_text]
+        text = command_help_txt((context.args)[0])
     context.bot.send_message(chat_id=update.effective_chat.id, text=text)
 
 
-help_handler = CommandHandler('help', help)
+help_handler = CommandHandler('help', help, run_async=True)
+
+command = registry.Command(
+    name='help',
+    description='HELP! 🦮',
+    help=None,
+    handlers=[help_handler]
+)
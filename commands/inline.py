@@ -0,0 +1,88 @@
+import common
+import registry
+import utils
+import functools
+import datetime as dt
+
+from typing import NamedTuple
+from telegram import Update, ParseMode, InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import CallbackContext, InlineQueryHandler
+
+from commands import est, sleep
+
+inline_usage_txt = 'Try: sleep 700a or est 930p 45m 30m'
+# longest description telegram shows under a result's title
+max_description_length = 100
+
+
+class InlineAnswer(NamedTuple):
+    """The reply to an inline query, or the error message when `text` is None"""
+    title: str
+    description: str
+    text: str = None
+
+
+def plain_text(text: str) -> str:
+    """Strips the hedgehog and the MarkdownV2 formatting from a reply, for result descriptions"""
+    text = text.replace(common.hedgehog, '').replace('__', '').replace('\\', '')
+    return ' '.join(text.split())[:max_description_length]
+
+
+@functools.lru_cache(maxsize=4096)
+def inline_answer(query: str, tz_name: str, minute: dt.datetime) -> InlineAnswer:
+    """
+    Returns the answer to a normalized inline query like 'sleep 700a' or 'est 930p 45m 30m'
+
+    Answers only depend on the query, the timezone and the current minute, so they are cached
+    and every user asking the same thing in the same minute shares one calculation.
+    """
+    command, *args = query.split(' ')
+    try:
+        if command == 'sleep':
+            text = sleep.args_text(args, minute, tz_name)
+            title = 'If you sleep now' if not args or args == ['now'] else 'When to sleep'
+        elif command == 'est':
+            text = est.args_text(args, minute, tz_name)
+            title = 'When to get ready and leave'
+        else:
+            return InlineAnswer(inline_usage_txt, inline_usage_txt)
+    except ValueError as err:
+        return InlineAnswer(err.args[0], err.args[0])
+
+    return InlineAnswer(title, plain_text(text), text)
+
+
+def inline_query(update: Update, context: CallbackContext) -> None:
+    """answers inline queries like @bot sleep 700a with the final reply in one round trip"""
+    query = ' '.join(update.inline_query.query.lower().lstrip('/').split())
+    tz_name = utils.get_user_timezone(context.user_data)
+    minute = context.now.replace(second=0, microsecond=0)
+    answer = inline_answer(query, tz_name, minute)
+    # telegram may show the same results until the minute changes
+    cache_time = 60 - context.now.second
+
+    if answer.text is None:
+        update.inline_query.answer(
+            [], cache_time=cache_time, is_personal=True,
+            switch_pm_text=answer.title[:64], switch_pm_parameter='inline')
+        return
+
+    result = InlineQueryResultArticle(
+        id='0',
+        title=answer.title,
+        description=answer.description,
+        input_message_content=InputTextMessageContent(answer.text, parse_mode=ParseMode.MARKDOWN_V2)
+    )
+    # results depend on the user's timezone, so telegram must not share them between users
+    update.inline_query.answer([result], cache_time=cache_time, is_personal=True)
+
+
+inline_handler = InlineQueryHandler(inline_query, run_async=True)
+
+# answers inline queries rather than a command, so it is not listed in /help
+command = registry.Command(
+    name='inline',
+    description=None,
+    help=None,
+    handlers=[inline_handler]
+)
@@ -0,0 +1,112 @@
+import common
+import registry
+import utils
+import planner
+
+from telegram import Update
+from telegram.ext import (
+    CallbackContext,
+    CommandHandler,
+)
+
+outing_usage_txt = (
+    common.hedgehog +
+    "Plan when everyone in this chat needs to get ready and leave!\n\n"
+    "/outing 930a: everyone needs to be there by 9:30 AM\n"
+    "/outing join 45m 30m: you need 45m to travel and 30m to get ready\n"
+    "/outing plan: show everyone's times"
+)
+
+no_outing_txt = (
+    common.hedgehog +
+    "There's no outing planned yet, start one with /outing 930a"
+)
+
+
+def outing_start(update: Update, context: CallbackContext, reach_time_raw: str) -> str:
+    """starts a new outing for the chat with the time everyone needs to arrive by"""
+    tz_name = utils.get_user_timezone(context.user_data)
+    parsed = utils.parse_input(reach_time_raw)
+    if parsed.kind != utils.TIME:
+        return outing_usage_txt
+
+    try:
+        reach_time = utils.parsed_to_datetime(parsed, tz_name, context.now)
+    except ValueError as err:
+        return utils.time_input_err_to_str(err.args[0])
+
+    context.chat_data['outing'] = {
+        'reach_time': reach_time,
+        'timezone': tz_name,
+        'members': {}
+    }
+    local_reach_time = utils.convert_utc_to_local(reach_time, tz_name)
+    return (
+        common.hedgehog +
+        f"Outing planned! Everyone needs to be there by {local_reach_time.strftime(common.time_format)}\n"
+        "Send /outing join <travel time> <time to get ready> to join\n"
+        "(e.g. /outing join 1h 15m 30m)"
+    )
+
+
+def outing_join(update: Update, context: CallbackContext, args: list[str]) -> str:
+    """adds the user to the chat's outing with their travel time and time to get ready"""
+    outing = context.chat_data.get('outing')
+    if outing is None:
+        return no_outing_txt
+
+    try:
+        deltas = utils.durations_from_args(args)
+        if not 1 <= len(deltas) <= 2:
+            raise ValueError('send your travel time, and then your time to get ready if you need any')
+    except ValueError as err:
+        return utils.time_input_err_to_str(err.args[0])
+
+    travel_minutes = -deltas[0] // planner.one_minute
+    ready_minutes = -deltas[1] // planner.one_minute if len(deltas) == 2 else 0
+    user = update.effective_user
+    outing['members'][user.id] = planner.Member(user.first_name, travel_minutes, ready_minutes)
+
+    return (
+        common.hedgehog +
+        f"Got it {user.first_name}! Send /outing plan to see everyone's times"
+    )
+
+
+def outing(update: Update, context: CallbackContext):
+    """plans an outing for everyone in the chat, see `outing_usage_txt`"""
+    args = context.args or []
+    chat_id = update.effective_chat.id
+
+    if not args:
+        texts = [outing_usage_txt]
+    elif args[0] == 'join':
+        texts = [outing_join(update, context, args[1:])]
+    elif args[0] == 'plan':
+        outing = context.chat_data.get('outing')
+        if outing is None or not outing['members']:
+            texts = [no_outing_txt if outing is None else
+                     common.hedgehog + "Nobody has joined yet, send /outing join 45m 30m to join"]
+        else:
+            texts = planner.outing_summary_texts(
+                outing['reach_time'], list(outing['members'].values()), outing['timezone'])
+    else:
+        texts = [outing_start(update, context, ' '.join(args))]
+
+    for text in texts:
+        context.bot.send_message(chat_id=chat_id, text=text)
+
+
+outing_handler = CommandHandler('outing', outing, run_async=True)
+
+command = registry.Command(
+    name='outing',
+    description='plan when everyone in a group needs to leave 👫',
+    help=(
+        common.hedgehog +
+        "Plans when everyone in a group chat needs\n"
+        "to get ready and leave to all arrive on time\n"
+        "send /outing to see how"
+    ),
+    handlers=[outing_handler]
+)
@@ -0,0 +1,64 @@
+import common
+import registry
+import templates
+import utils
+
+from telegram import Update, ParseMode
+from telegram.ext import (
+    CallbackContext,
+    CommandHandler,
+)
+
+route_usage_txt = (
+    "Send /route <from> to <to> to see when you will get there if you leave now\n"
+    "(e.g. /route Bishan to Raffles Place)"
+)
+route_disabled_txt = common.hedgehog + "Sorry, the route planner is not set up for this bot"
+
+route_template = templates.Template(
+    common.hedgehog +
+    "Leave {origin} now and you will reach {destination} at __{arrival:time}__\n"
+    "({minutes} min by public transport)"
+)
+
+
+def route(update: Update, context: CallbackContext) -> None:
+    """replies with the earliest time the user can reach the destination by public transport, leaving now"""
+    planner = context.routes
+    if planner is None:
+        update.message.reply_text(route_disabled_txt)
+        return
+    if not context.args:
+        update.message.reply_text(common.hedgehog + route_usage_txt)
+        return
+
+    tz_name = utils.get_user_timezone(context.user_data)
+    try:
+        origin, destination = planner.parse_route(' '.join(context.args))
+        found = planner.leave_at(origin, destination, context.now)
+    except ValueError as err:
+        update.message.reply_text(utils.route_input_err_to_str(err.args[0]))
+        return
+
+    update.message.reply_text(
+        route_template.render(origin=found.origin, destination=found.destination,
+                              arrival=utils.convert_utc_to_local(found.arrival, tz_name), minutes=found.minutes),
+        parse_mode=ParseMode.MARKDOWN_V2
+    )
+
+
+route_handler = CommandHandler('route', route, run_async=True)
+
+command = registry.Command(
+    name='route',
+    description='plan a trip by public transport 🚌',
+    help=(
+        common.hedgehog +
+        "Finds the quickest way by public transport\n"
+        "with /route <from> to <to>\n"
+        "(e.g. /route Bishan to Raffles Place)\n\n"
+        "send <from> to <to> as the travel time in /est\n"
+        "to leave in time for the right bus or train"
+    ),
+    handlers=[route_handler]
+)
@@ -1,6 +1,9 @@
 import common
+import registry
+import templates
 import utils
 import datetime as dt
+import functools
 
 from telegram import Update, ParseMode, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
@@ -18,28 +21,73 @@ sleep_cycle_length = 90
 
 fall_asleep_timedelta = dt.timedelta(minutes=fall_asleep_time_minutes)
 sleep_cycle_timedelta = dt.timedelta(minutes=sleep_cycle_length)
+nap_timedelta = dt.timedelta(minutes=20)
+# latest wake up time suggested by /sleep Sleep Now
+sleep_now_span = fall_asleep_timedelta + 6 * sleep_cycle_timedelta
+
+# replies are rendered on a timezone without DST starting from this date, and then reused for
+# every timezone whose UTC offset does not change during the period the reply covers
+reply_table_epoch = dt.datetime(2000, 1, 1, tzinfo=utils.UTC)
+
+choice_template = templates.Template(
+    common.hedgehog +
+    "Hi {first_name}!\n\n"
+    "Choose:\n"
+    "'*Sleep Now*' to see what time you should wake up\n"
+    "if you sleep now\n"
+    "or\n"
+    "'*Wake Time*' to see what time you should sleep to\n"
+    "wake up at a certain time\n\n"
+    "type /cancel anytime to cancel",
+    reply_markup=ReplyKeyboardMarkup(
+        [['Sleep Now', 'Wake Time']],
+        one_time_keyboard=True,
+        input_field_placeholder='Sleep now or Wake time?'
+    )
+)
+time_item_template = templates.Template("__{time:time}__")
+sleep_now_template = templates.Template(
+    common.hedgehog +
+    "If you sleep now at __{now:time}\n__"
+    "you should wake up at:\n"
+    "{wake_times!m}"
+)
+no_sleep_template = templates.Template(
+    common.hedgehog +
+    "Hmm, it seems like you don't have a lot of time\n"
+    "before you have to wake up at {wake:time}...\n"
+    "maybe a cup of coffee will help ☕"
+)
+nap_template = templates.Template(
+    common.hedgehog +
+    "It seem's you have a bit to time to nap!\n"
+    "before you have to wake up at {wake:time}\n"
+    "Sleep at __{sleep:time}__ for a power nap! 💪"
+)
+sleep_times_template = templates.Template(
+    common.hedgehog +
+    "You can sleep at the following times to feel rested!\n"
+    "{sleep_times!m}"
+)
+# the Sleep Now reply is looked up from a table, only the rest of its payload is cached
+sleep_now_kwargs = templates.reply_kwargs(ParseMode.MARKDOWN_V2, ReplyKeyboardRemove())
 
 
-def sleep_time_arr_to_str(utc_datetimes: list[dt.datetime]) -> str:
-    """converts a list of 'aware' datetime objects in UTC to a single string of datetime objects formatted in SGT
-     for output to the user"""
-
-    strs = []
-    for utc_datetime in utc_datetimes:
-        sgt_datetime = utils.convert_utc_to_sgt(utc_datetime)
-        strs.append(utils.underline_str(
-            f"{sgt_datetime.strftime(common.time_format)}"))
+def sleep_time_arr_to_str(utc_datetimes: list[dt.datetime], tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """converts a list of 'aware' datetime objects in UTC to a single string of datetime objects formatted in
+     the user's timezone for output to the user"""
 
-    return " or\n".join(strs)
+    return " or\n".join(time_item_template.render(time=utils.convert_utc_to_local(utc_datetime, tz_name))
+                        for utc_datetime in utc_datetimes)
 
 
-def get_sleeptimes_from_wake(wake_datetime: dt.datetime) -> list[dt.datetime]:
+def get_sleeptimes_from_wake(wake_datetime: dt.datetime, now: dt.datetime = None) -> list[dt.datetime]:
     """
     Calculates the times to sleep given a time to wake up
 
     Calculates the time(s) to sleep given a time to wake up. If the difference from current time to waketime
     is less than 10 minutes, the returned list will be empty as the difference is too short to nap.
-    Else if the difference from current time to the waketime is at least greater than 10 minutes, 
+    Else if the difference from current time to the waketime is at least greater than 10 minutes,
     the returned list will contain a nap time (maximum 20 minutes).
 
     Any time difference of more than 1 hour 40 minutes and 9 hours 40 minutes will append sleep times in 90
@@ -49,6 +97,8 @@ def get_sleeptimes_from_wake(wake_datetime: dt.datetime) -> list[dt.datetime]:
     ----------
     wake_datetime
         time at which the user wants to wake up in UTC time
+    now
+        the current time in UTC time, read from the clock if not given
 
     Returns
     -------
@@ -73,7 +123,8 @@ def get_sleeptimes_from_wake(wake_datetime: dt.datetime) -> list[dt.datetime]:
     datetime(hours=23, minutes=50)
     ]
     """
-    now = utils.get_datetime_utc_now()
+    if now is None:
+        now = utils.get_datetime_utc_now()
 
     time_difference = wake_datetime - now
     if time_difference.seconds < (10 * 60):
@@ -96,88 +147,133 @@ def get_sleeptimes_from_wake(wake_datetime: dt.datetime) -> list[dt.datetime]:
     return sleep_times
 
 
-def process_sleep_times_text(sleep_times: list[dt.datetime], wake_time: dt.datetime) -> str:
+def process_sleep_times_text(sleep_times: list[dt.datetime], wake_time: dt.datetime,
+                             tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
     """Returns a different dialogue depending on the number of sleep_times calculated"""
-    sgt_wake_time = utils.convert_utc_to_sgt(wake_time)
+    local_wake_time = utils.convert_utc_to_local(wake_time, tz_name)
 
     if not sleep_times:
-        return (
-            common.hedgehog +
-            "Hmm, it seems like you don\'t have a lot of time\n"
-            "before you have to wake up at "
-            f"{sgt_wake_time.strftime(common.time_format)}\.\.\.\n"
-            "maybe a cup of coffee will help ☕"
-        )
+        return no_sleep_template.render(wake=local_wake_time)
 
     if len(sleep_times) == 1:
-        sgt_sleep_time = utils.convert_utc_to_sgt(sleep_times[0])
-        return (
-            common.hedgehog +
-            "It seem's you have a bit to time to nap\!\n"
-            "before you have to wake up at "
-            f"{sgt_wake_time.strftime(common.time_format)}\n"
-            "Sleep at "
-            + utils.underline_str(f"{sgt_sleep_time.strftime(common.time_format)}") +
-            " for a power nap\! 💪"
-        )
+        return nap_template.render(wake=local_wake_time, sleep=utils.convert_utc_to_local(sleep_times[0], tz_name))
 
-    text = sleep_time_arr_to_str(sleep_times[::-1])
-    return (
-        common.hedgehog +
-        "You can sleep at the following times to feel rested\!\n"
-        + text
-    )
+    return sleep_times_template.render(sleep_times=sleep_time_arr_to_str(sleep_times[::-1], tz_name))
 
 
 def sleep(update: Update, context: CallbackContext) -> int:
     """starts the conversation to determine sleep or wakeup time"""
 
-    sleep_reply_keyboard = [['Sleep Now', 'Wake Time']]
-
-    update.message.reply_text(
-        common.hedgehog +
-        f"Hi {update.message.from_user.first_name}!\n\n"
-        "Choose:\n"
-        "'*Sleep Now*' to see what time you should wake up\n"
-        "if you sleep now\n"
-        "or\n"
-        "'*Wake Time*' to see what time you should sleep to\n"
-        "wake up at a certain time\n\n"
-        "type /cancel anytime to cancel",
-        reply_markup=ReplyKeyboardMarkup(
-            sleep_reply_keyboard,
-            one_time_keyboard=True,
-            input_field_placeholder='Sleep now or Wake time?'
-        )
-    )
+    choice_template.reply(update.message, first_name=update.message.from_user.first_name)
 
     return SLEEP_CHOICE
 
 
-def sleep_now(update: Update, context: CallbackContext) -> int:
-    curr = utils.get_datetime_utc_now()
-    time_to_sleep = utils.convert_utc_to_sgt(curr)
-
-    wake_times = [(curr + dt.timedelta(minutes=20))]
+def get_waketimes_from_sleep(sleep_datetime: dt.datetime) -> list[dt.datetime]:
+    """Calculates the times to wake up, a power nap and then up to 6 sleep cycles, when sleeping at `sleep_datetime`"""
+    wake_times = [sleep_datetime + nap_timedelta]
 
-    curr += fall_asleep_timedelta
+    curr = sleep_datetime + fall_asleep_timedelta
     for i in range(6):
         curr += sleep_cycle_timedelta
-        new_datetime = curr.replace()
-        wake_times.append(new_datetime)
+        wake_times.append(curr)
 
-    wake_time_str = sleep_time_arr_to_str(wake_times)
+    return wake_times
 
-    update.message.reply_text(
-        common.hedgehog +
-        "If you sleep now at "
-        + utils.underline_str(f"{time_to_sleep.strftime(common.time_format)}\n") +
-        "you should wake up at:\n" +
-        wake_time_str,
-        reply_markup=ReplyKeyboardRemove(),
-        parse_mode=ParseMode.MARKDOWN_V2
+
+def build_sleep_now_text(utc_now: dt.datetime, tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """Returns the Sleep Now reply for a user going to sleep at `utc_now`"""
+    return sleep_now_template.render(
+        now=utils.convert_utc_to_local(utc_now, tz_name),
+        wake_times=sleep_time_arr_to_str(get_waketimes_from_sleep(utc_now), tz_name)
+    )
+
+
+@functools.lru_cache(maxsize=24 * 60)
+def sleep_now_text_for_minute(minute_of_day: int) -> str:
+    """Returns the Sleep Now reply for a local minute of the day, when there is no DST transition ahead"""
+    return build_sleep_now_text(reply_table_epoch + dt.timedelta(minutes=minute_of_day), 'UTC')
+
+
+def sleep_now_text(utc_now: dt.datetime, tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """
+    Returns the Sleep Now reply, looked up from a table of replies per local minute of the day
+
+    The reply only depends on the local minute of the day, unless the timezone's UTC offset
+    changes before the last suggested wake up time, in which case it is rendered directly.
+    """
+    if utils.has_utc_offset_change(utc_now, utc_now + sleep_now_span, tz_name):
+        return build_sleep_now_text(utc_now, tz_name)
+
+    local_now = utils.convert_utc_to_local(utc_now, tz_name)
+    return sleep_now_text_for_minute(local_now.hour * 60 + local_now.minute)
+
+
+@functools.lru_cache(maxsize=8192)
+def sleep_wake_text_for_minutes(wake_minute_of_day: int, minutes_to_wake: int) -> str:
+    """Returns the Wake Time reply for a local wake up minute of the day, when there is no DST transition before it"""
+    wake_time = reply_table_epoch + dt.timedelta(days=1, minutes=wake_minute_of_day)
+    now = wake_time - dt.timedelta(minutes=minutes_to_wake)
+    return process_sleep_times_text(get_sleeptimes_from_wake(wake_time, now), wake_time, 'UTC')
+
+
+def sleep_wake_text(wake_time: dt.datetime, utc_now: dt.datetime,
+                    tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """
+    Returns the Wake Time reply, looked up from a table of replies per local minute of the day
+
+    The current time is taken to the minute, so the reply only depends on the local wake up minute
+    and the number of minutes until then, unless the timezone's UTC offset changes before the wake
+    up time, in which case it is rendered directly.
+    """
+    utc_now = utc_now.replace(second=0, microsecond=0)
+    if utils.has_utc_offset_change(utc_now, wake_time, tz_name):
+        return process_sleep_times_text(get_sleeptimes_from_wake(wake_time, utc_now), wake_time, tz_name)
+
+    local_wake_time = utils.convert_utc_to_local(wake_time, tz_name)
+    return sleep_wake_text_for_minutes(
+        local_wake_time.hour * 60 + local_wake_time.minute,
+        (wake_time - utc_now) // dt.timedelta(minutes=1)
     )
 
+
+def args_text(args: list[str], utc_now: dt.datetime, tz_name: str = utils.DEFAULT_TIMEZONE) -> str:
+    """
+    Returns the Sleep Now reply if there are no arguments or the argument is 'now', or the Wake
+    Time reply for a wake up time like 7a
+
+    Raises
+    ------
+    ValueError
+        If the arguments are not a time, or the time is invalid
+    """
+    if not args or args == ['now']:
+        return sleep_now_text(utc_now, tz_name)
+
+    wake_time_raw, rest = utils.time_from_args(args)
+    if rest:
+        raise ValueError('send only the time you want to wake up by (e.g 7a)')
+    wake_time = utils.parsed_to_datetime(wake_time_raw, tz_name, utc_now)
+    return sleep_wake_text(wake_time, utc_now, tz_name)
+
+
+def sleep_args(update: Update, context: CallbackContext) -> None:
+    """replies to /sleep now or /sleep 700a straight away, without a conversation"""
+    tz_name = utils.get_user_timezone(context.user_data)
+    try:
+        text = args_text(context.args, context.now, tz_name)
+    except ValueError as err:
+        update.message.reply_text(utils.time_input_err_to_str(err.args[0]))
+        return
+
+    update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN_V2)
+
+
+def sleep_now(update: Update, context: CallbackContext) -> int:
+    tz_name = utils.get_user_timezone(context.user_data)
+
+    update.message.reply_text(sleep_now_text(context.now, tz_name), **sleep_now_kwargs)
+
     return ConversationHandler.END
 
 
@@ -192,11 +288,11 @@ def sleep_wake(update: Update, context: CallbackContext) -> int:
 
 
 def sleep_wake_time(update: Update, context: CallbackContext) -> int:
-    wake_time_raw = update.message.text
+    tz_name = utils.get_user_timezone(context.user_data)
+    wake_time_raw = utils.parse_input(update.message.text)
     try:
-        wake_time = utils.process_hhmm_time(wake_time_raw)
-        sleep_times = get_sleeptimes_from_wake(wake_time)
-        text = process_sleep_times_text(sleep_times, wake_time)
+        wake_time = utils.parsed_to_datetime(wake_time_raw, tz_name, context.now)
+        text = sleep_wake_text(wake_time, context.now, tz_name)
 
         update.message.reply_text(
             text,
@@ -213,21 +309,41 @@ def sleep_wake_time(update: Update, context: CallbackContext) -> int:
         return SLEEP_WAKE
 
 
+# /sleep with arguments is answered without entering the conversation
+sleep_args_handler = CommandHandler('sleep', sleep_args, filters=common.command_args_filter, run_async=True)
+
 convo_except_handler = MessageHandler(
-    (~Filters.command) & Filters.regex('.*'), common.convo_except)
+    (~Filters.command) & Filters.text, common.convo_except)
 
-sleep_convo_handler = ConversationHandler(
+sleep_convo_handler = common.ConcurrentConversationHandler(
     entry_points=[CommandHandler('sleep', sleep)],
     states={
         SLEEP_CHOICE: [
-            MessageHandler(Filters.regex('^(Sleep Now)$'), sleep_now),
-            MessageHandler(Filters.regex('^(Wake Time)$'), sleep_wake),
+            MessageHandler(Filters.text(['Sleep Now']), sleep_now),
+            MessageHandler(Filters.text(['Wake Time']), sleep_wake),
             convo_except_handler
         ],
         SLEEP_WAKE: [
-            MessageHandler(Filters.regex(common.hhmm_regex), sleep_wake_time),
+            MessageHandler(common.InputFilter(utils.TIME), sleep_wake_time),
             convo_except_handler
         ]
     },
-    fallbacks=[CommandHandler('cancel', common.convo_cancel)]
+    fallbacks=[CommandHandler('cancel', common.convo_cancel)],
+    name='sleep',
+    persistent=True
+)
+
+command = registry.Command(
+    name='sleep',
+    description='Calculate sleep and wake up times 💤',
+    help=(
+        common.hedgehog +
+        "Calculates what time you should wake up at\n"
+        "or sleep by using the 90 minute rule\n"
+        "to help you feel less groggy when you wake up!\n\n"
+        "or answers straight away with\n"
+        "/sleep now or /sleep <wake up time> (e.g. /sleep 7a)"
+    ),
+    # before the conversation, so that one-shot commands never create conversation state
+    handlers=[sleep_args_handler, sleep_convo_handler]
 )
@@ -0,0 +1,27 @@
+import common
+import registry
+
+from telegram import Update
+from telegram.ext import (
+    CallbackContext,
+    CommandHandler,
+)
+
+
+def start(update: Update, context: CallbackContext):
+    """Dialogue when the start command is given"""
+
+    text = common.hedgehog + \
+        f'chirp chirp \nHello there {update.message.from_user.first_name}!\nlet me /help you!'
+    context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+
+start_handler = CommandHandler('start', start, run_async=True)
+
+# sent by telegram when a user opens the bot, so it is not listed in /help
+command = registry.Command(
+    name='start',
+    description=None,
+    help=None,
+    handlers=[start_handler]
+)
@@ -0,0 +1,53 @@
+import common
+import registry
+import utils
+
+from telegram import Update
+from telegram.ext import (
+    CallbackContext,
+    CommandHandler,
+)
+
+timezone_usage_txt = (
+    "Send /timezone <timezone name> to change it\n"
+    "(e.g. /timezone Asia/Singapore or /timezone Europe/London)"
+)
+
+
+def timezone(update: Update, context: CallbackContext):
+    """shows the user's timezone, or changes it when a timezone name is given"""
+    if not context.args:
+        text = (
+            common.hedgehog +
+            f"Your timezone is {utils.get_user_timezone(context.user_data)}\n\n" +
+            timezone_usage_txt
+        )
+    else:
+        tz_name = context.args[0]
+        try:
+            utils.get_timezone(tz_name)
+            context.user_data['timezone'] = tz_name
+            text = common.hedgehog + f"Got it! Your timezone is now {tz_name}"
+        except ValueError as err:
+            text = (
+                common.hedgehog +
+                f"Sorry, {err.args[0]}\n\n" +
+                timezone_usage_txt
+            )
+
+    context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+
+timezone_handler = CommandHandler('timezone', timezone, run_async=True)
+
+command = registry.Command(
+    name='timezone',
+    description='see or change your timezone 🌏',
+    help=(
+        common.hedgehog +
+        "Shows your timezone, or changes it with\n"
+        "/timezone <timezone name>\n"
+        "all times you send and receive are in your timezone"
+    ),
+    handlers=[timezone_handler]
+)
@@ -1,27 +1,56 @@
-from telegram import Update, ReplyKeyboardRemove
+import utils
+import functools
+import itertools
+import threading
+import collections
+import datetime as dt
+
+from typing import Optional
+
+from clock import Clock, system_clock
+from telegram import Update, Message, ReplyKeyboardRemove
 from telegram.ext import (
     CallbackContext,
     ConversationHandler,
+    Filters,
+    MessageFilter,
 )
+from telegram.ext.utils.promise import Promise
 
 hedgehog = '🦔: \n'
-hhmm_regex = '^\d{1,}\d{2}\s?[ap]$'
-h_or_m_regex = '^\d{1,3}[hm]$'
-h_m_regex = '^\d{1,2}h\s\d{1,2}m$'
+hhmm_regex = r'^\d{1,}\d{2}\s?[ap]$'
+h_or_m_regex = r'^\d{1,3}[hm]$'
+h_m_regex = r'^\d{1,2}h\s\d{1,2}m$'
 time_format = "%I:%M %p"
 
+# commands sent with at least one argument, e.g. /est 930a 45m
+command_args_filter = Filters.regex(r'^/\S+\s+\S')
+
+# the keyboard that removes a conversation's reply keyboard, serialized once, Bot sends a
+# reply_markup that is not a ReplyMarkup as it is
+remove_keyboard = ReplyKeyboardRemove().to_json()
+
+# how long a queued update waits for the Promise of the callback before it to be done
+pending_state_timeout = 30
+
 
 def convo_cancel(update: Update, context: CallbackContext) -> int:
     """Cancels and ends the conversation"""
 
     update.message.reply_text(
         hedgehog +
-        'Cancelled! Anything else i can /help you with?', reply_markup=ReplyKeyboardRemove()
+        'Cancelled! Anything else i can /help you with?', reply_markup=remove_keyboard
     )
 
     return ConversationHandler.END
 
 
+def clear_user_data(context: CallbackContext, keys: tuple) -> None:
+    """Removes the keys a conversation kept in user_data while it was going on"""
+    for key in keys:
+        context.user_data.pop(key, None)
+
+
 def convo_except(update: Update, context: CallbackContext) -> int:
     """Generic message to send the user when there is an error"""
     update.message.reply_text(
@@ -29,3 +58,193 @@ def convo_except(update: Update, context: CallbackContext) -> int:
         "sorry i didn't understand that. \n"
         "please try again!"
     )
+
+
+class ConversationState:
+    """
+    Base of the records conversations keep in user_data between their steps
+
+    Subclasses name their fields in `__slots__` and keep small ints in them, e.g. minutes since
+    the epoch instead of datetimes, so a record has no per-instance dict and pickles to a tuple
+    of those ints.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *values: Optional[int]):
+        # fields not given yet are None until a later step of the conversation sets them
+        for name, value in itertools.zip_longest(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __reduce__(self) -> tuple:
+        return type(self), tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) is type(other) and self.__reduce__() == other.__reduce__()
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class UpdateContext(CallbackContext):
+    """
+    CallbackContext that reads the clock at most once per update
+
+    All handlers of an update share one context, so every handler sees the same `now`, even when
+    a minute boundary passes while the update is being handled. Replace `clock` to run the bot on
+    a simulated clock. `reminders` is the scheduler handlers arm reminders with, and `routes` the
+    planner they ask for travel times, if there is one. `error_reports` aggregates the errors the
+    error handler sees. All three are set by `main.build_updater`.
+    """
+
+    clock: Clock = system_clock
+    # reminders.ReminderScheduler, routing.RoutePlanner and error_reports.ErrorReports, they are
+    # only imported by main, so importing common stays cheap
+    reminders = None
+    routes = None
+    error_reports = None
+
+    @property
+    def now(self) -> dt.datetime:
+        """The time the update is handled at, as an 'aware' datetime object in UTC"""
+        try:
+            return self._now
+        except AttributeError:
+            self._now = self.clock.now()
+            return self._now
+
+
+class ConcurrentConversationHandler(ConversationHandler):
+    """
+    ConversationHandler whose callbacks run on the dispatcher's worker pool
+
+    Every callback is run asynchronously so that a slow reply in one chat does not hold up the
+    other chats. Updates that arrive while the same conversation is still being handled are queued
+    instead of being dropped, and handled one at a time on the worker pool once the callback before
+    them returns, so each conversation still moves through its states one message at a time,
+    exactly like a synchronous ConversationHandler, without the dispatcher thread waiting for it.
+    Updates none of the conversation's handlers accept, e.g. other commands, are left to the
+    dispatcher's other handlers like they would be when the conversation is not busy.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('run_async', True)
+        super().__init__(*args, **kwargs)
+        # conversation key -> the updates waiting for its running callback, a key is present
+        # for as long as one of its callbacks is running or about to run
+        self._waiting = {}
+        self._waiting_lock = threading.Lock()
+        for handlers in (self.entry_points, self.fallbacks, *self.states.values()):
+            for handler in handlers:
+                handler.callback = self._resuming(handler.callback)
+
+    def _resuming(self, callback):
+        """Wraps a callback to handle the conversation's next waiting update once it returns"""
+
+        @functools.wraps(callback)
+        def run(update, context):
+            try:
+                return callback(update, context)
+            finally:
+                if isinstance(update, Update) and update.effective_chat and update.effective_user:
+                    context.dispatcher.run_async(self._resume, self._get_key(update), context.dispatcher)
+
+        return run
+
+    def _resume(self, key: tuple, dispatcher) -> None:
+        """Handles the updates that waited for the conversation's last callback, until one runs a callback"""
+        with self._conversations_lock:
+            state = self.conversations.get(key)
+        # the callback has returned, its Promise is done as soon as it records the result
+        if isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], Promise):
+            state[1].done.wait(pending_state_timeout)
+
+        while True:
+            with self._waiting_lock:
+                waiting = self._waiting.get(key)
+                if waiting is None:
+                    return
+                if not waiting:
+                    del self._waiting[key]
+                    return
+                update, context = waiting.popleft()
+            check = super().check_update(update)
+            if check is None or check is False:
+                continue
+            try:
+                super().handle_update(update, dispatcher, check, context)
+            except Exception as err:
+                dispatcher.dispatch_error(update, err)
+                continue
+            return
+
+    def check_update(self, update: object):
+        if isinstance(update, Update) and update.effective_chat and update.effective_user:
+            key = self._get_key(update)
+            with self._waiting_lock:
+                busy = key in self._waiting
+            # handled by handle_update, after the callback that is running, the state it moves the
+            # conversation to is not known yet, so any state's handlers may take the update then
+            if busy and self._may_handle(update):
+                return key, None, None
+            if busy:
+                return None
+        return super().check_update(update)
+
+    def _may_handle(self, update: Update) -> bool:
+        """Whether an entry point, a fallback or the handler of any state accepts the update"""
+        for handler in itertools.chain(self.entry_points, self.fallbacks, *self.states.values()):
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return True
+        return False
+
+    def handle_update(self, update, dispatcher, check_result, context=None):
+        key, handler, _ = check_result
+        with self._waiting_lock:
+            if handler is None and key in self._waiting:
+                self._waiting[key].append((update, context))
+                return None
+            self._waiting.setdefault(key, collections.deque())
+        if handler is None:
+            # the callback it waited for returned in the meantime
+            check_result = super().check_update(update)
+            if check_result is None or check_result is False:
+                self._resume(key, dispatcher)
+                return None
+        try:
+            return super().handle_update(update, dispatcher, check_result, context)
+        except Exception:
+            self._resume(key, dispatcher)
+            raise
+
+
+class InputFilter(MessageFilter):
+    """
+    Filters text messages by the kind of input `utils.parse_input` classifies them as
+
+    Handlers behind this filter call `utils.parse_input` on the same text again, which is served
+    from its cache, so every message is only tokenized once.
+    """
+
+    def __init__(self, *kinds: str):
+        self.kinds = kinds
+        self.name = f'InputFilter{kinds}'
+
+    def filter(self, message: Message) -> bool:
+        return bool(message.text) and utils.parse_input(message.text).kind in self.kinds
+
+
+class RoutesFilter(MessageFilter):
+    """
+    Filters messages while there is a route planner, `UpdateContext.routes`
+
+    The planner is only set by `main.build_updater` when there is a feed, after the handlers are
+    built, so the handlers that need it are behind this filter and left out without it.
+    """
+
+    name = 'RoutesFilter'
+
+    def filter(self, message: Message) -> bool:
+        return UpdateContext.routes is not None
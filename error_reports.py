@@ -0,0 +1,81 @@
+import hashlib
+import os
+import threading
+import traceback
+
+from typing import NamedTuple
+
+# longest error message kept for digests
+max_summary_length = 200
+
+
+def error_fingerprint(error: BaseException) -> str:
+    """
+    Returns a short id of the exception type and the code locations in its traceback
+
+    The same bug raised by different updates gets the same fingerprint, even though the
+    messages of the exceptions differ, e.g. because they contain the user's input.
+    """
+    parts = [type(error).__qualname__]
+    for frame, lineno in traceback.walk_tb(error.__traceback__):
+        code = frame.f_code
+        parts.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{lineno}')
+    return hashlib.blake2b('|'.join(parts).encode(), digest_size=6).hexdigest()
+
+
+def error_summary(error: BaseException) -> str:
+    """Returns the exception's type and message, and where it was raised, in one line"""
+    summary = f'{type(error).__name__}: {error}'
+    if len(summary) > max_summary_length:
+        summary = summary[:max_summary_length - 3] + '...'
+    frames = list(traceback.walk_tb(error.__traceback__))
+    if frames:
+        frame, lineno = frames[-1]
+        summary += f' ({os.path.basename(frame.f_code.co_filename)}:{lineno} in {frame.f_code.co_name})'
+    return summary
+
+
+class DigestEntry(NamedTuple):
+    fingerprint: str
+    summary: str
+    count: int
+    total: int
+
+
+class ErrorReports:
+    """
+    Aggregates the errors raised while handling updates by fingerprint
+
+    `record` tells the caller whether an error is the first one with its fingerprint, which is
+    the only one that gets a full report, and `digest` returns how often each error happened
+    since the previous digest. Errors are only aggregated within one process, so when the bot
+    runs in several worker processes each of them reports and counts its own errors.
+    """
+
+    def __init__(self):
+        # fingerprint -> [summary, count since the last digest, total count]
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, error: BaseException) -> bool:
+        """Counts `error`, returns True if no error with its fingerprint was recorded before"""
+        fingerprint = error_fingerprint(error)
+        with self._lock:
+            entry = self._errors.get(fingerprint)
+            if entry is None:
+                # the first occurrence is reported in full, so it does not count towards the digest
+                self._errors[fingerprint] = [error_summary(error), 0, 1]
+                return True
+            entry[1] += 1
+            entry[2] += 1
+            return False
+
+    def digest(self) -> list[DigestEntry]:
+        """Returns the errors that happened again since the last digest, most frequent first"""
+        with self._lock:
+            entries = []
+            for fingerprint, entry in self._errors.items():
+                if entry[1]:
+                    entries.append(DigestEntry(fingerprint, entry[0], entry[1], entry[2]))
+                    entry[1] = 0
+        return sorted(entries, key=lambda entry: entry.count, reverse=True)
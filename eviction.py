@@ -0,0 +1,167 @@
+import logging
+import threading
+import datetime as dt
+
+from collections import OrderedDict
+from typing import Callable
+
+from telegram import Update
+from telegram.ext import ConversationHandler, Dispatcher, Handler
+from telegram.ext.utils.promise import Promise
+
+import common
+from clock import Clock, system_clock
+from registry import CommandRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def timed_out_text(name: str) -> str:
+    return common.hedgehog + f"Your /{name} conversation timed out, send /{name} to start again"
+
+
+class StateEvictor:
+    """
+    Forgets the conversations and the user_data of users who have gone quiet
+
+    Every update moves its user, and its conversation key, to the end of an ordered dict, so
+    both are always ordered from the least to the most recently seen. `evict` pops from the
+    front of them until it reaches someone seen recently enough, so expiring costs nothing for
+    the users who are not expired and there are no timers per user.
+
+    A conversation that had no update for `conversation_ttl` is ended, the user_data keys its
+    command only needs while it is going on are removed, and the user is told it timed out.
+    The user_data of users not seen for `user_data_ttl`, or of the least recently seen users
+    while the user_data in memory is larger than `max_user_data_bytes`, is dropped from memory.
+    It stays on disk and is loaded again on the user's next update.
+
+    Parameters
+    ----------
+    registry
+        the commands whose conversations are timed out
+    dispatcher
+        the dispatcher whose user_data is evicted, its persistence has to be a
+        `persistence.SqlitePersistence`
+    notify
+        called with the chat id and the text to send when a conversation times out
+    conversation_ttl
+        how long a conversation may wait for the user's next message
+    user_data_ttl
+        how long the user_data of a user who sends nothing is kept in memory
+    max_user_data_bytes
+        most bytes of pickled user_data kept in memory
+    clock
+        clock the times users were last seen are read from
+    """
+
+    def __init__(self, registry: CommandRegistry, dispatcher: Dispatcher, notify: Callable[[int, str], None],
+                 conversation_ttl: dt.timedelta = dt.timedelta(minutes=30),
+                 user_data_ttl: dt.timedelta = dt.timedelta(days=1),
+                 max_user_data_bytes: int = 64 * 1024 * 1024, clock: Clock = system_clock):
+        self.registry = registry
+        self.dispatcher = dispatcher
+        self.notify = notify
+        self.conversation_ttl = conversation_ttl.total_seconds()
+        self.user_data_ttl = user_data_ttl.total_seconds()
+        self.max_user_data_bytes = max_user_data_bytes
+        self.clock = clock
+
+        # (chat id, user id) -> timestamp, and user id -> timestamp, least recently seen first
+        self._conversation_keys = OrderedDict()
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+        # chats that were in the middle of a conversation when the bot stopped time out like the others
+        for name in registry.names:
+            for chat_id, user_id in dispatcher.persistence.get_conversations(name):
+                self.touch(chat_id, user_id)
+
+    def touch(self, chat_id: int, user_id: int) -> None:
+        now = self.clock.now().timestamp()
+        with self._lock:
+            self._conversation_keys[(chat_id, user_id)] = now
+            self._conversation_keys.move_to_end((chat_id, user_id))
+            self._users[user_id] = now
+            self._users.move_to_end(user_id)
+
+    def evict(self) -> tuple[int, int]:
+        """Times out idle conversations and drops idle user_data, returns how many of each"""
+        now = self.clock.now().timestamp()
+        if not self.registry.all_loaded():
+            self.registry.all()
+        idle_keys = self._pop_idle(self._conversation_keys, now - self.conversation_ttl)
+        timed_out = sum(self._time_out(key) for key in idle_keys)
+
+        persistence = self.dispatcher.persistence
+        evicted = self._pop_idle(self._users, now - self.user_data_ttl)
+        for user_id in evicted:
+            self._evict_user_data(user_id)
+        while persistence.user_data_bytes > self.max_user_data_bytes:
+            with self._lock:
+                if not self._users:
+                    break
+                user_id = self._users.popitem(last=False)[0]
+            self._evict_user_data(user_id)
+            evicted.append(user_id)
+
+        if timed_out or evicted:
+            logger.info('Timed out %d conversations and evicted the user_data of %d users', timed_out, len(evicted))
+        return timed_out, len(evicted)
+
+    def _pop_idle(self, seen: OrderedDict, before: float) -> list:
+        idle = []
+        with self._lock:
+            while seen:
+                key, timestamp = next(iter(seen.items()))
+                if timestamp > before:
+                    break
+                seen.popitem(last=False)
+                idle.append(key)
+        return idle
+
+    def _evict_user_data(self, user_id: int) -> None:
+        self.dispatcher.user_data.pop(user_id, None)
+        self.dispatcher.persistence.evict_user_data(user_id)
+
+    def _time_out(self, key: tuple) -> bool:
+        """Ends the conversations the chat is in the middle of, returns whether there were any"""
+        timed_out = False
+        for command in self.registry.loaded():
+            for handler in command.handlers:
+                if isinstance(handler, ConversationHandler) and self._end(handler, key):
+                    timed_out = True
+                    self._clear_user_data(key[1], command.user_data_keys)
+                    self.notify(key[0], timed_out_text(command.name))
+        return timed_out
+
+    def _clear_user_data(self, user_id: int, keys: tuple) -> None:
+        user_data = self.dispatcher.user_data.get(user_id)
+        if user_data is None or not any(key in user_data for key in keys):
+            return
+        for key in keys:
+            user_data.pop(key, None)
+        self.dispatcher.persistence.update_user_data(user_id, user_data)
+
+    def _end(self, conversation: ConversationHandler, key: tuple) -> bool:
+        with conversation._conversations_lock:
+            state = conversation.conversations.get(key)
+            # a message of the conversation is still being handled
+            if state is None or (isinstance(state, tuple) and isinstance(state[-1], Promise)):
+                return False
+            del conversation.conversations[key]
+        if conversation.persistent and conversation.persistence:
+            conversation.persistence.update_conversation(conversation.name, key, None)
+        return True
+
+
+class ActivityHandler(Handler):
+    """Tells a StateEvictor about every update's chat and user, it never handles an update itself"""
+
+    def __init__(self, evictor: StateEvictor):
+        super().__init__(callback=None)
+        self.evictor = evictor
+
+    def check_update(self, update: object) -> None:
+        if isinstance(update, Update) and update.effective_chat and update.effective_user:
+            self.evictor.touch(update.effective_chat.id, update.effective_user.id)
+        return None
@@ -1,47 +1,114 @@
+# first, so that the startup profile covers the other imports
+import startup
+
 import os
 import html
+import functools
+import multiprocessing
+import signal
+import threading
 import traceback
 import json
+import datetime as dt
 import telegram
 import logging
 
-from setuptools import Command
+from typing import TYPE_CHECKING, Callable, Optional
+
 from telegram import Update, ReplyKeyboardMarkup, ParseMode
 from telegram.ext import (
     Updater,
+    Dispatcher,
+    ContextTypes,
     CallbackContext,
-    CommandHandler,
     MessageHandler,
     Filters
 )
 
-from dotenv import load_dotenv
-
 import common
-from commands import (
-    est,
-    sleep,
-    help
-)
+import metrics
+import registry
+import outbound
+from bot_request import InstrumentedRequest
+from persistence import SqlitePersistence
+
+if TYPE_CHECKING:
+    # only the mode the bot runs in imports its modules, see run_webhook, run_polling and run_supervisor
+    import traffic
+    import webhook
+
+startup.profile.mark('imports')
 
-load_dotenv('./.env')
+if os.path.exists('./.env'):
+    # only needed in development, the environment is set by the platform in production
+    from dotenv import load_dotenv
+    load_dotenv('./.env')
 API_KEY = os.environ["API_KEY"]
 PORT = int(os.environ.get('PORT', 8443))
+# a local Bot API server, or the stand-in of benchmarks.bench_load
+BOT_API_URL = os.environ.get('BOT_API_URL', 'https://api.telegram.org/bot')
 IS_DEV = os.environ['DEV']
+# number of threads that run handlers concurrently, outbound api calls block only their own thread
+WORKERS = int(os.environ.get('WORKERS', 32))
+PERSISTENCE_FILE = os.environ.get('PERSISTENCE_FILE', 'gfhelper.sqlite3')
+PERSISTENCE_FLUSH_INTERVAL = float(os.environ.get('PERSISTENCE_FLUSH_INTERVAL', 1.0))
+# telegram's flood limits: about 30 messages per second in total and 1 per second per chat
+OUTBOUND_RATE = float(os.environ.get('OUTBOUND_RATE', 30))
+OUTBOUND_CHAT_RATE = float(os.environ.get('OUTBOUND_CHAT_RATE', 1))
+OUTBOUND_WORKERS = int(os.environ.get('OUTBOUND_WORKERS', 4))
+# connections to the Bot API, every thread making api calls needs one
+BOT_CON_POOL_SIZE = int(os.environ.get('BOT_CON_POOL_SIZE', WORKERS + OUTBOUND_WORKERS + 4))
+BOT_CONNECT_TIMEOUT = float(os.environ.get('BOT_CONNECT_TIMEOUT', 5.0))
+BOT_READ_TIMEOUT = float(os.environ.get('BOT_READ_TIMEOUT', 5.0))
+BOT_MAX_RETRIES = int(os.environ.get('BOT_MAX_RETRIES', 2))
+BOT_RETRY_BACKOFF = float(os.environ.get('BOT_RETRY_BACKOFF', 0.5))
+BOT_KEEPALIVE_IDLE = int(os.environ.get('BOT_KEEPALIVE_IDLE', 120))
+# updates waiting to be handled before the webhook answers telegram with 503
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 1000))
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
+# updates fetched with one getUpdates request when polling, and batches fetched ahead of the one being handled
+POLLING_BATCH_SIZE = int(os.environ.get('POLLING_BATCH_SIZE', 100))
+POLLING_PREFETCH = int(os.environ.get('POLLING_PREFETCH', 2))
+# seconds telegram keeps a getUpdates request open while there are no updates
+POLLING_TIMEOUT = int(os.environ.get('POLLING_TIMEOUT', 10))
+POLLING_JOURNAL_FILE = os.environ.get('POLLING_JOURNAL_FILE', PERSISTENCE_FILE)
+# processes handling updates, each owns a share of the chats, 1 handles everything in this process
+WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', 1))
+# how often worker processes send their metrics to the supervisor, in seconds
+METRICS_PUSH_INTERVAL = float(os.environ.get('METRICS_PUSH_INTERVAL', 5))
+REMINDERS_FILE = os.environ.get('REMINDERS_FILE', PERSISTENCE_FILE)
+# directory of a GTFS feed for /route and travel times in /est, the route planner is off if it is not set
+ROUTE_FEED_DIR = os.environ.get('ROUTE_FEED_DIR')
+# the network loaded from the feed is saved here, so that it is only built again when the feed changes
+ROUTE_INDEX_FILE = os.environ.get('ROUTE_INDEX_FILE', 'routes.index')
+ROUTE_CACHE_SIZE = int(os.environ.get('ROUTE_CACHE_SIZE', 4096))
+# how often the developer gets the counts of errors that were already reported, in seconds
+ERROR_DIGEST_INTERVAL = float(os.environ.get('ERROR_DIGEST_INTERVAL', 600))
+# how long a conversation waits for the user's next message before it times out, in seconds
+CONVERSATION_TTL = float(os.environ.get('CONVERSATION_TTL', 30 * 60))
+# how long the user_data of a user who sends nothing stays in memory, in seconds, it stays on disk
+USER_DATA_TTL = float(os.environ.get('USER_DATA_TTL', 24 * 60 * 60))
+# most bytes of user_data kept in memory, the least recently seen users' are dropped first
+USER_DATA_MAX_BYTES = int(os.environ.get('USER_DATA_MAX_BYTES', 64 * 1024 * 1024))
+# how often idle conversations and user_data are looked for, in seconds
+EVICTION_INTERVAL = float(os.environ.get('EVICTION_INTERVAL', 60))
+# import each command module when the first update for it arrives, set to 0 to import them all on startup
+LAZY_COMMANDS = os.environ.get('LAZY_COMMANDS', '1') != '0'
+# if set, the updates the bot receives are recorded to this file for benchmarks.bench_load
+TRAFFIC_RECORD_FILE = os.environ.get('TRAFFIC_RECORD_FILE')
+# set to 0 to record the updates with their names, ids and text
+TRAFFIC_ANONYMIZE = os.environ.get('TRAFFIC_ANONYMIZE', '1') != '0'
+# seconds the bot may take from starting to handling its first update before a warning is logged
+STARTUP_BUDGET = float(os.environ.get('STARTUP_BUDGET', 5))
 
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
+    format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
 )
 
 logger = logging.getLogger(__name__)
 
-
-def start(update: Update, context: CallbackContext):
-    """Dialogue when the start command is given"""
-
-    text = common.hedgehog + \
-        f'chirp chirp \nHello there {update.message.from_user.first_name}!\nlet me /help you!'
-    context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+startup.profile.budget = STARTUP_BUDGET
 
 
 def unknown(update: Update, context: CallbackContext):
@@ -52,73 +119,434 @@ def unknown(update: Update, context: CallbackContext):
                                    "Sorry, I didn't understand that command."))
 
 
+def error_report_text(update: object, context: CallbackContext) -> str:
+    """Builds the full report of an error with the update, the chat and user data and the traceback"""
+
+    # traceback.format_exception returns the usual python message about an exception, but as a
+    # list of strings rather than a single string, so we have to join them together.
+    tb_list = traceback.format_exception(
+        None, context.error, context.error.__traceback__)
+    tb_string = ''.join(tb_list)
+
+    # Build the message with some markup and additional information about what happened.
+    update_str = update.to_dict() if isinstance(update, Update) else str(update)
+    message = (
+        f'An exception was raised while handling an update\n'
+        f'<pre>update = {html.escape(json.dumps(update_str, indent=2, ensure_ascii=False))}'
+        '</pre>\n\n'
+        f'<pre>context.chat_data = {html.escape(str(context.chat_data))}</pre>\n\n'
+        f'<pre>context.user_data = {html.escape(str(context.user_data))}</pre>\n\n'
+        f'<pre>{html.escape(tb_string)}</pre>'
+    )
+    # telegram rejects messages longer than 4096 characters, the end of the traceback matters most
+    if len(message) > 4096:
+        message = f'<pre>{html.escape(tb_string[-3800:])}</pre>'
+    return message
+
+
 def error_handler(update: object, context: CallbackContext) -> None:
-    """Sends a detailed error message to the developer when an unexpected exception occurs"""
+    """
+    Sends a detailed error message to the developer the first time an unexpected exception occurs
 
-    try:
-        DEVELOPER_CHAT_ID = os.environ["DEVELOPER_CHAT_ID"]
-        """Log the error and send a telegram message to notify the developer."""
+    Later occurrences of the same error are only counted, see send_error_digest.
+    """
+
+    from error_reports import error_summary
+
+    first_occurrence = context.error_reports.record(context.error)
+    if first_occurrence:
         # Log the error before we do anything else, so we can see it even if something breaks.
-        logger.error(msg="Exception while handling an update:",
-                     exc_info=context.error)
-
-        # traceback.format_exception returns the usual python message about an exception, but as a
-        # list of strings rather than a single string, so we have to join them together.
-        tb_list = traceback.format_exception(
-            None, context.error, context.error.__traceback__)
-        tb_string = ''.join(tb_list)
-
-        # Build the message with some markup and additional information about what happened.
-        # You might need to add some logic to deal with messages longer than the 4096 character limit.
-        update_str = update.to_dict() if isinstance(update, Update) else str(update)
-        message = (
-            f'An exception was raised while handling an update\n'
-            f'<pre>update = {html.escape(json.dumps(update_str, indent=2, ensure_ascii=False))}'
-            '</pre>\n\n'
-            f'<pre>context.chat_data = {html.escape(str(context.chat_data))}</pre>\n\n'
-            f'<pre>context.user_data = {html.escape(str(context.user_data))}</pre>\n\n'
-            f'<pre>{html.escape(tb_string)}</pre>'
-        )
-
-        # Finally, send the message
+        logger.error(msg="Exception while handling an update:", exc_info=context.error)
+    else:
+        logger.warning('Exception while handling an update: %s', error_summary(context.error))
+
+    DEVELOPER_CHAT_ID = os.environ.get("DEVELOPER_CHAT_ID")
+    if DEVELOPER_CHAT_ID is None:
+        return
+
+    if first_occurrence:
         context.bot.send_message(chat_id=DEVELOPER_CHAT_ID,
-                                 text=message, parse_mode=ParseMode.HTML)
+                                 text=error_report_text(update, context), parse_mode=ParseMode.HTML,
+                                 priority=outbound.NOTIFICATION)
+    if isinstance(update, Update) and update.effective_chat:
         context.bot.send_message(chat_id=update.effective_chat.id,
                                  text="🤖: Sorry, an error has occurred, please contact shawn")
-    except KeyError:
-        logger.error(msg="Exception while handling an update:",
-                     exc_info=context.error)
 
 
-def main() -> None:
-    """Run bot."""
+def send_error_digest(context: CallbackContext) -> None:
+    """Sends the developer how often each known error happened again since the last digest"""
+    DEVELOPER_CHAT_ID = os.environ.get("DEVELOPER_CHAT_ID")
+    digest = context.error_reports.digest()
+    if not digest or DEVELOPER_CHAT_ID is None:
+        return
 
-    updater = Updater(API_KEY, use_context=True)
+    # split between lines, so that telegram's limit of 4096 characters never cuts a tag in half
+    texts = [f'Errors in the last {ERROR_DIGEST_INTERVAL / 60:.0f} minutes\n']
+    for entry in digest:
+        line = f'{entry.count}x (total {entry.total}) <code>{html.escape(entry.summary)}</code>\n'
+        if len(texts[-1]) + len(line) > 4096:
+            texts.append('')
+        texts[-1] += line
+    for text in texts:
+        context.bot.send_message(chat_id=DEVELOPER_CHAT_ID, text=text, parse_mode=ParseMode.HTML,
+                                 priority=outbound.NOTIFICATION)
 
-    dispatcher = updater.dispatcher
 
-    start_handler = CommandHandler('start', start)
+def log_bot_stats(context: CallbackContext) -> None:
+    """Logs the outbound queue's priority lanes and the timings of each Bot API endpoint"""
+    for lane, stats in context.bot.outbound.stats().items():
+        logger.info('outbound %s: depth=%d sent=%d mean_wait=%.3fs max_wait=%.3fs', lane,
+                    stats['depth'], stats['sent'], stats['mean_wait'], stats['max_wait'])
+
+    for endpoint, stats in context.bot.request.endpoint_stats().items():
+        requests = stats['requests']
+        logger.info('api %s: requests=%d errors=%d retries=%d connects=%d connect=%.3fs tls=%.3fs '
+                    'mean_response=%.3fs max_response=%.3fs', endpoint, requests, stats['errors'],
+                    stats['retries'], stats['connects'], stats['connect_seconds'], stats['tls_seconds'],
+                    stats['response_seconds'] / requests, stats['max_response_seconds'])
+
+
+def evict_idle_state(context: CallbackContext) -> None:
+    """Times out idle conversations and drops the user_data of idle users from memory"""
+    context.job.context.evict()
+
 
-    unknown_handler = MessageHandler(Filters.command, unknown)
+def add_handlers(dispatcher: Dispatcher, lazy_commands: bool = LAZY_COMMANDS) -> None:
+    """Registers the bot's handlers and error handler on the dispatcher"""
 
-    dispatcher.add_handler(start_handler)
-    dispatcher.add_handler(help.help_handler)
-    dispatcher.add_handler(est.est_convo_handler)
-    dispatcher.add_handler(sleep.sleep_convo_handler)
+    unknown_handler = MessageHandler(Filters.command, unknown, run_async=True)
+
+    if not lazy_commands:
+        registry.bot_commands.all()
+    dispatcher.add_handler(registry.CommandDispatcher(registry.bot_commands, dispatcher.persistence))
     dispatcher.add_handler(unknown_handler)
 
-    dispatcher.add_error_handler(error_handler)
+    dispatcher.add_error_handler(error_handler, run_async=True)
+
+
+def wait_for_stop_signal() -> None:
+    """Blocks until the process is asked to stop"""
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    stop.wait()
+
+
+def fire_reminders(bot: outbound.QueuedBot, reminders: list) -> None:
+    """Queues the reminders that are due, behind the interactive replies"""
+    for reminder in reminders:
+        bot.send_message(chat_id=reminder.chat_id, text=reminder.text, priority=outbound.NOTIFICATION)
+
+
+def build_updater(outbound_rate: float = OUTBOUND_RATE, owns_chat=lambda chat_id: True,
+                  shared_user_data: bool = False) -> Updater:
+    """Builds the updater with the bot's persistence, outbound queue, connection pool, reminders, routes and handlers"""
+
+    persistence = SqlitePersistence(PERSISTENCE_FILE, flush_interval=PERSISTENCE_FLUSH_INTERVAL,
+                                    shared_user_data=shared_user_data)
+    outbound_queue = outbound.OutboundQueue(
+        rate=outbound_rate, chat_rate=OUTBOUND_CHAT_RATE, workers=OUTBOUND_WORKERS)
+    request = InstrumentedRequest(
+        con_pool_size=BOT_CON_POOL_SIZE,
+        connect_timeout=BOT_CONNECT_TIMEOUT,
+        read_timeout=BOT_READ_TIMEOUT,
+        max_retries=BOT_MAX_RETRIES,
+        retry_backoff=BOT_RETRY_BACKOFF,
+        keepalive_idle=BOT_KEEPALIVE_IDLE
+    )
+    bot = outbound.QueuedBot(API_KEY, base_url=BOT_API_URL, request=request, outbound=outbound_queue)
+    updater = Updater(bot=bot, use_context=True, workers=WORKERS, persistence=persistence,
+                      context_types=ContextTypes(context=common.UpdateContext))
+    from error_reports import ErrorReports
+    from eviction import ActivityHandler, StateEvictor
+    from reminders import ReminderScheduler
+
+    updater.job_queue.run_repeating(log_bot_stats, interval=60)
+    updater.job_queue.run_repeating(send_error_digest, interval=ERROR_DIGEST_INTERVAL)
+
+    add_handlers(updater.dispatcher)
+    metrics.instrument_dispatcher(updater.dispatcher)
+    metrics.registry.register_collector(lambda: metrics.bot_families(bot))
+
+    evictor = StateEvictor(
+        registry.bot_commands, updater.dispatcher,
+        lambda chat_id, text: bot.send_message(chat_id=chat_id, text=text, reply_markup=common.remove_keyboard,
+                                               priority=outbound.NOTIFICATION),
+        conversation_ttl=dt.timedelta(seconds=CONVERSATION_TTL),
+        user_data_ttl=dt.timedelta(seconds=USER_DATA_TTL),
+        max_user_data_bytes=USER_DATA_MAX_BYTES
+    )
+    # in a group of its own before the commands, so it sees every update
+    updater.dispatcher.add_handler(ActivityHandler(evictor), group=-1)
+    updater.job_queue.run_repeating(evict_idle_state, interval=EVICTION_INTERVAL, context=evictor)
+
+    reminders = ReminderScheduler(REMINDERS_FILE, lambda due: fire_reminders(bot, due),
+                                  flush_interval=PERSISTENCE_FLUSH_INTERVAL, owns=owns_chat)
+    reminders.start()
+    common.UpdateContext.reminders = reminders
+    # per process, with WORKER_PROCESSES every worker reports an error's first occurrence and sends
+    # its own digest
+    common.UpdateContext.error_reports = ErrorReports()
+    if ROUTE_FEED_DIR:
+        from routing import RoutePlanner
+
+        routes = RoutePlanner(ROUTE_FEED_DIR, index_file=ROUTE_INDEX_FILE, cache_size=ROUTE_CACHE_SIZE)
+        # loading a city's feed takes a while, /route answers that it is still loading until then
+        routes.start()
+        common.UpdateContext.routes = routes
+    startup.profile.mark('updater')
+    return updater
+
+
+def start_dispatcher(updater: Updater) -> None:
+    """
+    Starts the dispatcher's threads that run the handlers with run_async, Updater.start_webhook
+    and start_polling did this before updates were passed to process_update directly
+    """
+    ready = threading.Event()
+    threading.Thread(target=updater.dispatcher.start, kwargs={'ready': ready}, name='Dispatcher',
+                     daemon=True).start()
+    ready.wait()
+
+
+def stop_updater(updater: Updater) -> None:
+    """Stops the jobs and handlers, then writes the persisted data to disk"""
+    updater.job_queue.stop()
+    updater.dispatcher.stop()
+    if updater.persistence:
+        updater.dispatcher.update_persistence()
+        updater.persistence.flush()
+    common.UpdateContext.reminders.stop()
+    updater.bot.outbound.stop()
+
+
+def start_recorder() -> Optional['traffic.TrafficRecorder']:
+    """Starts recording the updates the bot receives if TRAFFIC_RECORD_FILE is set"""
+    if not TRAFFIC_RECORD_FILE:
+        return None
+    from traffic import TrafficRecorder
+
+    return TrafficRecorder(TRAFFIC_RECORD_FILE, anonymize=TRAFFIC_ANONYMIZE,
+                           flush_interval=PERSISTENCE_FLUSH_INTERVAL)
+
+
+def recording(process_update: Callable[[dict], None],
+              recorder: Optional['traffic.TrafficRecorder']) -> Callable[[dict], None]:
+    """Returns process_update, recording every update first if there is a recorder"""
+    if recorder is None:
+        return process_update
+
+    def record_and_process(data: dict) -> None:
+        recorder.record(data)
+        process_update(data)
+
+    return record_and_process
+
+
+def stop_recorder(recorder: Optional['traffic.TrafficRecorder']) -> None:
+    if recorder is not None:
+        recorder.stop()
+
+
+def set_webhook(bot: telegram.Bot) -> None:
+    HEROKU_APP_NAME = os.environ['HEROKU_APP_NAME']
+    bot.set_webhook(url='https://' + HEROKU_APP_NAME + '.herokuapp.com/' + API_KEY,
+                    api_kwargs={'secret_token': WEBHOOK_SECRET} if WEBHOOK_SECRET else None)
+
+
+def metrics_response(families: list) -> tuple:
+    return 200, 'text/plain; version=0.0.4; charset=utf-8', metrics.render(families).encode()
+
+
+def webhook_families(server: 'webhook.WebhookServer') -> list:
+    return [metrics.gauge('gfhelper_webhook_queue_depth', 'Updates waiting to be handled',
+                          [((), server.queue_depth())])]
+
+
+def run_webhook(updater: Updater) -> None:
+    """Receives updates with webhook.WebhookServer until the process is asked to stop"""
+    import webhook
+
+    dispatcher = updater.dispatcher
+    bot = updater.bot
+
+    def process_update(data: dict) -> None:
+        dispatcher.process_update(Update.de_json(data, bot))
+        startup.profile.first_update()
+
+    recorder = start_recorder()
+    server = webhook.WebhookServer(
+        listen="0.0.0.0",
+        port=PORT,
+        url_path=API_KEY,
+        process_update=recording(process_update, recorder),
+        queue_size=WEBHOOK_QUEUE_SIZE,
+        workers=WEBHOOK_WORKERS,
+        secret_token=WEBHOOK_SECRET
+    )
+    metrics.registry.register_collector(lambda: webhook_families(server))
+    server.add_route('/metrics', lambda: metrics_response(metrics.registry.collect()))
+    start_dispatcher(updater)
+    server.start()
+    updater.job_queue.start()
+    set_webhook(bot)
+    startup.profile.mark('webhook')
+    if LAZY_COMMANDS:
+        registry.bot_commands.preload()
+
+    wait_for_stop_signal()
+    logger.info('Stopping...')
+    server.stop()
+    stop_recorder(recorder)
+    stop_updater(updater)
+
+
+def fetch_updates(bot: telegram.Bot, offset: int, limit: int, timeout: int) -> list:
+    """Calls getUpdates and returns the raw updates, without decoding them"""
+    data = {'limit': limit, 'timeout': timeout}
+    if offset is not None:
+        data['offset'] = offset
+    return bot.request.post(f'{bot.base_url}/getUpdates', data, timeout=timeout + BOT_READ_TIMEOUT)
+
+
+def run_polling(updater: Updater) -> None:
+    """Receives updates with polling.PipelinedPoller until the process is asked to stop"""
+    from polling import PipelinedPoller
+
+    dispatcher = updater.dispatcher
+    bot = updater.bot
+
+    def process_update(data: dict) -> None:
+        dispatcher.process_update(Update.de_json(data, bot))
+        startup.profile.first_update()
+
+    recorder = start_recorder()
+    poller = PipelinedPoller(
+        POLLING_JOURNAL_FILE,
+        functools.partial(fetch_updates, bot),
+        recording(process_update, recorder),
+        batch_size=POLLING_BATCH_SIZE,
+        prefetch=POLLING_PREFETCH,
+        poll_timeout=POLLING_TIMEOUT,
+        retry_backoff=BOT_RETRY_BACKOFF
+    )
+    # telegram does not answer getUpdates while a webhook is set
+    bot.delete_webhook()
+    start_dispatcher(updater)
+    poller.start()
+    updater.job_queue.start()
+    if LAZY_COMMANDS:
+        registry.bot_commands.preload()
+
+    wait_for_stop_signal()
+    logger.info('Stopping...')
+    poller.stop()
+    stop_recorder(recorder)
+    stop_updater(updater)
+
+
+def push_metrics(context: CallbackContext) -> None:
+    """Sends this worker's metrics to the supervisor, which serves them on /metrics"""
+    index, metrics_queue = context.job.context
+    metrics_queue.put((index, metrics.registry.collect()))
+
+
+def run_worker(index: int, processes: int, update_queue, metrics_queue=None) -> None:
+    """Handles the raw updates the supervisor routes to this worker process until it gets None"""
+    from supervisor import HashRing
+
+    # the supervisor stops the workers once the updates already sent to them are handled
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    # every worker sends to its own chats, telegram's global limit is shared between them, and a
+    # user's updates in different chats can reach different workers, so they share user_data
+    ring = HashRing(processes)
+    updater = build_updater(outbound_rate=OUTBOUND_RATE / processes,
+                            owns_chat=lambda chat_id: ring.shard(chat_id) == index, shared_user_data=True)
+    if metrics_queue is not None:
+        updater.job_queue.run_repeating(push_metrics, interval=METRICS_PUSH_INTERVAL,
+                                        context=(index, metrics_queue))
+    start_dispatcher(updater)
+    updater.job_queue.start()
+    logger.info('Worker %d of %d started', index, processes)
+    if LAZY_COMMANDS:
+        registry.bot_commands.preload()
+
+    for data in iter(update_queue.get, None):
+        try:
+            updater.dispatcher.process_update(Update.de_json(data, updater.bot))
+        except Exception:
+            logger.exception('Failed to process update %s', data.get('update_id'))
+        startup.profile.first_update()
+
+    stop_updater(updater)
+
+
+def run_supervisor() -> None:
+    """Receives updates with webhook.WebhookServer and routes them to WORKER_PROCESSES worker processes"""
+    import webhook
+    from supervisor import Supervisor
+
+    metrics_queue = multiprocessing.get_context('spawn').Queue()
+    supervisor = Supervisor(functools.partial(run_worker, metrics_queue=metrics_queue), WORKER_PROCESSES,
+                            queue_size=max(1, WEBHOOK_QUEUE_SIZE // WORKER_PROCESSES))
+    supervisor.start()
+
+    # latest metrics of every worker process
+    worker_families = {}
+
+    def receive_worker_metrics() -> None:
+        for index, families in iter(metrics_queue.get, None):
+            worker_families[index] = families
+
+    def supervisor_metrics() -> tuple:
+        families = {index: families for index, families in list(worker_families.items())
+                    if index < supervisor.processes}
+        return metrics_response(metrics.merge(families, 'worker') + webhook_families(server))
+
+    threading.Thread(target=receive_worker_metrics, name='WorkerMetrics', daemon=True).start()
+
+    recorder = start_recorder()
+    server = webhook.WebhookServer(
+        listen="0.0.0.0",
+        port=PORT,
+        url_path=API_KEY,
+        process_update=recording(supervisor.dispatch, recorder),
+        queue_size=WEBHOOK_QUEUE_SIZE,
+        workers=WEBHOOK_WORKERS,
+        secret_token=WEBHOOK_SECRET
+    )
+    server.add_route('/metrics', supervisor_metrics)
+    server.start()
+    set_webhook(telegram.Bot(API_KEY))
+
+    # like gunicorn, SIGTTIN adds a worker process and SIGTTOU removes one
+    def resize(change: int) -> None:
+        processes = supervisor.processes + change
+        if processes >= 1:
+            threading.Thread(target=supervisor.resize, args=(processes,), daemon=True).start()
+
+    signal.signal(signal.SIGTTIN, lambda signum, frame: resize(1))
+    signal.signal(signal.SIGTTOU, lambda signum, frame: resize(-1))
+
+    wait_for_stop_signal()
+    logger.info('Stopping...')
+    server.stop()
+    stop_recorder(recorder)
+    supervisor.stop()
+    metrics_queue.put(None)
+
+
+def main() -> None:
+    """Run bot."""
 
     if IS_DEV:
-        updater.start_polling()
+        run_polling(build_updater())
+    elif WORKER_PROCESSES > 1:
+        run_supervisor()
     else:
-        HEROKU_APP_NAME = os.environ['HEROKU_APP_NAME']
-        updater.start_webhook(listen="0.0.0.0",
-                              port=int(PORT),
-                              url_path=API_KEY,
-                              webhook_url='https://' + HEROKU_APP_NAME + '.herokuapp.com/' + API_KEY)
-
-    updater.idle()
+        run_webhook(build_updater())
 
 
 if __name__ == '__main__':
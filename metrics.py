@@ -0,0 +1,280 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+
+from typing import Callable, Iterable
+
+from telegram import Update
+from telegram.ext import CallbackContext, ConversationHandler, Dispatcher, Handler
+
+from registry import CommandDispatcher
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets, in seconds
+latency_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# a metric family is (name, type, help, samples), and a sample is (name suffix, labels, value)
+# where labels is a tuple of (label name, label value) pairs
+
+
+class Counter:
+    """Counts events per combination of label values"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def collect(self) -> tuple:
+        with self._lock:
+            values = list(self._values.items())
+        samples = [('', tuple(zip(self.labelnames, labels)), value) for labels, value in values]
+        return self.name, 'counter', self.documentation, samples
+
+
+class Histogram:
+    """
+    Counts observed values, e.g. latencies, into buckets per combination of label values
+
+    Observing a value costs one binary search over the bucket bounds and one increment, the
+    cumulative bucket counts Prometheus expects are only built when the metrics are scraped.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = latency_buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        counts = self._values.get(labels)
+        return sum(counts[:-1]) if counts else 0
+
+    def collect(self) -> tuple:
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+        samples = []
+        for labels, counts in values:
+            label_pairs = tuple(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append(('_bucket', label_pairs + (('le', format_value(bound)),), cumulative))
+            samples.append(('_sum', label_pairs, counts[-1]))
+            samples.append(('_count', label_pairs, cumulative))
+        return self.name, 'histogram', self.documentation, samples
+
+
+class Registry:
+    """Collects the metric families of its metrics and of collector functions"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[tuple]]) -> None:
+        """Registers a function returning metric families, called every time the metrics are collected"""
+        self._collectors.append(collector)
+
+    def collect(self) -> list[tuple]:
+        families = [metric.collect() for metric in self._metrics]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception:
+                logger.exception('Metrics collector %s failed', collector)
+        return families
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def escape_label_value(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render(families: Iterable[tuple]) -> str:
+    """Renders metric families in the Prometheus text exposition format"""
+    lines = []
+    for name, kind, documentation, samples in families:
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            if labels:
+                label_str = ','.join(f'{key}="{escape_label_value(val)}"' for key, val in labels)
+                lines.append(f'{name}{suffix}{{{label_str}}} {format_value(value)}')
+            else:
+                lines.append(f'{name}{suffix} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def merge(families_by_source: dict, label: str) -> list[tuple]:
+    """Merges the metric families of several processes, telling their samples apart by `label`"""
+    merged = {}
+    for source, families in sorted(families_by_source.items()):
+        for name, kind, documentation, samples in families:
+            family = merged.setdefault(name, (name, kind, documentation, []))
+            family[3].extend(
+                (suffix, ((label, str(source)),) + labels, value) for suffix, labels, value in samples)
+    return list(merged.values())
+
+
+def gauge(name: str, documentation: str, values: Iterable[tuple]) -> tuple:
+    """Builds a gauge family from (labels, value) pairs, labels being (label name, label value) pairs"""
+    return name, 'gauge', documentation, [('', labels, value) for labels, value in values]
+
+
+def counter(name: str, documentation: str, values: Iterable[tuple]) -> tuple:
+    """Builds a counter family from (labels, value) pairs of totals kept elsewhere"""
+    return name, 'counter', documentation, [('', labels, value) for labels, value in values]
+
+
+def bot_families(bot) -> list[tuple]:
+    """Metric families of a QueuedBot's outbound queue and of its InstrumentedRequest's api calls"""
+    lanes = bot.outbound.stats()
+    endpoints = bot.request.endpoint_stats()
+
+    def per_lane(key):
+        return [((('lane', lane),), stats[key]) for lane, stats in lanes.items()]
+
+    def per_endpoint(key):
+        return [((('endpoint', endpoint),), stats[key]) for endpoint, stats in endpoints.items()]
+
+    return [
+        gauge('gfhelper_outbound_depth', 'Messages waiting in the outbound queue', per_lane('depth')),
+        counter('gfhelper_outbound_sent_total', 'Messages taken from the outbound queue', per_lane('sent')),
+        counter('gfhelper_outbound_wait_seconds_total', 'Time sent messages waited in the outbound queue',
+                [((('lane', lane),), stats['mean_wait'] * stats['sent']) for lane, stats in lanes.items()]),
+        gauge('gfhelper_outbound_wait_seconds_max', 'Longest time a message waited in the outbound queue',
+              per_lane('max_wait')),
+        counter('gfhelper_bot_api_requests_total', 'Bot API calls', per_endpoint('requests')),
+        counter('gfhelper_bot_api_errors_total', 'Bot API calls that failed', per_endpoint('errors')),
+        counter('gfhelper_bot_api_retries_total', 'Bot API calls retried', per_endpoint('retries')),
+        counter('gfhelper_bot_api_connects_total', 'Connections opened to the Bot API', per_endpoint('connects')),
+        counter('gfhelper_bot_api_connect_seconds_total', 'Time spent opening connections to the Bot API',
+                per_endpoint('connect_seconds')),
+        counter('gfhelper_bot_api_tls_seconds_total', 'Time spent in TLS handshakes with the Bot API',
+                per_endpoint('tls_seconds')),
+        counter('gfhelper_bot_api_response_seconds_total', 'Time spent waiting for Bot API calls, retries included',
+                per_endpoint('response_seconds')),
+        gauge('gfhelper_bot_api_response_seconds_max', 'Longest Bot API call', per_endpoint('max_response_seconds')),
+    ]
+
+
+registry = Registry()
+
+update_seconds = registry.register(Histogram(
+    'gfhelper_update_seconds',
+    'Time the dispatcher takes to route an update to its handlers, including conversation lookups'))
+handler_seconds = registry.register(Histogram(
+    'gfhelper_handler_seconds', 'Time a handler callback takes', ('conversation', 'handler')))
+handler_errors = registry.register(Counter(
+    'gfhelper_handler_errors_total', 'Exceptions raised by handler callbacks', ('conversation', 'handler')))
+state_transitions = registry.register(Counter(
+    'gfhelper_conversation_transitions_total', 'Conversation state transitions', ('conversation', 'from', 'to')))
+
+
+def state_label(state: object) -> str:
+    if state is None:
+        return 'none'
+    if state == ConversationHandler.END:
+        return 'end'
+    return str(state)
+
+
+def timed_callback(callback: Callable, conversation: ConversationHandler = None) -> Callable:
+    """Wraps a handler callback to record its latency, its errors and the state transitions it makes"""
+    conversation_name = conversation.name if conversation else ''
+    labels = (conversation_name or '', callback.__name__)
+
+    @functools.wraps(callback)
+    def timed(update: Update, context: CallbackContext):
+        if conversation is not None and isinstance(update, Update):
+            old_state = conversation.conversations.get(conversation._get_key(update))
+            # a state that is still being handled asynchronously is (old state, Promise)
+            if isinstance(old_state, tuple):
+                old_state = old_state[0]
+        start = time.perf_counter()
+        try:
+            new_state = callback(update, context)
+        except Exception:
+            handler_errors.inc(labels)
+            raise
+        finally:
+            handler_seconds.observe(labels, time.perf_counter() - start)
+        if conversation is not None and isinstance(update, Update):
+            state_transitions.inc((conversation_name, 'start' if old_state is None else state_label(old_state),
+                                   state_label(old_state if new_state is None else new_state)))
+        return new_state
+
+    timed.instrumented = True
+    return timed
+
+
+def instrument_handler(handler: Handler, conversation: ConversationHandler = None) -> None:
+    """Wraps the callback of `handler`, or of every handler of a ConversationHandler, in place"""
+    if isinstance(handler, CommandDispatcher):
+        for command in handler.registry.loaded():
+            for command_handler in command.handlers:
+                instrument_handler(command_handler)
+        handler.registry.on_load.append(
+            lambda command: [instrument_handler(command_handler) for command_handler in command.handlers])
+    elif isinstance(handler, ConversationHandler):
+        for state_handlers in (handler.entry_points, handler.fallbacks, *handler.states.values()):
+            for state_handler in state_handlers:
+                instrument_handler(state_handler, handler)
+    elif handler.callback is not None and not getattr(handler.callback, 'instrumented', False):
+        handler.callback = timed_callback(handler.callback, conversation)
+
+
+def instrument_dispatcher(dispatcher: Dispatcher) -> None:
+    """Records metrics for every handler registered on `dispatcher` and for the routing of each update"""
+    for handlers in dispatcher.handlers.values():
+        for handler in handlers:
+            instrument_handler(handler)
+
+    process_update = dispatcher.process_update
+
+    @functools.wraps(process_update)
+    def timed_process_update(update: object) -> None:
+        start = time.perf_counter()
+        try:
+            process_update(update)
+        finally:
+            update_seconds.observe((), time.perf_counter() - start)
+
+    dispatcher.process_update = timed_process_update
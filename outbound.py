@@ -0,0 +1,253 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from concurrent.futures import Future, TimeoutError
+from dataclasses import dataclass, field
+from typing import Callable, Union
+
+from telegram import Bot, Message
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+# priority lanes, lower values are sent first
+INTERACTIVE, NOTIFICATION, BULK = range(3)
+lane_names = ('interactive', 'notification', 'bulk')
+
+# number of times a send is retried after telegram answers with HTTP 429
+max_flood_retries = 3
+
+
+class TokenBucket:
+    """
+    Allows `rate` events per second on average, with bursts of up to `capacity` events
+
+    Not thread safe, callers hold the lock of the OutboundQueue that owns the bucket.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """Returns the number of seconds until a token is available, 0 if one is available now"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass(order=True)
+class OutboundItem:
+    priority: int
+    seq: int
+    chat_id: Union[int, str] = field(compare=False)
+    send: Callable = field(compare=False)
+    future: Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    retries: int = field(default=0, compare=False)
+
+
+class OutboundQueue:
+    """
+    Central queue for every message the bot sends
+
+    Sends are taken in priority order, interactive replies before developer notifications before
+    bulk sends, and spread out by a global token bucket and a token bucket per chat so that the
+    bot stays under telegram's flood limits. A small number of worker threads make the actual api
+    calls. Sends that are flood limited anyway are retried after the delay telegram asks for.
+
+    Parameters
+    ----------
+    rate
+        messages per second the bot sends in total
+    chat_rate
+        messages per second the bot sends to a single chat
+    chat_burst
+        messages the bot may send to a single chat at once, e.g. a reply followed by a prompt
+    workers
+        number of threads making api calls
+    """
+
+    def __init__(self, rate: float = 30, chat_rate: float = 1, chat_burst: float = 3, workers: int = 4):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+
+        self._global_bucket = TokenBucket(rate, rate)
+        self._chat_buckets = {}
+        self._ready = []
+        # (time the item may be sent at, item) for items waiting on their chat's bucket
+        self._delayed = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True
+
+        self._sent = [0] * len(lane_names)
+        self._total_wait = [0.0] * len(lane_names)
+        self._max_wait = [0.0] * len(lane_names)
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f'OutboundQueue_{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, chat_id: Union[int, str], send: Callable, priority: int = INTERACTIVE) -> Future:
+        """Queues `send`, a function making one api call to `chat_id`, and returns the Future of its result"""
+        future = Future()
+        item = OutboundItem(priority, next(self._seq), chat_id, send, future, time.monotonic())
+        if priority != INTERACTIVE:
+            # nobody waits for the result of a lower priority send, so its failure is logged here
+            future.add_done_callback(lambda done: self._log_failure(done, chat_id, priority))
+        with self._cond:
+            heapq.heappush(self._ready, item)
+            self._cond.notify()
+        return future
+
+    @staticmethod
+    def _log_failure(future: Future, chat_id: Union[int, str], priority: int) -> None:
+        err = None if future.cancelled() else future.exception()
+        if err is not None:
+            logger.error('Failed to send a %s message to %s', lane_names[priority], chat_id, exc_info=err)
+
+    def _chat_bucket(self, chat_id: Union[int, str], now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # buckets that have refilled behave like new ones and can be dropped
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_full(now)
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _next_item(self) -> OutboundItem:
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    heapq.heappush(self._ready, heapq.heappop(self._delayed)[1])
+
+                wait = None
+                if self._ready:
+                    wait = self._global_bucket.delay(now)
+                    if wait == 0:
+                        item = heapq.heappop(self._ready)
+                        chat_bucket = self._chat_bucket(item.chat_id, now)
+                        chat_wait = chat_bucket.delay(now)
+                        if chat_wait > 0:
+                            heapq.heappush(self._delayed, (now + chat_wait, item))
+                            continue
+
+                        self._global_bucket.consume(now)
+                        chat_bucket.consume(now)
+                        self._record_wait(item, now)
+                        return item
+
+                if self._delayed:
+                    delayed_wait = self._delayed[0][0] - now
+                    wait = delayed_wait if wait is None else min(wait, delayed_wait)
+                self._cond.wait(wait)
+
+    def _record_wait(self, item: OutboundItem, now: float) -> None:
+        waited = now - item.enqueued_at
+        self._sent[item.priority] += 1
+        self._total_wait[item.priority] += waited
+        self._max_wait[item.priority] = max(self._max_wait[item.priority], waited)
+
+    def _work(self) -> None:
+        while True:
+            item = self._next_item()
+            if item is None:
+                return
+            # a retried send is running already, the others may have been cancelled while queued
+            if not item.retries and not item.future.set_running_or_notify_cancel():
+                continue
+            try:
+                item.future.set_result(item.send())
+            except RetryAfter as err:
+                if item.retries >= max_flood_retries:
+                    item.future.set_exception(err)
+                    continue
+                logger.warning('Flood limited sending to %s, retrying in %ss', item.chat_id, err.retry_after)
+                item.retries += 1
+                with self._cond:
+                    heapq.heappush(self._delayed, (time.monotonic() + err.retry_after, item))
+                    self._cond.notify()
+            except Exception as err:
+                item.future.set_exception(err)
+
+    def stats(self) -> dict:
+        """Returns the number of queued sends and the wait times of sent messages per priority lane"""
+        with self._cond:
+            depth = [0] * len(lane_names)
+            for item in itertools.chain(self._ready, (item for _, item in self._delayed)):
+                depth[item.priority] += 1
+            return {
+                name: {
+                    'depth': depth[lane],
+                    'sent': self._sent[lane],
+                    'mean_wait': self._total_wait[lane] / self._sent[lane] if self._sent[lane] else 0.0,
+                    'max_wait': self._max_wait[lane],
+                }
+                for lane, name in enumerate(lane_names)
+            }
+
+    def stop(self) -> None:
+        """Stops the workers once they finish their current send, queued sends fail with NetworkError"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+        with self._cond:
+            dropped = self._ready + [item for _, item in self._delayed]
+            self._ready, self._delayed = [], []
+        for item in dropped:
+            # callers waiting for an interactive send would otherwise wait forever
+            if not item.future.cancelled():
+                item.future.set_exception(NetworkError('The outbound queue was stopped before sending'))
+
+
+class QueuedBot(Bot):
+    """
+    Bot that sends every message through an OutboundQueue
+
+    `send_message` takes an extra `priority` keyword. Interactive sends wait for their turn and
+    return the sent Message like a normal Bot, lower priority sends return the Future of the
+    Message straight away so the caller is not held up. An interactive send that is still queued
+    after `send_timeout` seconds is cancelled and raises TimedOut.
+    """
+
+    def __init__(self, *args, outbound: OutboundQueue, send_timeout: float = 60, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbound = outbound
+        self.send_timeout = send_timeout
+
+    def send_message(self, chat_id, text, *args, priority: int = INTERACTIVE, **kwargs) -> Union[Message, Future]:
+        future = self.outbound.submit(
+            chat_id, lambda: super(QueuedBot, self).send_message(chat_id, text, *args, **kwargs), priority)
+        if priority == INTERACTIVE:
+            try:
+                return future.result(timeout=self.send_timeout)
+            except TimeoutError:
+                future.cancel()
+                raise TimedOut() from None
+        return future
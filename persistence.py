@@ -0,0 +1,276 @@
+import copy
+import json
+import pickle
+import sqlite3
+import logging
+import threading
+
+from collections import defaultdict
+from typing import Callable
+from telegram.ext import BasePersistence, ConversationHandler
+from telegram.ext.utils.promise import Promise
+
+logger = logging.getLogger(__name__)
+
+USER_DATA, CHAT_DATA, BOT_DATA, CONVERSATION = 'user', 'chat', 'bot', 'conversation'
+
+
+class UserDataStore(defaultdict):
+    """
+    The user_data of the users seen since the bot started, other users' are loaded when they are needed
+
+    Users whose user_data is dropped from memory, e.g. by `eviction.StateEvictor`, are loaded
+    again by `load` on their next update instead of starting over with an empty dict.
+    """
+
+    def __init__(self, load: Callable[[int], dict], *args):
+        super().__init__(dict, *args)
+        self.load = load
+        self._lock = threading.Lock()
+
+    def __missing__(self, user_id: int) -> dict:
+        with self._lock:
+            # another thread may have loaded it while this one waited
+            if dict.__contains__(self, user_id):
+                return dict.__getitem__(self, user_id)
+            data = self[user_id] = self.load(user_id)
+            return data
+
+    def __copy__(self) -> 'UserDataStore':
+        return UserDataStore(self.load, self)
+
+    copy = __copy__
+
+
+class SqlitePersistence(BasePersistence):
+    """
+    Persists conversation states, user_data, chat_data and bot_data to a local SQLite database
+
+    Handlers never wait on the database: every update only pickles the changed value into an
+    in-memory batch, and a background thread writes the batch to disk in a single transaction
+    every `flush_interval` seconds. Later writes to the same key within one batch overwrite the
+    earlier ones, so a busy conversation costs one row write per flush instead of one per update.
+
+    user_data is not read from disk on startup, each user's is read by `load_user_data` on
+    their first update, so memory only holds the users who are actually active.
+
+    Several processes can share one database with `shared_user_data`. A user's updates can then
+    be handled by a different process in each chat, so their user_data is read again before every
+    update and written as soon as it changes instead of waiting for the next flush. Two updates of
+    the same user handled at the same moment in two processes still overwrite each other's
+    changes, the last one written is kept. chat_data, bot_data and conversation states are only
+    read on startup, so each of them should only be changed by one process.
+
+    Parameters
+    ----------
+    filename
+        path to the SQLite database file
+    flush_interval
+        maximum number of seconds a change stays in memory before it is written to disk
+    shared_user_data
+        whether other processes change the user_data in the same database
+    """
+
+    def __init__(self, filename: str, flush_interval: float = 1.0,
+                 store_user_data: bool = True, store_chat_data: bool = True,
+                 store_bot_data: bool = True, shared_user_data: bool = False):
+        super().__init__(store_user_data=store_user_data, store_chat_data=store_chat_data,
+                         store_bot_data=store_bot_data)
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.shared_user_data = shared_user_data
+
+        self._user_data = None
+        self._chat_data = None
+        self._bot_data = None
+        self._conversations = {}
+        # user id -> size of the user's pickled user_data, and their total
+        self._user_data_sizes = {}
+        self.user_data_bytes = 0
+
+        # (kind, key) -> pickled value, or None if the row should be deleted
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS store ('
+            'kind TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+            'PRIMARY KEY (kind, key))'
+        )
+        self._connection.commit()
+
+        self._writer = threading.Thread(
+            target=self._write_behind, name='SqlitePersistence', daemon=True)
+        self._writer.start()
+
+    def _load(self, kind: str) -> list:
+        with self._write_lock:
+            cursor = self._connection.execute(
+                'SELECT key, value FROM store WHERE kind = ?', (kind,))
+            return [(key, pickle.loads(value)) for key, value in cursor]
+
+    def _enqueue(self, kind: str, key: str, value: object) -> int:
+        """Queues `value` to be written, returns the size of the pickled value"""
+        blob = None if value is None else pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._pending_lock:
+            self._pending[(kind, key)] = blob
+        return len(blob) if blob else 0
+
+    def _track_size(self, user_id: int, size: int) -> None:
+        with self._pending_lock:
+            self.user_data_bytes += size - self._user_data_sizes.get(user_id, 0)
+            self._user_data_sizes[user_id] = size
+
+    def _write_behind(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._write_pending()
+            except sqlite3.Error:
+                logger.exception('Failed to write persistence batch to %s', self.filename)
+
+    def _write_pending(self) -> None:
+        # taking the batch while holding the write lock means readers see every change either
+        # still pending or already on disk
+        with self._write_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            upserts = [(kind, key, blob) for (kind, key), blob in pending.items() if blob is not None]
+            deletes = [(kind, key) for (kind, key), blob in pending.items() if blob is None]
+            try:
+                with self._connection:
+                    self._connection.executemany(
+                        'INSERT OR REPLACE INTO store (kind, key, value) VALUES (?, ?, ?)', upserts)
+                    self._connection.executemany(
+                        'DELETE FROM store WHERE kind = ? AND key = ?', deletes)
+            except sqlite3.Error:
+                # put the batch back to be retried on the next flush, behind changes made since
+                with self._pending_lock:
+                    self._pending = {**pending, **self._pending}
+                raise
+
+    def get_user_data(self) -> defaultdict:
+        if self._user_data is None:
+            self._user_data = UserDataStore(self.load_user_data)
+        return self._user_data
+
+    def load_user_data(self, user_id: int) -> dict:
+        """Reads one user's user_data, including changes that are not written to disk yet"""
+        key = (USER_DATA, str(user_id))
+        with self._write_lock:
+            with self._pending_lock:
+                pending = key in self._pending
+                blob = self._pending.get(key)
+            if not pending:
+                row = self._connection.execute(
+                    'SELECT value FROM store WHERE kind = ? AND key = ?', key).fetchone()
+                blob = row[0] if row else None
+        self._track_size(user_id, len(blob) if blob else 0)
+        return pickle.loads(blob) if blob else {}
+
+    def evict_user_data(self, user_id: int) -> None:
+        """Forgets one user's user_data until it is loaded again, it stays on disk"""
+        if self._user_data is not None:
+            self._user_data.pop(user_id, None)
+        with self._pending_lock:
+            self.user_data_bytes -= self._user_data_sizes.pop(user_id, 0)
+
+    def get_chat_data(self) -> defaultdict:
+        if self._chat_data is None:
+            self._chat_data = defaultdict(dict)
+            for key, value in self._load(CHAT_DATA):
+                self._chat_data[int(key)] = value
+        return self._chat_data
+
+    def get_bot_data(self) -> dict:
+        if self._bot_data is None:
+            rows = self._load(BOT_DATA)
+            self._bot_data = rows[0][1] if rows else {}
+        return self._bot_data
+
+    def get_conversations(self, name: str) -> dict:
+        if name not in self._conversations:
+            self._conversations[name] = {
+                tuple(json.loads(key)): state
+                for key, state in self._load(f'{CONVERSATION}:{name}')
+            }
+        return self._conversations[name]
+
+    def update_conversation(self, name: str, key: tuple, new_state: object) -> None:
+        if isinstance(new_state, tuple) and len(new_state) == 2 and isinstance(new_state[1], Promise):
+            # the handler is still running, keep the old state until its result is known
+            old_state, promise = new_state
+            # ConversationHandler passes the pending entry it just stored as the old state
+            while isinstance(old_state, tuple) and len(old_state) == 2 and isinstance(old_state[1], Promise):
+                old_state = old_state[0]
+            promise.add_done_callback(
+                lambda result: self._update_resolved_conversation(name, key, old_state, result))
+            new_state = old_state
+
+        self._enqueue(f'{CONVERSATION}:{name}', json.dumps(key), new_state)
+
+    def _update_resolved_conversation(self, name: str, key: tuple,
+                                      old_state: object, result: object) -> None:
+        new_state = old_state if result is None else result
+        if new_state == ConversationHandler.END:
+            new_state = None
+        self._enqueue(f'{CONVERSATION}:{name}', json.dumps(key), new_state)
+
+    def update_user_data(self, user_id: int, data: dict) -> None:
+        if self._user_data is None:
+            self._user_data = UserDataStore(self.load_user_data)
+        if self._user_data.get(user_id) == data:
+            return
+        self._user_data[user_id] = data
+        self._track_size(user_id, self._enqueue(USER_DATA, str(user_id), data))
+        if self.shared_user_data:
+            self._write_pending()
+
+    def update_chat_data(self, chat_id: int, data: dict) -> None:
+        if self._chat_data is None:
+            self._chat_data = defaultdict(dict)
+        if self._chat_data.get(chat_id) == data:
+            return
+        self._chat_data[chat_id] = data
+        self._enqueue(CHAT_DATA, str(chat_id), data)
+
+    def update_bot_data(self, data: dict) -> None:
+        if self._bot_data == data:
+            return
+        self._bot_data = data
+        self._enqueue(BOT_DATA, '', data)
+
+    def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if not self.shared_user_data:
+            return
+        data = self.load_user_data(user_id)
+        if self._user_data is not None:
+            self._user_data[user_id] = data
+        # in place, handlers of the same user in this process hold on to the dict
+        for key in user_data.keys() - data.keys():
+            user_data.pop(key, None)
+        user_data.update(copy.deepcopy(data))
+
+    def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    def flush(self) -> None:
+        """Writes everything that is still pending to disk and stops the background writer"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._writer.join()
+        self._write_pending()
+        self._connection.close()
@@ -0,0 +1,116 @@
+import datetime as dt
+
+import common
+import utils
+
+from typing import NamedTuple
+
+MINUTES_PER_DAY = 24 * 60
+one_minute = dt.timedelta(minutes=1)
+
+# clock labels of every minute of the day, so that planned times are formatted by indexing
+minute_labels = tuple(
+    dt.time(hour=minute // 60, minute=minute % 60).strftime(common.time_format)
+    for minute in range(MINUTES_PER_DAY)
+)
+
+# telegram rejects messages longer than this
+max_message_length = 4096
+
+
+class Member(NamedTuple):
+    """A member of an outing and the minutes they need to travel and to get ready"""
+    name: str
+    travel_minutes: int
+    ready_minutes: int
+
+
+def plan_leave_times(reach_time: dt.datetime, travel_minutes: list[int],
+                     ready_minutes: list[int]) -> tuple[list[int], list[int]]:
+    """
+    Calculates when every member has to leave and start getting ready to arrive at `reach_time`
+
+    All times are whole minutes since the unix epoch, so a plan for any number of members is
+    plain integer arithmetic without creating a datetime object per member.
+
+    Parameters
+    ----------
+    reach_time
+        'aware' datetime object of the time everyone needs to arrive by
+    travel_minutes
+        minutes each member needs to travel
+    ready_minutes
+        minutes each member needs to get ready, in the same order as `travel_minutes`
+
+    Returns
+    -------
+    tuple[list[int], list[int]]
+        the leave times and the get ready times of each member
+
+    Examples
+    --------
+    >>> plan_leave_times(datetime(1970, 1, 1, 9, 30, tzinfo=timezone.utc), [45, 30], [30, 0])
+    ([525, 540], [495, 540])
+    """
+    reach = utils.to_epoch_minutes(reach_time)
+    leave_times = [reach - travel for travel in travel_minutes]
+    get_ready_times = [leave - ready for leave, ready in zip(leave_times, ready_minutes)]
+    return leave_times, get_ready_times
+
+
+def label_epoch_minutes(epoch_minutes: list[int], tz_name: str = utils.DEFAULT_TIMEZONE) -> list[str]:
+    """
+    Formats minutes since the unix epoch as clock times in the given timezone
+
+    When the timezone's UTC offset is the same for all the times, every label is looked up from
+    `minute_labels`. Otherwise, e.g. across a DST transition, each time is converted on its own.
+    """
+    if not epoch_minutes:
+        return []
+
+    epoch = dt.datetime(1970, 1, 1, tzinfo=utils.UTC)
+    earliest = epoch + dt.timedelta(minutes=min(epoch_minutes))
+    latest = epoch + dt.timedelta(minutes=max(epoch_minutes))
+
+    if utils.has_utc_offset_change(earliest, latest, tz_name):
+        return [
+            utils.convert_utc_to_local(epoch + dt.timedelta(minutes=minute), tz_name)
+            .strftime(common.time_format)
+            for minute in epoch_minutes
+        ]
+
+    offset = utils.convert_utc_to_local(earliest, tz_name).utcoffset() // one_minute
+    return [minute_labels[(minute + offset) % MINUTES_PER_DAY] for minute in epoch_minutes]
+
+
+def outing_summary_texts(reach_time: dt.datetime, members: list[Member],
+                         tz_name: str = utils.DEFAULT_TIMEZONE) -> list[str]:
+    """
+    Returns the summary of an outing as messages short enough to send to telegram
+
+    Members are listed from the one who has to start getting ready the earliest.
+    """
+    leave_times, get_ready_times = plan_leave_times(
+        reach_time,
+        [member.travel_minutes for member in members],
+        [member.ready_minutes for member in members]
+    )
+    leave_labels = label_epoch_minutes(leave_times, tz_name)
+    get_ready_labels = label_epoch_minutes(get_ready_times, tz_name)
+    order = sorted(range(len(members)), key=get_ready_times.__getitem__)
+
+    local_reach_time = utils.convert_utc_to_local(reach_time, tz_name)
+    texts = []
+    text = (
+        common.hedgehog +
+        f"To reach by {local_reach_time.strftime(common.time_format)}:\n"
+    )
+    for i in order:
+        line = f"{members[i].name}: get ready by {get_ready_labels[i]}, leave at {leave_labels[i]}\n"
+        if len(text) + len(line) > max_message_length:
+            texts.append(text)
+            text = ""
+        text += line
+    texts.append(text)
+
+    return texts
@@ -0,0 +1,166 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PipelinedPoller:
+    """
+    Long polls getUpdates on its own thread while the batches already received are being handled
+
+    `Updater.start_polling` waits for a batch to be handled before it asks for the next one. Here
+    the fetching thread sends the next request as soon as a batch has arrived, so the long poll
+    is already waiting at telegram while the handling thread works through the batch. At most
+    `prefetch` batches are kept waiting: when the handlers fall behind, the fetching thread stops
+    sending requests until the handling thread takes the next batch.
+
+    Asking for the updates after a batch confirms that batch to telegram, which does not send it
+    again. So every batch is written to a journal in SQLite, together with the offset of the next
+    request, before the next request is sent, and each update is deleted from the journal once
+    `process_update` returns. Updates still in the journal on start are passed on before any new
+    ones, so a crash neither skips a batch nor passes on its finished updates again, only the
+    update being passed on when the process died may be passed on twice. Handlers that
+    `process_update` runs asynchronously can still be working on an update after it has left the
+    journal, if the process dies before they finish the update is not handled again.
+
+    Parameters
+    ----------
+    filename
+        path to the SQLite database file of the journal
+    fetch
+        called with the offset, the most updates to return and the long poll timeout in seconds,
+        returns the raw updates like the getUpdates method of the Bot API
+    process_update
+        called with every raw update, in the order of their update ids
+    batch_size
+        most updates fetched with one request, telegram accepts up to 100
+    prefetch
+        most batches waiting to be handled
+    poll_timeout
+        seconds telegram keeps a request open while there are no updates
+    retry_backoff
+        seconds to wait before sending a request again after it failed
+    """
+
+    def __init__(self, filename: str, fetch: Callable[[int, int, int], list], process_update: Callable[[dict], None],
+                 batch_size: int = 100, prefetch: int = 2, poll_timeout: int = 10, retry_backoff: float = 1.0):
+        self.filename = filename
+        self.fetch = fetch
+        self.process_update = process_update
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.retry_backoff = retry_backoff
+
+        self._batches = queue.Queue()
+        # taken by the fetching thread before each request, given back when a batch is taken off the queue
+        self._slots = threading.Semaphore(prefetch)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS polled_updates (update_id INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS polling_offset (id INTEGER PRIMARY KEY CHECK (id = 0), offset INTEGER NOT NULL)')
+        self._connection.commit()
+        self._load()
+
+        self._fetch_thread = threading.Thread(target=self._fetch_batches, name='PollingFetcher', daemon=True)
+        self._work_thread = threading.Thread(target=self._work, name='PollingWorker', daemon=True)
+
+    def _load(self) -> None:
+        row = self._connection.execute('SELECT offset FROM polling_offset').fetchone()
+        # without a stored offset telegram starts from the oldest update it has not had confirmed
+        self.offset = row[0] if row else None
+        self._unfinished = [json.loads(data) for data, in self._connection.execute(
+            'SELECT data FROM polled_updates ORDER BY update_id')]
+        if self._unfinished:
+            logger.info('Loaded %d updates that were not handled before the last stop', len(self._unfinished))
+
+    def buffered(self) -> int:
+        """Returns the number of batches waiting to be handled"""
+        return self._batches.qsize()
+
+    def start(self) -> None:
+        self._fetch_thread.start()
+        self._work_thread.start()
+
+    def _fetch_batches(self) -> None:
+        while not self._stopped.is_set():
+            if not self._slots.acquire(timeout=self.poll_timeout):
+                continue
+            try:
+                batch = self.fetch(self.offset, self.batch_size, self.poll_timeout)
+            except Exception as err:
+                self._slots.release()
+                logger.warning('Failed to fetch updates: %s', err)
+                self._stopped.wait(self.retry_backoff)
+                continue
+
+            batch = [data for data in batch if self.offset is None or data['update_id'] >= self.offset]
+            if not batch or not self._journal(batch):
+                self._slots.release()
+                continue
+            self._batches.put(batch)
+
+    def _journal(self, batch: list) -> bool:
+        """Writes the batch and the offset after it to disk, returns False if the poller was stopped"""
+        offset = batch[-1]['update_id'] + 1
+        with self._lock:
+            # not confirmed to telegram yet, so it is sent again after the restart
+            if self._stopped.is_set():
+                return False
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO polled_updates (update_id, data) VALUES (?, ?)',
+                    [(data['update_id'], json.dumps(data)) for data in batch])
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO polling_offset (id, offset) VALUES (0, ?)', (offset,))
+        self.offset = offset
+        return True
+
+    def _work(self) -> None:
+        if not self._process(self._unfinished):
+            return
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+            self._slots.release()
+            if not self._process(batch):
+                return
+
+    def _process(self, batch: list) -> bool:
+        """Handles the updates of a batch in order, returns False if the poller was stopped before the end"""
+        for data in batch:
+            if self._stopped.is_set():
+                return False
+            try:
+                self.process_update(data)
+            except Exception:
+                logger.exception('Failed to process update %s', data.get('update_id'))
+            with self._lock, self._connection:
+                self._connection.execute('DELETE FROM polled_updates WHERE update_id = ?', (data['update_id'],))
+        return True
+
+    def stop(self) -> None:
+        """
+        Stops fetching and handling after the update that is being handled, the batches that are
+        left stay in the journal and are handled after the next start
+        """
+        with self._lock:
+            self._stopped.set()
+        self._batches.put(None)
+        for thread in (self._work_thread, self._fetch_thread):
+            if thread.is_alive():
+                # the fetching thread may be waiting for telegram's answer to a long poll
+                thread.join(self.poll_timeout + 5 if thread is self._fetch_thread else None)
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,219 @@
+import importlib
+import importlib.util
+import logging
+import pkgutil
+import threading
+import time
+
+from typing import Callable, NamedTuple
+
+from telegram import Update
+from telegram.ext import BasePersistence, ConversationHandler, Handler, InlineQueryHandler
+
+logger = logging.getLogger(__name__)
+
+
+class Command(NamedTuple):
+    """
+    What a module of the commands package declares, as its `command` attribute
+
+    Parameters
+    ----------
+    name
+        the command without the slash, the module has to be named the same, and so does its
+        persistent conversation if it has one, so that updates can be routed to the module
+        before it is imported
+    description
+        line about the command in the /help list, None to leave it out
+    help
+        the reply to /help <name>, None if there is none
+    handlers
+        tried in order for /<name>, a ConversationHandler declares the conversation's entry
+        points and states and is also tried for every message of a chat in the conversation
+    user_data_keys
+        keys of user_data the command's conversation only needs while it is going on, they are
+        removed when the conversation times out
+    """
+    name: str
+    description: str
+    help: str
+    handlers: list
+    user_data_keys: tuple = ()
+
+
+def command_name(text: str) -> str:
+    """Returns the command of a message like '/est@bot 930a', without the slash and the bot's name"""
+    return text[1:].split(None, 1)[0].split('@', 1)[0].lower() if text.startswith('/') else ''
+
+
+class CommandRegistry:
+    """
+    Finds the commands declared by the modules of a package and imports each module on its first use
+
+    Parameters
+    ----------
+    package
+        the package the command modules are in
+    """
+
+    def __init__(self, package: str):
+        self.package = package
+        spec = importlib.util.find_spec(package)
+        self.names = sorted(module.name for module in pkgutil.iter_modules(spec.submodule_search_locations))
+        # called with every command once its module is imported
+        self.on_load: list[Callable[[Command], None]] = []
+        self._commands = {}
+        self._lock = threading.RLock()
+
+    def get(self, name: str) -> Command:
+        """Returns the command `name`, importing its module if needed, or None if there is no such command"""
+        command = self._commands.get(name)
+        if command is None and name in self.names:
+            with self._lock:
+                if name not in self._commands:
+                    self._commands[name] = self._load(name)
+                command = self._commands[name]
+        return command
+
+    def _load(self, name: str) -> Command:
+        start = time.perf_counter()
+        command = getattr(importlib.import_module(f'{self.package}.{name}'), 'command', None)
+        if command is None:
+            return None
+        if command.name != name:
+            raise ValueError(f'{self.package}.{name} declares the command {command.name}')
+        for hook in self.on_load:
+            hook(command)
+        logger.info('Loaded /%s in %.1fms', name, (time.perf_counter() - start) * 1000)
+        return command
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._commands
+
+    def all_loaded(self) -> bool:
+        return len(self._commands) == len(self.names)
+
+    def loaded(self) -> list[Command]:
+        return [command for command in list(self._commands.values()) if command is not None]
+
+    def all(self) -> list[Command]:
+        """Imports every command module and returns their commands"""
+        return [command for command in map(self.get, self.names) if command is not None]
+
+    def preload(self) -> threading.Thread:
+        """Imports the command modules that were not needed yet on a background thread"""
+        thread = threading.Thread(target=self.all, name='PreloadCommands', daemon=True)
+        thread.start()
+        return thread
+
+
+class CommandDispatcher(Handler):
+    """
+    The one handler every command of a CommandRegistry is dispatched through
+
+    Commands are looked up by name in a dict instead of asking every handler in turn, so the
+    cost of routing an update does not grow with the number of commands. Messages that are not
+    a known command are only offered to the conversations their chat is in the middle of, and
+    inline queries to the inline query handlers.
+
+    Commands are imported when the first update for them arrives, or, for a chat that was in the
+    middle of a conversation when the bot restarted, when the chat's next message arrives.
+
+    Parameters
+    ----------
+    registry
+        the commands to dispatch to
+    persistence
+        the dispatcher's persistence, which persistent conversations are connected to when they are
+        loaded, like `Dispatcher.add_handler` does
+    """
+
+    def __init__(self, registry: CommandRegistry, persistence: BasePersistence = None):
+        super().__init__(callback=None)
+        self.registry = registry
+        self.persistence = persistence
+        # command name -> its handlers
+        self._handlers = {}
+        self._conversations = ()
+        self._inline_handlers = ()
+        # the handler the current thread's update was routed to, for run_async
+        self._routed = threading.local()
+
+        registry.on_load.insert(0, self._add)
+        for command in registry.loaded():
+            self._add(command)
+
+    def _add(self, command: Command) -> None:
+        for handler in command.handlers:
+            if isinstance(handler, ConversationHandler):
+                if handler.persistent and self.persistence:
+                    handler.persistence = self.persistence
+                    handler.conversations = self.persistence.get_conversations(handler.name)
+                self._conversations += (handler,)
+            elif isinstance(handler, InlineQueryHandler):
+                self._inline_handlers += (handler,)
+        self._handlers[command.name] = command.handlers
+
+    @property
+    def run_async(self) -> bool:
+        handler = getattr(self._routed, 'handler', None)
+        return handler.run_async if handler is not None else False
+
+    @run_async.setter
+    def run_async(self, value: bool) -> None:
+        # set by Handler.__init__, whether to run asynchronously is up to the handler an update is routed to
+        pass
+
+    def _load_conversations(self, chat_id: int, user_id: int) -> None:
+        """Imports the commands whose persisted conversation the chat is in the middle of"""
+        for name in self.registry.names:
+            if (not self.registry.is_loaded(name)
+                    and self.persistence.get_conversations(name).get((chat_id, user_id)) is not None):
+                self.registry.get(name)
+
+    def _match(self, update: Update) -> tuple:
+        if update.inline_query is not None:
+            if not self.registry.all_loaded():
+                self.registry.all()
+            handlers = self._inline_handlers
+        else:
+            message = update.effective_message
+            name = command_name(message.text) if message and message.text else ''
+            handlers = self._handlers.get(name) if name else None
+            if handlers is None and name and self.registry.get(name) is not None:
+                handlers = self._handlers.get(name)
+            handlers = handlers or ()
+
+        for handler in handlers:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return handler, check
+
+        chat, user = update.effective_chat, update.effective_user
+        if chat is None or user is None or update.inline_query is not None:
+            return None
+        if self.persistence is not None and not self.registry.all_loaded():
+            self._load_conversations(chat.id, user.id)
+        for conversation in self._conversations:
+            if conversation in handlers or conversation.conversations.get(conversation._get_key(update)) is None:
+                continue
+            check = conversation.check_update(update)
+            if check is not None and check is not False:
+                return conversation, check
+        return None
+
+    def check_update(self, update: object):
+        match = self._match(update) if isinstance(update, Update) else None
+        self._routed.handler = match[0] if match else None
+        return match
+
+    def handle_update(self, update, dispatcher, check_result, context=None):
+        handler, check = check_result
+        return handler.handle_update(update, dispatcher, check, context)
+
+    def collect_additional_context(self, context, update, dispatcher, check_result) -> None:
+        handler, check = check_result
+        handler.collect_additional_context(context, update, dispatcher, check)
+
+
+bot_commands = CommandRegistry('commands')
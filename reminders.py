@@ -0,0 +1,196 @@
+import heapq
+import logging
+import secrets
+import sqlite3
+import threading
+import datetime as dt
+
+from typing import Callable, NamedTuple
+
+from clock import Clock, system_clock
+
+logger = logging.getLogger(__name__)
+
+
+class Reminder(NamedTuple):
+    id: int
+    # 'aware' datetime in UTC
+    due: dt.datetime
+    chat_id: int
+    text: str
+
+
+class ReminderScheduler:
+    """
+    Keeps pending reminders in a heap ordered by due time and fires them in batches when they are due
+
+    Scheduling a reminder is a heap push, O(log n), and cancelling it only drops it from a dict,
+    the heap entry is skipped when it comes up. Neither touches the disk: changes are batched and
+    written to a SQLite table by the scheduler's thread every `flush_interval` seconds, like
+    `persistence.SqlitePersistence`, so arming a reminder does not hold up the reply. Pending
+    reminders are loaded again on start, reminders that became due while the bot was down are
+    fired late unless they are more than `max_lateness` late.
+
+    Parameters
+    ----------
+    filename
+        path to the SQLite database file
+    fire
+        called on the scheduler's thread with the list of reminders that are due
+    flush_interval
+        maximum number of seconds a change stays in memory before it is written to disk
+    max_lateness
+        reminders that are more overdue than this when they come up are dropped instead of fired,
+        e.g. after the bot was down
+    owns
+        called with a chat id, only reminders of chats it returns True for are loaded, so that
+        worker processes sharing the database each fire their own chats' reminders
+    clock
+        clock the due times are compared against
+    """
+
+    def __init__(self, filename: str, fire: Callable[[list[Reminder]], None], flush_interval: float = 1.0,
+                 max_lateness: dt.timedelta = dt.timedelta(minutes=15),
+                 owns: Callable[[int], bool] = lambda chat_id: True, clock: Clock = system_clock):
+        self.filename = filename
+        self.fire = fire
+        self.flush_interval = flush_interval
+        self.max_lateness = max_lateness
+        self.clock = clock
+
+        # id -> Reminder of every pending reminder, and (due timestamp, id) of every scheduled one
+        self._reminders = {}
+        self._heap = []
+        # id -> Reminder to write, or None if the row should be deleted
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._running = False
+
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS reminders ('
+            'id INTEGER PRIMARY KEY, due REAL NOT NULL, chat_id INTEGER NOT NULL, text TEXT NOT NULL)'
+        )
+        self._connection.commit()
+        self._load(owns)
+
+        self._thread = threading.Thread(target=self._run, name='ReminderScheduler', daemon=True)
+
+    def _load(self, owns: Callable[[int], bool]) -> None:
+        for reminder_id, due, chat_id, text in self._connection.execute(
+                'SELECT id, due, chat_id, text FROM reminders'):
+            if owns(chat_id):
+                reminder = Reminder(reminder_id, dt.datetime.fromtimestamp(due, dt.timezone.utc), chat_id, text)
+                self._reminders[reminder_id] = reminder
+                self._heap.append((due, reminder_id))
+        heapq.heapify(self._heap)
+        logger.info('Loaded %d pending reminders', len(self._heap))
+
+    def __len__(self) -> int:
+        return len(self._reminders)
+
+    def start(self) -> None:
+        self._running = True
+        self._thread.start()
+
+    def schedule(self, due: dt.datetime, chat_id: int, text: str) -> int:
+        """Schedules `text` to be sent to `chat_id` at `due`, an 'aware' datetime, and returns the reminder's id"""
+        reminder = Reminder(secrets.randbits(62), due, chat_id, text)
+        entry = (due.timestamp(), reminder.id)
+        with self._cond:
+            self._reminders[reminder.id] = reminder
+            self._pending[reminder.id] = reminder
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                # the thread is waiting for a later reminder
+                self._cond.notify()
+        return reminder.id
+
+    def cancel(self, reminder_id: int) -> bool:
+        """Cancels a pending reminder, returns False if it was already fired or cancelled"""
+        with self._cond:
+            if self._reminders.pop(reminder_id, None) is None:
+                return False
+            self._pending[reminder_id] = None
+            if len(self._heap) > 2 * len(self._reminders) + 1024:
+                # drop the entries of cancelled reminders once they make up most of the heap
+                self._heap = [entry for entry in self._heap if entry[1] in self._reminders]
+                heapq.heapify(self._heap)
+            return True
+
+    def pop_due(self, now: dt.datetime = None) -> list[Reminder]:
+        """Removes and returns the reminders that are due at `now` and drops stale ones"""
+        now = (now or self.clock.now()).timestamp()
+        stale_before = now - self.max_lateness.total_seconds()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                due_timestamp, reminder_id = heapq.heappop(self._heap)
+                reminder = self._reminders.pop(reminder_id, None)
+                if reminder is None:
+                    # cancelled
+                    continue
+                self._pending[reminder_id] = None
+                if due_timestamp < stale_before:
+                    logger.info('Dropping reminder %d that is %.0fs late', reminder_id, now - due_timestamp)
+                    continue
+                due.append(reminder)
+        return due
+
+    def _seconds_to_next(self) -> float:
+        now = self.clock.now().timestamp()
+        wait = self.flush_interval
+        if self._heap:
+            wait = min(wait, max(0.0, self._heap[0][0] - now))
+        return wait
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                self._cond.wait(self._seconds_to_next())
+
+            due = self.pop_due()
+            if due:
+                try:
+                    self.fire(due)
+                except Exception:
+                    logger.exception('Failed to fire %d reminders', len(due))
+            try:
+                self.write_pending()
+            except sqlite3.Error:
+                logger.exception('Failed to write reminders to %s', self.filename)
+
+    def write_pending(self) -> None:
+        """Writes the scheduled and removed reminders to disk"""
+        with self._cond:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        upserts = [(reminder.id, reminder.due.timestamp(), reminder.chat_id, reminder.text)
+                   for reminder in pending.values() if reminder is not None]
+        deletes = [(reminder_id,) for reminder_id, reminder in pending.items() if reminder is None]
+        try:
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO reminders (id, due, chat_id, text) VALUES (?, ?, ?, ?)', upserts)
+                self._connection.executemany('DELETE FROM reminders WHERE id = ?', deletes)
+        except sqlite3.Error:
+            # put the batch back to be retried on the next write, behind changes made since
+            with self._cond:
+                self._pending = {**pending, **self._pending}
+            raise
+
+    def stop(self) -> None:
+        """Stops the scheduler's thread and writes everything that is still pending to disk"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.write_pending()
+        self._connection.close()
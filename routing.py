@@ -0,0 +1,770 @@
+import array
+import bisect
+import csv
+import functools
+import itertools
+import logging
+import math
+import os
+import pickle
+import re
+import threading
+import time
+import datetime as dt
+
+from collections import defaultdict
+from typing import Iterator, NamedTuple, Optional
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+# metres per degree of latitude
+METRES_PER_DEGREE = 111_195
+# seconds, later than any time of a timetable
+UNREACHABLE = 2 ** 31
+SECONDS_PER_DAY = 24 * 3600
+# the files of a GTFS feed that the network is built from, all but stops.txt, trips.txt and
+# stop_times.txt are optional
+gtfs_files = ('agency.txt', 'stops.txt', 'trips.txt', 'stop_times.txt', 'calendar.txt', 'calendar_dates.txt',
+              'transfers.txt')
+# stops.txt location types of stops and platforms, and of stations that group them
+STOP, STATION = '0', '1'
+weekdays = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+# calendar_dates.txt exception types
+SERVICE_ADDED, SERVICE_REMOVED = '1', '2'
+# a route query, e.g. "from Bishan to Raffles Place"
+route_regex = re.compile(r'\s+to\s+', re.IGNORECASE)
+
+
+class Stop(NamedTuple):
+    id: str
+    code: str
+    name: str
+
+
+class Route(NamedTuple):
+    """The answer to a route query, the names of the stops as the feed spells them and 'aware' datetimes in UTC"""
+    origin: str
+    destination: str
+    departure: dt.datetime
+    arrival: dt.datetime
+
+    @property
+    def minutes(self) -> int:
+        return math.ceil((self.arrival - self.departure).total_seconds() / 60)
+
+
+class Pattern(NamedTuple):
+    """
+    The trips of a route that stop at the same stops on the same service days, in the order
+    they leave, none overtaking another, so that the trip after a trip is never earlier at a stop
+
+    Times are seconds since the start of the service day, the arrivals and departures of every
+    trip at the i-th stop of the pattern are arrivals[i] and departures[i]. Both are the same
+    array when the trips do not wait at their stops.
+    """
+    service: int
+    stops: tuple[int, ...]
+    arrivals: tuple[array.array, ...]
+    departures: tuple[array.array, ...]
+
+    def reversed(self) -> 'Pattern':
+        """The pattern with time running backwards, see `Timetable.reversed`"""
+        negated = {}
+
+        def negate(times: array.array) -> array.array:
+            if id(times) not in negated:
+                negated[id(times)] = array.array('i', (-stop_time for stop_time in reversed(times)))
+            return negated[id(times)]
+
+        return Pattern(self.service, self.stops[::-1],
+                       tuple(negate(times) for times in reversed(self.departures)),
+                       tuple(negate(times) for times in reversed(self.arrivals)))
+
+
+class Timetable(NamedTuple):
+    """
+    The patterns of a feed and the footpaths between its stops, laid out for `Timetable.earliest_arrival`
+
+    Parameters
+    ----------
+    patterns
+        every pattern of the feed
+    stop_patterns
+        of each stop, the (pattern, position of the stop in the pattern) of the patterns that stop there
+    footpaths
+        of each stop, the (stop, seconds) of the stops that can be walked to
+    """
+    patterns: list[Pattern]
+    stop_patterns: list[tuple[tuple[int, int], ...]]
+    footpaths: list[tuple[tuple[int, int], ...]]
+
+    def reversed(self) -> 'Timetable':
+        """
+        The timetable with time running backwards: every trip goes the other way, from the time
+        it arrives at its last stop negated to the time it left its first stop negated, and so
+        does every footpath. The earliest arrival at the origin of a search from the destination
+        at -t is the latest departure from the origin that reaches the destination by t.
+        """
+        patterns = [pattern.reversed() for pattern in self.patterns]
+        footpaths = [[] for _ in self.footpaths]
+        for stop, paths in enumerate(self.footpaths):
+            for other, seconds in paths:
+                footpaths[other].append((stop, seconds))
+        return Timetable(patterns, stop_patterns_of(patterns, len(self.stop_patterns)),
+                         [tuple(paths) for paths in footpaths])
+
+    def earliest_arrival(self, sources: dict[int, int], targets: tuple[int, ...], active: bytes,
+                         max_rounds: int = 4) -> int:
+        """
+        Returns the earliest time any of the targets can be reached at from the sources, or `UNREACHABLE`
+
+        RAPTOR (Delling, Pajor and Werneck, Round-Based Public Transit Routing): round k finds
+        the earliest arrivals with k trips. It scans every pattern that stops at a stop the
+        previous round arrived earlier at once, from the first of those stops on, boarding the
+        earliest trip that can still be caught, and then walks from the stops a trip arrived earlier
+        at. Arrivals later than the best arrival at a target so far are dropped.
+
+        Parameters
+        ----------
+        sources
+            the time of the service day the search starts at from each source stop
+        targets
+            the stops to arrive at
+        active
+            whether each service runs on the service day, see `Calendar.active`
+        max_rounds
+            the most trips to take, i.e. one more than the most transfers
+        """
+        patterns = self.patterns
+        stop_patterns = self.stop_patterns
+        footpaths = self.footpaths
+        target_set = frozenset(targets)
+        # the earliest arrival at each stop so far, the earliest arrival by a trip, which can be
+        # walked on from as footpaths are not transitive, and at each stop the last round arrived
+        # earlier at
+        best = [UNREACHABLE] * len(stop_patterns)
+        riding = [UNREACHABLE] * len(stop_patterns)
+        ready = [UNREACHABLE] * len(stop_patterns)
+        for stop, stop_time in sources.items():
+            best[stop] = riding[stop] = stop_time
+        arrival = min(best[target] for target in target_set)
+
+        def walk(rode: dict, improved: dict) -> int:
+            """Walks from the stops arrived earlier at by a trip, returns the best arrival at a target"""
+            best_arrival = arrival
+            for stop, stop_time in rode.items():
+                for other, seconds in footpaths[stop]:
+                    if stop_time + seconds < best_arrival and stop_time + seconds < best[other]:
+                        best[other] = improved[other] = stop_time + seconds
+                        if other in target_set:
+                            best_arrival = stop_time + seconds
+            return best_arrival
+
+        marked = dict(sources)
+        arrival = walk(sources, marked)
+        for _ in range(max_rounds):
+            # the first position each pattern can be boarded at
+            queue = {}
+            for stop, stop_time in marked.items():
+                ready[stop] = stop_time
+                for pattern_index, position in stop_patterns[stop]:
+                    if position < queue.get(pattern_index, UNREACHABLE):
+                        queue[pattern_index] = position
+
+            rode = {}
+            improved = {}
+            for pattern_index, start in queue.items():
+                service, stops, arrivals, departures = patterns[pattern_index]
+                if not active[service]:
+                    continue
+                trip = None
+                for position in range(start, len(stops)):
+                    stop = stops[position]
+                    if trip is not None:
+                        stop_time = arrivals[position][trip]
+                        if stop_time >= arrival:
+                            # and so are the trip's arrivals at the stops after this one
+                            trip = None
+                        elif stop_time < riding[stop]:
+                            riding[stop] = rode[stop] = stop_time
+                            if stop_time < best[stop]:
+                                best[stop] = improved[stop] = stop_time
+                                if stop in target_set:
+                                    arrival = stop_time
+                    if ready[stop] < UNREACHABLE and (trip is None or ready[stop] < departures[position][trip]):
+                        catchable = bisect.bisect_left(departures[position], ready[stop])
+                        if catchable < len(departures[position]) and (trip is None or catchable < trip):
+                            trip = catchable
+
+            for stop in marked:
+                ready[stop] = UNREACHABLE
+            if not rode:
+                break
+            arrival = walk(rode, improved)
+            marked = improved
+        return arrival
+
+
+class Calendar(NamedTuple):
+    """
+    The days each service of a feed runs on
+
+    Parameters
+    ----------
+    services
+        the service ids
+    periods
+        of each service, the first and last day it runs on as ordinals and a bitmask of the
+        weekdays it runs on, Monday first, or None if it only runs on the days it is added on
+    exceptions
+        day ordinal -> service -> whether the service was added on that day or removed
+    """
+    services: list[str]
+    periods: list[Optional[tuple[int, int, int]]]
+    exceptions: dict[int, dict[int, bool]]
+
+    def active(self, day: dt.date) -> bytes:
+        """Returns whether each service runs on the day"""
+        ordinal = day.toordinal()
+        weekday = 1 << day.weekday()
+        active = bytearray(
+            period is not None and period[0] <= ordinal <= period[1] and bool(period[2] & weekday)
+            for period in self.periods
+        )
+        for service, added in self.exceptions.get(ordinal, {}).items():
+            active[service] = added
+        return bytes(active)
+
+
+class TransitNetwork(NamedTuple):
+    """A GTFS feed loaded by `load_gtfs`, with its timetable running forwards and backwards"""
+    stops: list[Stop]
+    timezone: str
+    calendar: Calendar
+    forward: Timetable
+    backward: Timetable
+
+
+def read_table(directory: str, name: str, columns: tuple[str, ...],
+               optional: tuple[str, ...] = ()) -> Iterator[list[str]]:
+    """
+    Yields the values of the given columns of every row of a GTFS file, '' for the optional
+    columns the file does not have
+
+    Raises
+    ------
+    ValueError
+        If the file does not have one of the columns that are not optional
+    """
+    with open(os.path.join(directory, name), newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        header = [column.strip() for column in next(reader, [])]
+        missing = [column for column in columns if column not in header and column not in optional]
+        if missing:
+            raise ValueError(f'{name} has no {", ".join(missing)} column')
+        indices = [header.index(column) if column in header else None for column in columns]
+        for row in reader:
+            yield [row[i].strip() if i is not None and i < len(row) else '' for i in indices]
+
+
+def has_table(directory: str, name: str) -> bool:
+    return os.path.exists(os.path.join(directory, name))
+
+
+def parse_gtfs_time(text: str) -> int:
+    """Returns the seconds since the start of the service day of a time like 25:30:00, or -1 if it is blank"""
+    if not text:
+        return -1
+    hours, minutes, seconds = text.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def parse_gtfs_date(text: str) -> int:
+    """Returns the ordinal of a date like 20220101"""
+    return dt.date(int(text[:4]), int(text[4:6]), int(text[6:8])).toordinal()
+
+
+def interpolate(times: list[int]) -> bool:
+    """
+    Fills in the blank (-1) times between the times of a trip linearly, in place, as GTFS
+    prescribes for stops without times, returns False if the trip's first or last time is blank
+    """
+    if times[0] < 0 or times[-1] < 0:
+        return False
+    previous = 0
+    for i in range(1, len(times)):
+        if times[i] >= 0:
+            for j in range(previous + 1, i):
+                times[j] = times[previous] + (times[i] - times[previous]) * (j - previous) // (i - previous)
+            previous = i
+    return True
+
+
+def stop_patterns_of(patterns: list[Pattern], stop_count: int) -> list[tuple[tuple[int, int], ...]]:
+    stop_patterns = [[] for _ in range(stop_count)]
+    for pattern_index, pattern in enumerate(patterns):
+        for position, stop in enumerate(pattern.stops):
+            stop_patterns[stop].append((pattern_index, position))
+    return [tuple(entries) for entries in stop_patterns]
+
+
+def load_calendar(directory: str, service_ids: set[str]) -> Calendar:
+    """
+    Loads the days the services run on from calendar.txt and calendar_dates.txt, every service
+    runs every day if the feed has neither
+    """
+    services = sorted(service_ids)
+    index = {service_id: service for service, service_id in enumerate(services)}
+    if not has_table(directory, 'calendar.txt') and not has_table(directory, 'calendar_dates.txt'):
+        return Calendar(services, [(1, dt.date.max.toordinal(), 0b1111111)] * len(services), {})
+
+    periods = [None] * len(services)
+    if has_table(directory, 'calendar.txt'):
+        for service_id, start, end, *runs in read_table(
+                directory, 'calendar.txt', ('service_id', 'start_date', 'end_date') + weekdays):
+            if service_id in index:
+                weekday_mask = sum(1 << weekday for weekday, value in enumerate(runs) if value == '1')
+                periods[index[service_id]] = (parse_gtfs_date(start), parse_gtfs_date(end), weekday_mask)
+
+    exceptions = defaultdict(dict)
+    if has_table(directory, 'calendar_dates.txt'):
+        for service_id, date, exception_type in read_table(
+                directory, 'calendar_dates.txt', ('service_id', 'date', 'exception_type')):
+            if service_id in index:
+                exceptions[parse_gtfs_date(date)][index[service_id]] = exception_type == SERVICE_ADDED
+    return Calendar(services, periods, dict(exceptions))
+
+
+class Stops(NamedTuple):
+    """The stops of stops.txt, see `load_stops`"""
+    stops: list[Stop]
+    # stop id -> stop
+    index: dict[str, int]
+    # stop -> latitude and longitude, of the stops that are not stations
+    positions: dict[int, tuple[float, float]]
+    # station id -> the stops of the station
+    stations: dict[str, list[int]]
+
+
+def load_stops(directory: str) -> Stops:
+    """Loads the stops, platforms and stations of stops.txt, entrances, generic nodes and boarding areas are left out"""
+    stops = []
+    stop_index = {}
+    positions = {}
+    stations = defaultdict(list)
+    for stop_id, code, name, lat, lon, location_type, parent in read_table(
+            directory, 'stops.txt',
+            ('stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon', 'location_type', 'parent_station'),
+            optional=('stop_code', 'location_type', 'parent_station')):
+        if location_type not in ('', STOP, STATION):
+            continue
+        stop_index[stop_id] = len(stops)
+        if location_type != STATION and lat and lon:
+            positions[len(stops)] = (float(lat), float(lon))
+        if parent:
+            stations[parent].append(len(stops))
+        stops.append(Stop(stop_id, code, name or stop_id))
+    return Stops(stops, stop_index, positions, dict(stations))
+
+
+def load_trips(directory: str, stop_index: dict[str, int]) -> tuple[Calendar, dict[tuple, list[tuple[list[int], list[int]]]]]:
+    """
+    Loads the calendar of the services of trips.txt and groups the trips of stop_times.txt by
+    their route, service and stops, returns the calendar and (route id, service, stops) ->
+    (departures, arrivals) of every trip of the group
+    """
+    trips = {trip_id: (route_id, service_id) for route_id, service_id, trip_id in read_table(
+        directory, 'trips.txt', ('route_id', 'service_id', 'trip_id'))}
+    calendar = load_calendar(directory, {service_id for route_id, service_id in trips.values()})
+    service_index = {service_id: service for service, service_id in enumerate(calendar.services)}
+
+    # trip id -> the trip's stop sequence, stop, arrival and departure of each stop, one after another
+    trip_stops = defaultdict(lambda: array.array('q'))
+    for trip_id, arrival, departure, stop_id, sequence in read_table(
+            directory, 'stop_times.txt', ('trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence')):
+        stop = stop_index.get(stop_id)
+        if stop is not None and trip_id in trips:
+            trip_stops[trip_id].extend((int(sequence), stop, parse_gtfs_time(arrival), parse_gtfs_time(departure)))
+
+    trip_groups = defaultdict(list)
+    for trip_id, rows in trip_stops.items():
+        visits = sorted(zip(rows[0::4], rows[1::4], rows[2::4], rows[3::4]))
+        if len(visits) < 2:
+            continue
+        arrivals = [arrival if arrival >= 0 else departure for _, _, arrival, departure in visits]
+        departures = [departure if departure >= 0 else arrival for _, _, arrival, departure in visits]
+        if interpolate(arrivals) and interpolate(departures):
+            route_id, service_id = trips[trip_id]
+            trip_groups[route_id, service_index[service_id], tuple(stop for _, stop, _, _ in visits)].append(
+                (departures, arrivals))
+    return calendar, dict(trip_groups)
+
+
+def split_overtaking(group: list[tuple[list[int], list[int]]]) -> list[list[tuple[list[int], list[int]]]]:
+    """Splits the (departures, arrivals) of trips into groups in which no trip overtakes another, in the order they leave"""
+    # a trip that would overtake the last trip of every split so far starts a split of its own
+    splits = []
+    for departures, arrivals in sorted(group):
+        for split in splits:
+            last_departures, last_arrivals = split[-1]
+            if all(map(int.__le__, last_arrivals, arrivals)) and all(map(int.__le__, last_departures, departures)):
+                split.append((departures, arrivals))
+                break
+        else:
+            splits.append([(departures, arrivals)])
+    return splits
+
+
+def load_patterns(directory: str, stop_index: dict[str, int]) -> tuple[Calendar, list[Pattern]]:
+    """Loads the calendar of the feed and the patterns of its trips, see `load_gtfs`"""
+    calendar, trip_groups = load_trips(directory, stop_index)
+    patterns = []
+    for (route_id, service, pattern_stops), group in trip_groups.items():
+        for split in split_overtaking(group):
+            departures = tuple(array.array('i', times) for times in zip(*(trip[0] for trip in split)))
+            arrivals = tuple(array.array('i', times) for times in zip(*(trip[1] for trip in split)))
+            arrivals = tuple(departure_times if departure_times == arrival_times else arrival_times
+                             for arrival_times, departure_times in zip(arrivals, departures))
+            patterns.append(Pattern(service, pattern_stops, arrivals, departures))
+    return calendar, patterns
+
+
+def walking_distances(positions: dict[int, tuple[float, float]], walk_radius: float) -> Iterator[tuple[int, int, float]]:
+    """
+    Yields the stops within `walk_radius` metres of each other and the distance between them in
+    metres, looking only at the stops in the same and the neighbouring squares of a grid as wide
+    as walk_radius
+    """
+    if not positions:
+        return
+    metres_per_lon_degree = METRES_PER_DEGREE * math.cos(
+        math.radians(sum(lat for lat, lon in positions.values()) / len(positions)))
+    grid = defaultdict(list)
+    coordinates = {}
+    for stop, (lat, lon) in positions.items():
+        x, y = lon * metres_per_lon_degree, lat * METRES_PER_DEGREE
+        coordinates[stop] = (x, y)
+        grid[int(x // walk_radius), int(y // walk_radius)].append(stop)
+    for stop, (x, y) in coordinates.items():
+        column, row = int(x // walk_radius), int(y // walk_radius)
+        neighbours = (grid.get((column + dx, row + dy), ()) for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+        for other in itertools.chain.from_iterable(neighbours):
+            other_x, other_y = coordinates[other]
+            distance = math.hypot(other_x - x, other_y - y)
+            if distance <= walk_radius:
+                yield stop, other, distance
+
+
+def load_footpaths(directory: str, stops: Stops, walk_radius: float,
+                   walk_speed: float) -> list[tuple[tuple[int, int], ...]]:
+    """Connects the stops by footpaths, see `load_gtfs`, returns the (stop, seconds) of the stops each stop can walk to"""
+    footpaths = [{} for _ in stops.stops]
+
+    def connect(stop: int, other: int, seconds: int) -> None:
+        if stop != other and seconds < footpaths[stop].get(other, UNREACHABLE):
+            footpaths[stop][other] = seconds
+
+    for stop, other, distance in walking_distances(stops.positions, walk_radius):
+        connect(stop, other, math.ceil(distance / walk_speed))
+
+    # a station and its stops, which are a footpath apart so that changing platforms is one walk
+    for station_id, children in stops.stations.items():
+        station = stops.index.get(station_id)
+        if station is not None:
+            for stop, other in itertools.product(children + [station], repeat=2):
+                connect(stop, other, 0)
+
+    if has_table(directory, 'transfers.txt'):
+        for from_stop, to_stop, transfer_type, min_transfer_time in read_table(
+                directory, 'transfers.txt', ('from_stop_id', 'to_stop_id', 'transfer_type', 'min_transfer_time'),
+                optional=('transfer_type', 'min_transfer_time')):
+            stop, other = stops.index.get(from_stop), stops.index.get(to_stop)
+            # type 3 is a transfer that is not possible
+            if stop is not None and other is not None and transfer_type != '3':
+                connect(stop, other, int(min_transfer_time or 0))
+    return [tuple(paths.items()) for paths in footpaths]
+
+
+def load_gtfs(directory: str, walk_radius: float = 400.0, walk_speed: float = 1.25) -> TransitNetwork:
+    """
+    Loads a GTFS feed into a `TransitNetwork`
+
+    Trips that stop at the same stops in the same order on the same route and service days make
+    up a pattern, which is split further if one of its trips overtakes another. Stops closer than
+    `walk_radius` metres are connected by footpaths walked in a straight line at `walk_speed`
+    metres per second, so are the stops of a station, and the transfers of transfers.txt take
+    their minimum transfer time.
+
+    Raises
+    ------
+    ValueError
+        If a file of the feed does not have a column the network needs
+    """
+    timezone = utils.DEFAULT_TIMEZONE
+    if has_table(directory, 'agency.txt'):
+        timezone = next((tz_name for tz_name, in read_table(directory, 'agency.txt', ('agency_timezone',))
+                         if tz_name), timezone)
+
+    stops = load_stops(directory)
+    calendar, patterns = load_patterns(directory, stops.index)
+    footpaths = load_footpaths(directory, stops, walk_radius, walk_speed)
+    forward = Timetable(patterns, stop_patterns_of(patterns, len(stops.stops)), footpaths)
+    logger.info('Loaded %d stops, %d patterns and %d footpaths from %s',
+                len(stops.stops), len(patterns), sum(map(len, footpaths)), directory)
+    return TransitNetwork(stops.stops, timezone, calendar, forward, forward.reversed())
+
+
+def normalize_name(name: str) -> str:
+    return ' '.join(name.lower().split())
+
+
+class RoutePlanner:
+    """
+    Answers how long it takes to get from one stop of a GTFS feed to another, without network access
+
+    The feed is loaded into a `TransitNetwork` on a thread of the planner, which takes a while
+    for a city, so the network is saved to `index_file` and only loaded from the feed again when
+    the feed changes. Stops are looked up by their name, code or id, all the stops with the same
+    name, e.g. on both sides of a road, are the origin or the destination.
+
+    Queries run RAPTOR on the timetable of the day and of the day before, for its trips after
+    midnight, `Timetable.earliest_arrival`. Times are
+    rounded to the minute, a departure up and an arrival down, so that the answers to the most
+    recent queries can be cached.
+
+    Parameters
+    ----------
+    directory
+        directory of the GTFS feed, see `load_gtfs`
+    index_file
+        path the network is saved to, None to load it from the feed on every start
+    cache_size
+        number of queries whose answers are cached
+    walk_radius, walk_speed
+        see `load_gtfs`
+    max_transfers
+        routes with more transfers than this are not considered
+    """
+
+    def __init__(self, directory: str, index_file: Optional[str] = None, cache_size: int = 4096,
+                 walk_radius: float = 400.0, walk_speed: float = 1.25, max_transfers: int = 3):
+        self.directory = directory
+        self.index_file = index_file
+        self.parameters = (walk_radius, walk_speed)
+        self.max_transfers = max_transfers
+        self.network: Optional[TransitNetwork] = None
+        # normalized name, code or id -> the stops it stands for
+        self._names = {}
+        self._ready = threading.Event()
+        self._error = None
+        self.search = functools.lru_cache(maxsize=cache_size)(self._search)
+        self.active_services = functools.lru_cache(maxsize=8)(self._active_services)
+
+    def fingerprint(self) -> tuple:
+        """What the saved network was loaded from, the size and modification time of each file of the feed"""
+        files = []
+        for name in gtfs_files:
+            if has_table(self.directory, name):
+                status = os.stat(os.path.join(self.directory, name))
+                files.append((name, status.st_size, status.st_mtime_ns))
+        return tuple(files), self.parameters
+
+    def start(self) -> threading.Thread:
+        """Loads the network on a background thread, queries fail until it is loaded"""
+        thread = threading.Thread(target=self.load, name='RoutePlanner', daemon=True)
+        thread.start()
+        return thread
+
+    def load(self) -> None:
+        try:
+            start = time.perf_counter()
+            fingerprint = self.fingerprint()
+            network = self._read_index(fingerprint)
+            if network is None:
+                network = load_gtfs(self.directory, *self.parameters)
+                self._write_index(fingerprint, network)
+            self._index_names(network.stops)
+            self.network = network
+            logger.info('Route planner ready in %.1fs', time.perf_counter() - start)
+        except (OSError, ValueError) as err:
+            logger.exception('Failed to load the transit network from %s', self.directory)
+            self._error = err
+        finally:
+            self._ready.set()
+
+    def _read_index(self, fingerprint: tuple) -> Optional[TransitNetwork]:
+        if self.index_file is None or not os.path.exists(self.index_file):
+            return None
+        try:
+            with open(self.index_file, 'rb') as file:
+                saved_fingerprint, network = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            logger.warning('Ignoring the unreadable route index %s', self.index_file)
+            return None
+        return network if saved_fingerprint == fingerprint else None
+
+    def _write_index(self, fingerprint: tuple, network: TransitNetwork) -> None:
+        if self.index_file is None:
+            return
+        try:
+            # written next to the old index and then moved over it, so that a crash never leaves half an index
+            with open(self.index_file + '.tmp', 'wb') as file:
+                pickle.dump((fingerprint, network), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(self.index_file + '.tmp', self.index_file)
+        except OSError:
+            logger.exception('Failed to save the route index to %s', self.index_file)
+
+    def _index_names(self, stops: list[Stop]) -> None:
+        names = defaultdict(list)
+        for stop_index, stop in enumerate(stops):
+            names[normalize_name(stop.name)].append(stop_index)
+        for stop_index, stop in enumerate(stops):
+            for key in (stop.code, stop.id):
+                # a code or id that is also a name stands for the stops with that name
+                if key and normalize_name(key) not in names:
+                    names[normalize_name(key)].append(stop_index)
+        self._names = {name: tuple(stop_indices) for name, stop_indices in names.items()}
+
+    def _active_services(self, day: dt.date) -> bytes:
+        return self.network.calendar.active(day)
+
+    def find_stops(self, query: str) -> tuple[str, tuple[int, ...]]:
+        """
+        Returns the name of the stops a query stands for and their indices, the stops with that
+        name, code or id, or with the only name that contains the query
+
+        Raises
+        ------
+        ValueError
+            If no stop or more than one name matches the query
+        """
+        key = normalize_name(query)
+        stop_indices = self._names.get(key)
+        if stop_indices is None:
+            stops = self.network.stops
+            names = sorted({stops[self._names[name][0]].name for name in self._names if key in name})
+            if not names:
+                raise ValueError(f'there is no stop called {query}')
+            if len(names) > 1:
+                listed = ', '.join(names[:3]) + (' or others' if len(names) > 3 else '')
+                raise ValueError(f'{query} could be {listed}')
+            stop_indices = self._names[normalize_name(names[0])]
+        return self.network.stops[stop_indices[0]].name, stop_indices
+
+    def parse_route(self, text: str) -> tuple[str, str]:
+        """
+        Splits a query like "from Bishan to Raffles Place" into the origin and the destination,
+        at the first "to" that leaves the name of a stop on both sides
+
+        Raises
+        ------
+        ValueError
+            If the text is not an origin and a destination, or one of them is not a stop
+        """
+        text = re.sub(r'^\s*from\s+', '', text, flags=re.IGNORECASE)
+        splits = [(text[:match.start()], text[match.end():]) for match in route_regex.finditer(text)]
+        if not splits:
+            raise ValueError('send where you are leaving from and where you are going, e.g. Bishan to Raffles Place')
+        self._check_ready()
+        first_error = None
+        for origin, destination in splits:
+            try:
+                self.find_stops(origin)
+                self.find_stops(destination)
+                return origin.strip(), destination.strip()
+            except ValueError as err:
+                first_error = first_error or err
+        raise first_error
+
+    def _check_ready(self) -> None:
+        if not self._ready.is_set():
+            raise ValueError('the route planner is still loading, please try again in a minute')
+        if self._error is not None:
+            raise ValueError('the route planner could not load its transit network')
+
+    def service_time(self, date: dt.datetime, round_up: bool) -> tuple[dt.date, int]:
+        """Returns the service day of an 'aware' datetime in the feed's timezone and the seconds since it started"""
+        local = utils.convert_utc_to_local(date, self.network.timezone)
+        seconds = local.hour * 3600 + local.minute * 60
+        if round_up and (local.second or local.microsecond):
+            seconds += 60
+        return local.date(), seconds
+
+    def from_service_time(self, day: dt.date, seconds: int) -> dt.datetime:
+        """Returns the 'aware' datetime in UTC of a time of a service day"""
+        start = dt.datetime.combine(day, dt.time(), tzinfo=utils.get_timezone(self.network.timezone))
+        return utils.convert_local_to_utc(start + dt.timedelta(seconds=seconds))
+
+    def _search(self, backward: bool, origin: str, destination: str, day: dt.date, seconds: int) -> tuple:
+        origin_name, sources = self.find_stops(origin)
+        destination_name, targets = self.find_stops(destination)
+        active = self.active_services(day)
+        max_rounds = self.max_transfers + 1
+        if backward:
+            arrival = self.network.backward.earliest_arrival(
+                dict.fromkeys(targets, -seconds), sources, active, max_rounds)
+            found = -arrival
+        else:
+            arrival = self.network.forward.earliest_arrival(
+                dict.fromkeys(sources, seconds), targets, active, max_rounds)
+            found = arrival
+        if arrival == UNREACHABLE:
+            raise ValueError(f'there is no way to get from {origin_name} to {destination_name} by then')
+        return origin_name, destination_name, found
+
+    def _search_around_midnight(self, backward: bool, origin: str, destination: str,
+                                date: dt.datetime) -> tuple[str, str, dt.datetime]:
+        """
+        Searches from an 'aware' datetime on its service day and on the day before, whose trips
+        after midnight have times past 24:00:00, returns the names of the stops and the better
+        time found of the two, the earlier arrival or the later departure, in UTC
+
+        Raises
+        ------
+        ValueError
+            If either place is not a stop of the feed, or there is no way on either day
+        """
+        day, seconds = self.service_time(date, round_up=not backward)
+        best = None
+        first_error = None
+        for service_day, service_seconds in ((day, seconds), (day - dt.timedelta(days=1), seconds + SECONDS_PER_DAY)):
+            try:
+                origin_name, destination_name, found = self.search(
+                    backward, normalize_name(origin), normalize_name(destination), service_day, service_seconds)
+            except ValueError as err:
+                first_error = first_error or err
+                continue
+            found = self.from_service_time(service_day, found)
+            if best is None or (found > best[2] if backward else found < best[2]):
+                best = origin_name, destination_name, found
+        if best is None:
+            raise first_error
+        return best
+
+    def leave_at(self, origin: str, destination: str, departure: dt.datetime) -> Route:
+        """
+        Returns the earliest arrival at the destination leaving the origin at `departure`, an 'aware' datetime
+
+        Raises
+        ------
+        ValueError
+            If the planner is not loaded, either place is not a stop of the feed, or there is no way
+        """
+        self._check_ready()
+        origin_name, destination_name, arrival = self._search_around_midnight(False, origin, destination, departure)
+        return Route(origin_name, destination_name, departure, arrival)
+
+    def reach_by(self, origin: str, destination: str, arrival: dt.datetime) -> Route:
+        """
+        Returns the latest departure from the origin that reaches the destination by `arrival`, an 'aware' datetime
+
+        Raises
+        ------
+        ValueError
+            If the planner is not loaded, either place is not a stop of the feed, or there is no way
+        """
+        self._check_ready()
+        origin_name, destination_name, departure = self._search_around_midnight(True, origin, destination, arrival)
+        return Route(origin_name, destination_name, departure, arrival)
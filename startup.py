@@ -0,0 +1,76 @@
+import logging
+import sys
+import threading
+import time
+
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Phase(NamedTuple):
+    name: str
+    # seconds since the previous phase ended
+    seconds: float
+    # modules imported during the phase
+    modules: int
+
+
+class StartupProfile:
+    """
+    Records how long each phase of starting the bot takes, up to handling the first update
+
+    The profile starts when it is created, `main` imports this module before anything else so
+    that its first phase covers the imports. Time spent starting the interpreter itself is not
+    included.
+
+    Parameters
+    ----------
+    budget
+        seconds the bot may take to handle its first update, a warning is logged when it takes longer
+    """
+
+    def __init__(self, budget: float = None):
+        self.budget = budget
+        self.started = time.perf_counter()
+        self.phases: list[Phase] = []
+        self._last = self.started
+        self._modules = len(sys.modules)
+        self._first_update = False
+        self._lock = threading.Lock()
+
+    def mark(self, name: str) -> Phase:
+        """Ends the current phase"""
+        with self._lock:
+            now, modules = time.perf_counter(), len(sys.modules)
+            phase = Phase(name, now - self._last, modules - self._modules)
+            self.phases.append(phase)
+            self._last, self._modules = now, modules
+        return phase
+
+    def elapsed(self) -> float:
+        """Seconds from the start of the profile to the end of the last phase"""
+        return self._last - self.started
+
+    def report(self) -> str:
+        lines = [f'{phase.name:<16} {phase.seconds * 1000:8.1f}ms {phase.modules:5d} modules'
+                 for phase in self.phases]
+        lines.append(f'{"total":<16} {self.elapsed() * 1000:8.1f}ms')
+        return '\n'.join(lines)
+
+    def first_update(self) -> None:
+        """Ends the profile with the phase of handling the first update, later calls do nothing"""
+        if self._first_update:
+            return
+        with self._lock:
+            if self._first_update:
+                return
+            self._first_update = True
+        self.mark('first update')
+        logger.info('Startup profile:\n%s', self.report())
+        if self.budget is not None and self.elapsed() > self.budget:
+            logger.warning('Took %.2fs to handle the first update, the budget is %.2fs',
+                           self.elapsed(), self.budget)
+
+
+profile = StartupProfile()
@@ -0,0 +1,167 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+from typing import Callable
+
+from webhook import update_chat_id
+
+logger = logging.getLogger(__name__)
+
+# seconds a dispatching thread waits before trying a full worker queue again
+dispatch_retry_interval = 0.01
+
+
+def stable_hash(key: str) -> int:
+    """Hashes a string the same way in every process, unlike hash()"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing of chat ids onto a number of shards
+
+    Every shard owns `replicas` points on the ring and a chat belongs to the shard owning the
+    first point after the chat's hash. Adding or removing a shard only moves the chats next to
+    that shard's points, about 1/n of them, instead of nearly every chat like chat_id % n would.
+    """
+
+    def __init__(self, shards: int, replicas: int = 100):
+        points = sorted(
+            (stable_hash(f'{shard}:{replica}'), shard)
+            for shard in range(shards) for replica in range(replicas)
+        )
+        self.shards = shards
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard(self, chat_id: int) -> int:
+        """Returns the shard `chat_id` belongs to"""
+        index = bisect.bisect(self._hashes, stable_hash(str(chat_id)))
+        return self._owners[index % len(self._owners)]
+
+
+class Supervisor:
+    """
+    Runs the bot in several worker processes, each handling the updates of its own share of chats
+
+    Raw updates passed to `dispatch` are routed to a worker by consistent hashing on their chat
+    id, so the conversation states and chat_data of a chat only ever live in one process. A user
+    who talks to the bot in several chats can reach several workers, so workers share user_data
+    through the database, see `persistence.SqlitePersistence`. bot_data is kept per process.
+    Workers that exit are restarted on the same queue, and `resize` restarts the workers with the
+    chats rebalanced over the new number of processes.
+
+    Parameters
+    ----------
+    target
+        function run in every worker process, called with the worker's index, the number of
+        workers and the worker's queue. It handles the raw updates it gets from the queue until
+        it gets None, then returns
+    processes
+        number of worker processes
+    queue_size
+        number of updates waiting in each worker's queue before `dispatch` blocks
+    restart_delay
+        seconds between checks for workers that have exited
+    """
+
+    def __init__(self, target: Callable[[int, int, multiprocessing.Queue], None], processes: int,
+                 queue_size: int = 250, restart_delay: float = 1.0):
+        self.target = target
+        self.queue_size = queue_size
+        self.restart_delay = restart_delay
+
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.RLock()
+        self._ring = HashRing(processes)
+        self._queues = [self._context.Queue(queue_size) for _ in range(processes)]
+        self._processes = [None] * processes
+        self._running = threading.Event()
+        self._monitor = threading.Thread(target=self._watch, name='Supervisor', daemon=True)
+
+    @property
+    def processes(self) -> int:
+        return self._ring.shards
+
+    def _spawn(self, index: int) -> multiprocessing.Process:
+        process = self._context.Process(
+            target=self.target, args=(index, self.processes, self._queues[index]), name=f'Worker-{index}')
+        process.start()
+        return process
+
+    def start(self) -> None:
+        with self._lock:
+            self._processes = [self._spawn(index) for index in range(self.processes)]
+        self._running.set()
+        self._monitor.start()
+        logger.info('Started %d worker processes', self.processes)
+
+    def dispatch(self, data: dict) -> None:
+        """Passes a raw update to the worker of its chat, waiting while that worker is backed up"""
+        chat_id = update_chat_id(data)
+        while True:
+            with self._lock:
+                try:
+                    self._queues[self._ring.shard(chat_id)].put_nowait(data)
+                    return
+                except queue.Full:
+                    pass
+            time.sleep(dispatch_retry_interval)
+
+    def _watch(self) -> None:
+        while self._running.is_set():
+            time.sleep(self.restart_delay)
+            with self._lock:
+                if not self._running.is_set():
+                    return
+                for index, process in enumerate(self._processes):
+                    if not process.is_alive():
+                        logger.error('Worker %d exited with code %s, restarting it', index, process.exitcode)
+                        self._processes[index] = self._spawn(index)
+
+    def _stop_workers(self) -> list:
+        """Stops every worker once it has handled its queue, returns the updates of dead workers"""
+        for process, update_queue in zip(self._processes, self._queues):
+            if process.is_alive():
+                update_queue.put(None)
+        for process in self._processes:
+            process.join()
+
+        # workers that died before reaching None leave their updates behind
+        leftover = []
+        for update_queue in self._queues:
+            while True:
+                try:
+                    data = update_queue.get(timeout=0.1)
+                except queue.Empty:
+                    break
+                if data is not None:
+                    leftover.append(data)
+        return leftover
+
+    def resize(self, processes: int) -> None:
+        """Restarts the workers as `processes` workers, moving about 1/n of the chats to new workers"""
+        if processes < 1:
+            raise ValueError('at least one worker process is needed')
+        with self._lock:
+            logger.info('Resizing from %d to %d worker processes', self.processes, processes)
+            leftover = self._stop_workers()
+            self._ring = HashRing(processes)
+            self._queues = self._queues[:processes] + [
+                self._context.Queue(self.queue_size) for _ in range(len(self._queues), processes)]
+            self._processes = [self._spawn(index) for index in range(processes)]
+            for data in leftover:
+                self._queues[self._ring.shard(update_chat_id(data))].put(data)
+
+    def stop(self) -> None:
+        """Stops every worker once it has handled the updates already dispatched to it"""
+        self._running.clear()
+        with self._lock:
+            leftover = self._stop_workers()
+        if leftover:
+            logger.warning('Dropped %d updates of workers that exited', len(leftover))
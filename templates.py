@@ -0,0 +1,127 @@
+import functools
+import re
+import string
+import datetime as dt
+
+from typing import Optional
+
+from telegram import Message, ParseMode, ReplyMarkup
+
+import common
+
+# characters that have a meaning in MarkdownV2 and are escaped everywhere else
+markdown_v2_special = '\\_*[]()~`>#+-=|{}.!'
+escape_table = str.maketrans({char: '\\' + char for char in markdown_v2_special})
+# the formatting that can be used in the text of a template, underline and bold
+markup_regex = re.compile(r'(__|\*)')
+# format specs that slots can use by name, e.g. {reach:time}
+named_formats = {'time': common.time_format}
+# strftime codes that only give letters and digits, times formatted with just these and characters
+# MarkdownV2 does not give a meaning to are not escaped
+plain_strftime_regex = re.compile(r'%[aAbBdHIjmMpSyY]')
+# strftime codes that only depend on the time of day, times formatted with just these are cached
+time_of_day_regex = re.compile(r'%[HIMp]')
+
+
+def escape_markdown_v2(text: str) -> str:
+    """Escapes every character MarkdownV2 gives a meaning to, so that the text is shown as it is"""
+    return text.translate(escape_table)
+
+
+def reply_kwargs(parse_mode: Optional[str] = None, reply_markup: Optional[ReplyMarkup] = None) -> dict:
+    """
+    Returns the keyword arguments of reply_text that are the same for every reply, the keyboard
+    serialized to JSON once instead of on every reply
+    """
+    kwargs = {}
+    if parse_mode is not None:
+        kwargs['parse_mode'] = parse_mode
+    if reply_markup is not None:
+        # Bot sends a reply_markup that is not a ReplyMarkup as it is
+        kwargs['reply_markup'] = reply_markup.to_json()
+    return kwargs
+
+
+@functools.lru_cache(maxsize=None)
+def time_of_day_text(spec: str, hour: int, minute: int) -> str:
+    """
+    Returns a time of day formatted with strftime codes that only depend on the time of day
+
+    strftime of an 'aware' datetime looks up its timezone, which takes longer than the rest of
+    rendering a reply, and there are only 1440 minutes in a day.
+    """
+    return dt.time(hour, minute).strftime(spec)
+
+
+def slot_formatter(spec: str, escape: bool, markdown: bool):
+    """Returns the function that turns the value of a slot into its text"""
+    if '%' in spec:
+        if '%' not in time_of_day_regex.sub('', spec):
+            def text(value):
+                return time_of_day_text(spec, value.hour, value.minute)
+        else:
+            def text(value):
+                return value.strftime(spec)
+        # e.g. 09:30 AM never needs escaping
+        if not escape or not any(char in markdown_v2_special for char in plain_strftime_regex.sub('', spec)):
+            return text
+        return lambda value: text(value).translate(escape_table)
+    if markdown or not escape:
+        return lambda value: format(value, spec)
+    return lambda value: format(value, spec).translate(escape_table)
+
+
+class Template:
+    """
+    A reply that is compiled once and then rendered by only filling in its slots
+
+    The source is the plain text of the reply, with slots written like str.format fields, e.g.
+    "Sleep at __{sleep:time}__ for a power nap!". A slot's format spec is passed to format(),
+    so datetimes take strftime codes, and 'time' is short for `common.time_format`.
+
+    With MarkdownV2, `__` (underline) and `*` (bold) in the source are formatting, and every other
+    character MarkdownV2 gives a meaning to is escaped when the template is compiled. The values
+    of the slots are escaped when the template is rendered, except for slots with the !m
+    conversion, whose values are MarkdownV2 already, e.g. other rendered templates.
+
+    Parameters
+    ----------
+    source
+        the text of the reply
+    parse_mode
+        ParseMode.MARKDOWN_V2, or None for replies sent as plain text
+    reply_markup
+        keyboard sent with every reply
+    """
+
+    def __init__(self, source: str, parse_mode: Optional[str] = ParseMode.MARKDOWN_V2,
+                 reply_markup: Optional[ReplyMarkup] = None):
+        self.source = source
+        self.escape = parse_mode == ParseMode.MARKDOWN_V2
+        self.kwargs = reply_kwargs(parse_mode, reply_markup)
+
+        # str.format string of the escaped text, whose fields are the slots in order
+        compiled = []
+        # (name, function that turns the value into its text) of every slot
+        self.slots = []
+        for literal, name, spec, conversion in string.Formatter().parse(source):
+            if self.escape:
+                literal = ''.join(part if markup_regex.fullmatch(part) else escape_markdown_v2(part)
+                                  for part in markup_regex.split(literal))
+            compiled.append(literal.replace('{', '{{').replace('}', '}}'))
+            if name is not None:
+                compiled.append('{}')
+                self.slots.append((name, slot_formatter(named_formats.get(spec, spec), self.escape, conversion == 'm')))
+        self.compiled = ''.join(compiled)
+        # a template without slots is rendered once
+        self.text = None if self.slots else self.compiled.format()
+
+    def render(self, **values) -> str:
+        if self.text is not None:
+            return self.text
+
+        return self.compiled.format(*[text(values[name]) for name, text in self.slots])
+
+    def reply(self, message: Message, **values) -> Message:
+        """Replies to the message with the rendered template"""
+        return message.reply_text(self.render(**values), **self.kwargs)
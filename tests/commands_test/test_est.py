@@ -1,9 +1,13 @@
+import pickle
 from unittest import mock
 import pytest
 from commands import est
 import common
+import routing
+import utils
 import datetime
-from telegram import ParseMode
+from telegram import ParseMode, Update, Message, Chat, User, MessageEntity
+from telegram.ext import ConversationHandler
 
 
 def test_est(mocked_update, mocked_context):
@@ -31,7 +35,7 @@ def test_est_reach_success(mocked_update, mocked_context):
         "So you have to reach at "
         f"{time.strftime(common.time_format)}\n\n"
         "How long do you think you will take to get there?\n"
-        "\(e\.g\. 1h or 1h 30m or 15m\)"
+        r"\(e\.g\. 1h or 1h 30m or 15m\)"
     )
 
     # test
@@ -45,6 +49,28 @@ def test_est_reach_success(mocked_update, mocked_context):
     assert resp == est.EST_TRAVEL
 
 
+@pytest.mark.parametrize(
+    "travel, ready, tz_name, expected_leave, expected_ready",
+    [
+        (datetime.timedelta(minutes=-30), datetime.timedelta(hours=-1), 'Asia/Singapore', '09:00 AM', '08:00 AM'),
+        (datetime.timedelta(hours=-2), datetime.timedelta(minutes=-45), 'Asia/Singapore', '07:30 AM', '06:45 AM'),
+        (datetime.timedelta(minutes=-30), datetime.timedelta(hours=-1), 'Europe/London', '01:00 AM', '12:00 AM'),
+    ]
+)
+def test_leave_and_ready_text(travel, ready, tz_name, expected_leave, expected_ready):
+    # setup
+    reach_time = datetime.datetime(2022, 1, 1, 1, 30, tzinfo=datetime.timezone.utc)
+
+    # test
+    leave_text = est.leave_text(reach_time, travel, tz_name)
+    ready_text = est.ready_text(reach_time, travel, ready, tz_name)
+
+    # assertions
+    assert f"leave the house at __{expected_leave}\n__" in leave_text
+    assert f"get ready by __{expected_ready}\n__" in ready_text
+    assert f"leave the house at __{expected_leave}\n__" in ready_text
+
+
 @pytest.mark.skip(reason="yet to implement")
 def test_est_reach_failure():
     pass
@@ -55,11 +81,187 @@ def test_est_travel():
     pass
 
 
-@pytest.mark.skip(reason="yet to implement")
-def test_est_skip_ready():
-    pass
+def test_est_skip_ready(mocked_update, mocked_context):
+    # setup
+    mocked_context.reminders = None
+    mocked_context.user_data['est'] = est.EstState(utils.to_epoch_minutes(mocked_context.now) + 180, -30)
+
+    # test
+    resp = est.est_skip_ready(mocked_update, mocked_context)
 
+    # assertions
+    mocked_update.message.reply_text.assert_called_with(common.hedgehog + 'How else might i /help you?')
+    assert mocked_context.user_data == {}
+    assert resp == ConversationHandler.END
 
-@pytest.mark.skip(reason="yet to implement")
-def test_est_ready():
-    pass
+
+def test_est_ready_arms_reminders(mocked_update, mocked_context):
+    # setup
+    mocked_update.message.text = '1h'
+    mocked_context.reminders.schedule.side_effect = [1, 2]
+    reach_time = mocked_context.now + datetime.timedelta(hours=3)
+    mocked_context.user_data.update(est=est.EstState(utils.to_epoch_minutes(reach_time), -30), reminders=[7])
+
+    # test
+    resp = est.est_ready(mocked_update, mocked_context)
+
+    # assertions
+    mocked_context.reminders.cancel.assert_called_once_with(7)
+    scheduled = [call.args[0] for call in mocked_context.reminders.schedule.call_args_list]
+    assert scheduled == [reach_time - datetime.timedelta(hours=1, minutes=30),
+                         reach_time - datetime.timedelta(minutes=30)]
+    assert mocked_context.user_data['reminders'] == [1, 2]
+    mocked_update.message.reply_text.assert_called_with(
+        common.hedgehog + est.reminder_armed_txt + 'How else might i /help you?')
+    assert resp == ConversationHandler.END
+
+
+def test_est_travel_route(mocked_update, mocked_context):
+    # setup
+    mocked_update.message.text = 'Bishan to City Hall'
+    reach_time = mocked_context.now + datetime.timedelta(hours=3)
+    mocked_context.user_data['est'] = est.EstState(utils.to_epoch_minutes(reach_time))
+    mocked_context.routes.parse_route.return_value = ('Bishan', 'City Hall')
+    mocked_context.routes.reach_by.return_value = routing.Route(
+        'Bishan', 'City Hall', reach_time - datetime.timedelta(minutes=28), reach_time)
+
+    # test
+    resp = est.est_travel_route(mocked_update, mocked_context)
+
+    # assertions
+    mocked_context.routes.reach_by.assert_called_once_with('Bishan', 'City Hall', reach_time)
+    assert mocked_context.user_data['est'].travel_timedelta == datetime.timedelta(minutes=-28)
+    text = mocked_update.message.reply_text.call_args.args[0]
+    assert 'It takes 28 min to get from Bishan to City Hall by public transport' in text
+    assert 'leave at __10:32 AM\n__' in text
+    assert resp == est.EST_READY
+
+
+def test_est_travel_route_invalid(mocked_update, mocked_context):
+    # setup
+    mocked_update.message.text = 'Changi to City Hall'
+    mocked_context.user_data['est'] = est.EstState(utils.to_epoch_minutes(mocked_context.now))
+    mocked_context.routes.parse_route.side_effect = ValueError('there is no stop called Changi')
+
+    # test
+    resp = est.est_travel_route(mocked_update, mocked_context)
+
+    # assertions
+    mocked_update.message.reply_text.assert_called_once_with(
+        utils.route_input_err_to_str('there is no stop called Changi'))
+    assert mocked_context.user_data['est'].travel_minutes is None
+    assert resp == est.EST_TRAVEL
+
+
+def make_command_update(text, bot):
+    user = User(id=1, first_name='test', is_bot=False)
+    chat = Chat(id=1, type='private')
+    command = text.split(' ')[0]
+    message = Message(message_id=1, date=datetime.datetime.now(), chat=chat, from_user=user, text=text, bot=bot,
+                      entities=[MessageEntity(MessageEntity.BOT_COMMAND, 0, len(command))])
+    return Update(update_id=1, message=message)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('/est 930a 45m', True),
+        ('/est@gfhelper_bot 930a 45m', True),
+        ('/est', False),
+        ('/est ', False),
+    ]
+)
+def test_est_args_handler_only_handles_commands_with_args(text, expected):
+    bot = mock.Mock(username='gfhelper_bot')
+    update = make_command_update(text, bot)
+
+    assert bool(est.est_args_handler.check_update(update)) == expected
+
+
+def test_est_args(mocked_update, mocked_context):
+    # setup
+    mocked_context.args = ['930', 'a', '1h', '15m', '30m']
+    mocked_context.reminders.schedule.return_value = 1
+
+    # test
+    resp = est.est_args(mocked_update, mocked_context)
+
+    # assertions
+    reach_time = datetime.datetime(2022, 1, 1, 1, 30, tzinfo=datetime.timezone.utc)
+    mocked_update.message.reply_text.assert_any_call(
+        est.ready_text(reach_time, datetime.timedelta(hours=-1, minutes=-15), datetime.timedelta(minutes=-30)),
+        parse_mode=ParseMode.MARKDOWN_V2
+    )
+    # getting ready was due before now, so only leaving is reminded
+    mocked_context.reminders.schedule.assert_called_once()
+    assert mocked_context.user_data == {'reminders': [1]}
+    assert resp is None
+
+
+def test_est_args_failure(mocked_update, mocked_context):
+    mocked_context.args = ['930a']
+
+    est.est_args(mocked_update, mocked_context)
+
+    mocked_update.message.reply_text.assert_called_once()
+    assert 'your travel time' in mocked_update.message.reply_text.call_args.args[0]
+    mocked_context.reminders.schedule.assert_not_called()
+
+
+def test_est_cancel_forgets_conversation(mocked_update, mocked_context):
+    mocked_context.user_data.update(est=est.EstState(), timezone='Europe/London')
+
+    resp = est.est_cancel(mocked_update, mocked_context)
+
+    assert mocked_context.user_data == {'timezone': 'Europe/London'}
+    assert resp == ConversationHandler.END
+
+
+def test_est_state_steps(mocked_update, mocked_context):
+    # setup
+    mocked_update.message.text = '930a'
+
+    # test
+    est.est_reach(mocked_update, mocked_context)
+    mocked_update.message.text = '45m'
+    est.est_travel(mocked_update, mocked_context)
+
+    # assertions
+    state = mocked_context.user_data['est']
+    assert state.reach_time == datetime.datetime(2022, 1, 1, 1, 30, tzinfo=datetime.timezone.utc)
+    assert state.travel_timedelta == datetime.timedelta(minutes=-45)
+    assert pickle.loads(pickle.dumps(state)) == state
+
+
+def test_est_state_reads_legacy_keys(mocked_context):
+    # setup
+    reach_time = datetime.datetime(2022, 1, 1, 1, 30, tzinfo=datetime.timezone.utc)
+    mocked_context.user_data.update(reach_time=reach_time, travel_timedelta=datetime.timedelta(minutes=-45))
+
+    # test
+    state = est.est_state(mocked_context)
+
+    # assertions
+    assert state == est.EstState(utils.to_epoch_minutes(reach_time), -45)
+    assert mocked_context.user_data == {'est': state}
+
+
+@pytest.mark.parametrize(
+    "routes, expected",
+    [
+        (None, 'convo_except'),
+        (mock.Mock(), 'est_travel_route'),
+    ]
+)
+def test_est_travel_plans_routes_only_with_a_planner(monkeypatch, routes, expected):
+    # setup
+    monkeypatch.setattr(common.UpdateContext, 'routes', routes)
+    message = Message(message_id=1, date=datetime.datetime.now(), chat=Chat(id=1, type='private'),
+                      from_user=User(id=1, first_name='test', is_bot=False), text='Bishan to City Hall')
+    update = Update(update_id=1, message=message)
+
+    # test
+    handler = next(handler for handler in est.est_convo_handler.states[est.EST_TRAVEL] if handler.check_update(update))
+
+    # assertions
+    assert handler.callback.__name__ == expected
@@ -1,17 +1,18 @@
 import pytest
-from commands import help
+from commands import help, est, sleep
 
 
 @pytest.mark.parametrize(
     "context_args, expected",
     [
-        (None, help.help_default_txt),
-        (['est'], help.command_mapping['est']),
-        (['sleep'], help.command_mapping['sleep']),
+        (None, help.help_default_txt()),
+        (['est'], est.command.help),
+        (['sleep'], sleep.command.help),
         # failure cases
         ([''], help.invalid_command_txt),
-        (['est', 'random'], help.command_mapping['est']),
-        ([], help.help_default_txt)
+        (['est', 'random'], est.command.help),
+        ([], help.help_default_txt()),
+        (['start'], help.invalid_command_txt)
     ],
     ids=[
         'help command default behavior',
@@ -19,7 +20,8 @@ from commands import help
         'help sleep',
         'help invalid call',
         'help called with vaild command but extra words',
-        'help with context.args as empty list'
+        'help with context.args as empty list',
+        'help for a command without help text'
     ]
 )
 def test_help(mocked_update, mocked_context, context_args, expected):
@@ -31,3 +33,12 @@ def test_help(mocked_update, mocked_context, context_args, expected):
     mocked_context.bot.send_message.assert_called()
     mocked_context.bot.send_message.assert_called_with(
         chat_id=0, text=expected)
+
+
+def test_help_default_txt_lists_described_commands():
+    text = help.help_default_txt()
+
+    assert '/est: estimate what time you need to leave' in text
+    assert '/sleep: Calculate sleep and wake up times' in text
+    assert '/timezone' in text and '/outing' in text and '/help' in text
+    assert '/start' not in text and '/inline' not in text
@@ -0,0 +1,72 @@
+import pytest
+import utils
+from commands import inline, est
+
+
+@pytest.fixture(autouse=True)
+def clear_inline_cache():
+    inline.inline_answer.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "query, expected_title",
+    [
+        ('sleep', 'If you sleep now'),
+        ('sleep now', 'If you sleep now'),
+        ('sleep 700a', 'When to sleep'),
+        ('est 930p 45m 30m', 'When to get ready and leave'),
+        ('est 930 p 1h 15m', 'When to get ready and leave'),
+    ]
+)
+def test_inline_answer(frozen_clock, query, expected_title):
+    answer = inline.inline_answer(query, utils.DEFAULT_TIMEZONE, frozen_clock.now())
+
+    assert answer.title == expected_title
+    assert answer.text is not None
+    assert '__' not in answer.description and '\\' not in answer.description
+
+
+@pytest.mark.parametrize(
+    "query, expected_title",
+    [
+        ('', inline.inline_usage_txt),
+        ('outing', inline.inline_usage_txt),
+        ('sleep 45m', '45m is not a time (e.g 930a or 1030p)'),
+        ('est 930p', 'send the time to reach, your travel time and then your time to get ready '
+                     'if you need any (e.g. 930a 45m 30m)'),
+        ('est 1060p 45m', 'minutes cannot be more than 59'),
+    ]
+)
+def test_inline_answer_errors(frozen_clock, query, expected_title):
+    answer = inline.inline_answer(query, utils.DEFAULT_TIMEZONE, frozen_clock.now())
+
+    assert answer.title == expected_title
+    assert answer.text is None
+
+
+def test_inline_query(mocked_update, mocked_context):
+    # setup
+    mocked_update.inline_query.query = '  EST  930p 45m   30m '
+    mocked_context.now = mocked_context.now.replace(second=15)
+
+    # test
+    inline.inline_query(mocked_update, mocked_context)
+    inline.inline_query(mocked_update, mocked_context)
+
+    # assertions
+    results = mocked_update.inline_query.answer.call_args.args[0]
+    now = mocked_context.now.replace(second=0)
+    assert results[0].input_message_content.message_text == est.args_text(['930p', '45m', '30m'], now)
+    assert mocked_update.inline_query.answer.call_args.kwargs == {'cache_time': 45, 'is_personal': True}
+    # the second query is answered from the cache
+    assert inline.inline_answer.cache_info().hits == 1
+
+
+def test_inline_query_error(mocked_update, mocked_context):
+    mocked_update.inline_query.query = 'sleep 45m'
+
+    inline.inline_query(mocked_update, mocked_context)
+
+    mocked_update.inline_query.answer.assert_called_with(
+        [], cache_time=60, is_personal=True,
+        switch_pm_text='45m is not a time (e.g 930a or 1030p)', switch_pm_parameter='inline')
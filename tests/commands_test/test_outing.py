@@ -0,0 +1,56 @@
+import common
+import planner
+from commands import outing
+
+
+def test_outing_usage(mocked_update, mocked_context):
+    mocked_context.args = []
+
+    outing.outing(mocked_update, mocked_context)
+
+    mocked_context.bot.send_message.assert_called_with(chat_id=0, text=outing.outing_usage_txt)
+
+
+def test_outing_join_without_outing(mocked_update, mocked_context):
+    mocked_context.chat_data = {}
+    mocked_context.args = ['join', '45m']
+
+    outing.outing(mocked_update, mocked_context)
+
+    mocked_context.bot.send_message.assert_called_with(chat_id=0, text=outing.no_outing_txt)
+
+
+def test_outing_plan(mocked_update, mocked_context):
+    # setup
+    mocked_context.chat_data = {}
+    mocked_update.effective_user.id = 1
+    mocked_update.effective_user.first_name = 'hedgehog'
+
+    # test
+    mocked_context.args = ['930a']
+    outing.outing(mocked_update, mocked_context)
+    mocked_context.args = ['join', '1h', '15m', '30m']
+    outing.outing(mocked_update, mocked_context)
+    mocked_context.args = ['plan']
+    outing.outing(mocked_update, mocked_context)
+
+    # assertions
+    assert mocked_context.chat_data['outing']['members'] == {1: planner.Member('hedgehog', 75, 30)}
+    mocked_context.bot.send_message.assert_called_with(
+        chat_id=0,
+        text=(common.hedgehog +
+              "To reach by 09:30 AM:\n"
+              "hedgehog: get ready by 07:45 AM, leave at 08:15 AM\n")
+    )
+
+
+def test_outing_join_invalid(mocked_update, mocked_context):
+    mocked_context.chat_data = {'outing': {'members': {}}}
+    mocked_context.args = ['join', 'soon']
+
+    outing.outing(mocked_update, mocked_context)
+
+    mocked_context.bot.send_message.assert_called_with(
+        chat_id=0,
+        text=outing.utils.time_input_err_to_str('soon is not a duration (e.g. 1h or 1h 30m or 15m)')
+    )
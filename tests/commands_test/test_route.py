@@ -0,0 +1,60 @@
+import datetime as dt
+
+import common
+import routing
+import utils
+from commands import route
+
+
+def test_route(mocked_update, mocked_context):
+    # setup
+    mocked_context.args = ['Bishan', 'to', 'City', 'Hall']
+    mocked_context.routes.parse_route.return_value = ('Bishan', 'City Hall')
+    mocked_context.routes.leave_at.return_value = routing.Route(
+        'Bishan', 'City Hall', mocked_context.now, mocked_context.now + dt.timedelta(minutes=24, seconds=10))
+
+    # test
+    route.route(mocked_update, mocked_context)
+
+    # assertions
+    mocked_context.routes.parse_route.assert_called_once_with('Bishan to City Hall')
+    mocked_context.routes.leave_at.assert_called_once_with('Bishan', 'City Hall', mocked_context.now)
+    text = mocked_update.message.reply_text.call_args.args[0]
+    assert 'you will reach City Hall at __08:24 AM__' in text
+    assert '\\(25 min by public transport\\)' in text
+
+
+def test_route_invalid(mocked_update, mocked_context):
+    # setup
+    mocked_context.args = ['Changi', 'to', 'Bishan']
+    mocked_context.routes.parse_route.side_effect = ValueError('there is no stop called Changi')
+
+    # test
+    route.route(mocked_update, mocked_context)
+
+    # assertions
+    mocked_update.message.reply_text.assert_called_once_with(
+        utils.route_input_err_to_str('there is no stop called Changi'))
+
+
+def test_route_usage(mocked_update, mocked_context):
+    # setup
+    mocked_context.args = []
+
+    # test
+    route.route(mocked_update, mocked_context)
+
+    # assertions
+    mocked_update.message.reply_text.assert_called_once_with(common.hedgehog + route.route_usage_txt)
+
+
+def test_route_without_a_planner(mocked_update, mocked_context):
+    # setup
+    mocked_context.args = ['Bishan', 'to', 'City', 'Hall']
+    mocked_context.routes = None
+
+    # test
+    route.route(mocked_update, mocked_context)
+
+    # assertions
+    mocked_update.message.reply_text.assert_called_once_with(route.route_disabled_txt)
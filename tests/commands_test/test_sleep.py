@@ -1,15 +1,34 @@
 import pytest
+import datetime
+from telegram import ParseMode
+import common
+import utils
 from commands import sleep
 
 
+def utc(hour, minute, day=1):
+    return datetime.datetime(2022, 1, day, hour, minute, tzinfo=utils.UTC)
+
+
 @pytest.mark.skip(reason="yet to implement")
 def test_sleep_time_arr_to_str():
     pass
 
 
-@pytest.mark.skip(reason="yet to implement")
-def test_get_sleeptimes_from_wake():
-    pass
+@pytest.mark.parametrize(
+    "now, expected",
+    [
+        (utc(8, 51), []),
+        (utc(8, 43), [utc(8, 43)]),
+        (utc(8, 20), [utc(8, 40)]),
+        (utc(23, 49), [utc(8, 40, 2), utc(7, 20, 2), utc(5, 50, 2), utc(4, 20, 2),
+                       utc(2, 50, 2), utc(1, 20, 2), utc(23, 50)]),
+    ]
+)
+def test_get_sleeptimes_from_wake(now, expected):
+    wake_time = utc(9, 0, 2) if now.hour == 23 else utc(9, 0)
+
+    assert sleep.get_sleeptimes_from_wake(wake_time, now) == expected
 
 
 @pytest.mark.skip(reason="yet to implement")
@@ -17,9 +36,19 @@ def test_process_sleep_times_text():
     pass
 
 
-@pytest.mark.skip(reason="yet to implement")
-def test_sleep():
-    pass
+def test_sleep(mocked_update, mocked_context):
+    # setup
+    mocked_update.message.from_user.first_name = 'Shawn_L.'
+
+    # test
+    resp = sleep.sleep(mocked_update, mocked_context)
+
+    # assertions
+    text = mocked_update.message.reply_text.call_args.args[0]
+    assert text.startswith(common.hedgehog + 'Hi Shawn\\_L\\.\\!\n')
+    assert "'*Sleep Now*'" in text
+    assert mocked_update.message.reply_text.call_args.kwargs['parse_mode'] == ParseMode.MARKDOWN_V2
+    assert resp == sleep.SLEEP_CHOICE
 
 
 @pytest.mark.skip(reason="yet to implement")
@@ -35,3 +64,63 @@ def test_sleep_wake():
 @pytest.mark.skip(reason="yet to implement")
 def test_sleep_wake_time():
     pass
+
+
+@pytest.mark.parametrize("tz_name", ['Asia/Singapore', 'Europe/London', 'America/New_York'])
+@pytest.mark.parametrize("now", [utc(0, 0, 15), utc(13, 37, 15), utc(23, 59, 15)])
+def test_sleep_now_text_table(now, tz_name):
+    assert sleep.sleep_now_text(now, tz_name) == sleep.build_sleep_now_text(now, tz_name)
+
+
+def test_sleep_now_text_dst_transition():
+    # London clocks go forward at 1:00 UTC on 27 March 2022
+    now = datetime.datetime(2022, 3, 26, 23, 0, tzinfo=utils.UTC)
+
+    text = sleep.sleep_now_text(now, 'Europe/London')
+
+    assert text == sleep.build_sleep_now_text(now, 'Europe/London')
+    assert text != sleep.sleep_now_text_for_minute(23 * 60)
+
+
+@pytest.mark.parametrize(
+    "wake_time, now, tz_name",
+    [
+        (utc(9, 0, 2), utc(23, 49), 'Asia/Singapore'),
+        (utc(9, 0), utc(8, 43), 'Europe/London'),
+        (utc(9, 0), utc(8, 51, 1), 'America/New_York'),
+        # London clocks go forward at 1:00 UTC on 27 March 2022
+        (datetime.datetime(2022, 3, 27, 7, 0, tzinfo=utils.UTC),
+         datetime.datetime(2022, 3, 26, 22, 0, tzinfo=utils.UTC), 'Europe/London'),
+    ]
+)
+def test_sleep_wake_text_table(wake_time, now, tz_name):
+    expected = sleep.process_sleep_times_text(
+        sleep.get_sleeptimes_from_wake(wake_time, now), wake_time, tz_name)
+
+    assert sleep.sleep_wake_text(wake_time, now, tz_name) == expected
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        ([], sleep.sleep_now_text(utc(0, 0))),
+        (['now'], sleep.sleep_now_text(utc(0, 0))),
+        (['7a'], sleep.sleep_wake_text(utc(23, 0), utc(0, 0))),
+        (['700', 'a'], sleep.sleep_wake_text(utc(23, 0), utc(0, 0))),
+    ]
+)
+def test_sleep_args(mocked_update, mocked_context, args, expected):
+    mocked_context.args = args
+
+    sleep.sleep_args(mocked_update, mocked_context)
+
+    mocked_update.message.reply_text.assert_called_once_with(expected, parse_mode=ParseMode.MARKDOWN_V2)
+
+
+def test_sleep_args_failure(mocked_update, mocked_context):
+    mocked_context.args = ['7a', '45m']
+
+    sleep.sleep_args(mocked_update, mocked_context)
+
+    mocked_update.message.reply_text.assert_called_once_with(
+        utils.time_input_err_to_str('send only the time you want to wake up by (e.g 7a)'))
@@ -0,0 +1,42 @@
+import pytest
+import common
+import utils
+from commands import timezone
+
+
+def test_timezone_default(mocked_update, mocked_context):
+    mocked_context.args = []
+
+    timezone.timezone(mocked_update, mocked_context)
+
+    mocked_context.bot.send_message.assert_called_with(
+        chat_id=0,
+        text=(common.hedgehog +
+              f"Your timezone is {utils.DEFAULT_TIMEZONE}\n\n" +
+              timezone.timezone_usage_txt)
+    )
+
+
+def test_timezone_set(mocked_update, mocked_context):
+    mocked_context.args = ['Europe/London']
+
+    timezone.timezone(mocked_update, mocked_context)
+
+    assert mocked_context.user_data['timezone'] == 'Europe/London'
+    mocked_context.bot.send_message.assert_called_with(
+        chat_id=0, text=common.hedgehog + "Got it! Your timezone is now Europe/London")
+
+
+@pytest.mark.parametrize("tz_name", ['Mars/Olympus', '../etc'])
+def test_timezone_invalid(mocked_update, mocked_context, tz_name):
+    mocked_context.args = [tz_name]
+
+    timezone.timezone(mocked_update, mocked_context)
+
+    assert 'timezone' not in mocked_context.user_data
+    mocked_context.bot.send_message.assert_called_with(
+        chat_id=0,
+        text=(common.hedgehog +
+              f"Sorry, {tz_name} is not a valid timezone\n\n" +
+              timezone.timezone_usage_txt)
+    )
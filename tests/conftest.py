@@ -2,6 +2,13 @@ import pytest
 from unittest import mock
 import datetime
 
+from clock import FrozenClock
+
+
+@pytest.fixture
+def frozen_clock():
+    return FrozenClock(datetime.datetime(2022, 1, 1, 0, 0, tzinfo=datetime.timezone.utc))
+
 
 @pytest.fixture
 def mocked_update():
@@ -11,7 +18,8 @@ def mocked_update():
 
 
 @pytest.fixture
-def mocked_context():
+def mocked_context(frozen_clock):
     mocked_context = mock.Mock()
     mocked_context.user_data = {}
+    mocked_context.now = frozen_clock.now()
     return mocked_context
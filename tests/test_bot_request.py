@@ -0,0 +1,107 @@
+import json
+import threading
+import pytest
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from telegram.error import NetworkError
+
+from bot_request import InstrumentedRequest
+
+
+class FakeBotApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # status codes to answer with before answering 200, 0 closes the connection without answering
+    failures = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length'] or 0))
+        status = self.failures.pop(0) if self.failures else 200
+        if status == 0:
+            # drops the connection after reading the request
+            self.close_connection = True
+            return
+        body = json.dumps({'ok': status == 200, 'result': True, 'description': 'error'}).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_bot_api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotApiHandler)
+    threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/bot123:token'
+    server.shutdown()
+    FakeBotApiHandler.failures = []
+
+
+def test_instrumented_request_endpoint_stats(fake_bot_api):
+    request = InstrumentedRequest(con_pool_size=2)
+
+    for _ in range(3):
+        request.post(f'{fake_bot_api}/sendMessage', {'chat_id': 1, 'text': 'hi'})
+    request.post(f'{fake_bot_api}/getMe', {})
+    stats = request.endpoint_stats()
+
+    assert stats['sendMessage']['requests'] == 3
+    assert stats['getMe']['requests'] == 1
+    # the connection is kept alive and reused
+    assert stats['sendMessage']['connects'] + stats['getMe']['connects'] == 1
+
+
+def test_instrumented_request_retries_bad_gateway(fake_bot_api):
+    FakeBotApiHandler.failures = [502]
+    request = InstrumentedRequest(retry_backoff=0)
+
+    assert request.post(f'{fake_bot_api}/getMe', {}) is True
+    assert request.endpoint_stats()['getMe']['retries'] == 1
+
+
+def test_instrumented_request_does_not_resend_after_bad_gateway(fake_bot_api):
+    FakeBotApiHandler.failures = [502]
+    request = InstrumentedRequest(retry_backoff=0)
+
+    # the message may have been sent before telegram's frontend answered 502
+    with pytest.raises(NetworkError):
+        request.post(f'{fake_bot_api}/sendMessage', {})
+    assert request.endpoint_stats()['sendMessage']['retries'] == 0
+
+
+def test_instrumented_request_gives_up(fake_bot_api):
+    FakeBotApiHandler.failures = [502, 502]
+    request = InstrumentedRequest(max_retries=1, retry_backoff=0)
+
+    with pytest.raises(NetworkError):
+        request.post(f'{fake_bot_api}/getMe', {})
+    assert request.endpoint_stats()['getMe']['errors'] == 1
+
+
+def test_instrumented_request_does_not_retry_rejected_calls(fake_bot_api):
+    FakeBotApiHandler.failures = [500]
+    request = InstrumentedRequest(retry_backoff=0)
+
+    with pytest.raises(NetworkError):
+        request.post(f'{fake_bot_api}/sendMessage', {})
+    assert request.endpoint_stats()['sendMessage']['retries'] == 0
+
+
+def test_instrumented_request_does_not_resend_after_a_broken_connection(fake_bot_api):
+    FakeBotApiHandler.failures = [0]
+    request = InstrumentedRequest(retry_backoff=0)
+
+    # the message may have been sent before the connection broke
+    with pytest.raises(NetworkError):
+        request.post(f'{fake_bot_api}/sendMessage', {})
+    assert request.endpoint_stats()['sendMessage']['retries'] == 0
+
+
+def test_instrumented_request_retries_idempotent_calls_after_a_broken_connection(fake_bot_api):
+    FakeBotApiHandler.failures = [0]
+    request = InstrumentedRequest(retry_backoff=0)
+
+    assert request.post(f'{fake_bot_api}/getMe', {}) is True
+    assert request.endpoint_stats()['getMe']['retries'] == 1
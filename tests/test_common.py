@@ -0,0 +1,180 @@
+import time
+import queue
+import datetime
+import threading
+import collections
+import pytest
+from unittest import mock
+
+from telegram import Update, Message, MessageEntity, Chat, User
+from telegram.ext import CommandHandler, Dispatcher, MessageHandler, Filters
+from telegram.ext.utils.promise import Promise
+
+import common
+import utils
+
+
+def make_text_update(text):
+    user = User(id=1, first_name='test', is_bot=False)
+    chat = Chat(id=1, type='private')
+    entities = []
+    if text.startswith('/'):
+        entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text.split(' ')[0]))]
+    message = Message(message_id=1, date=datetime.datetime.now(),
+                      chat=chat, from_user=user, text=text, entities=entities,
+                      bot=mock.Mock(username='gfhelper_bot'))
+    return Update(update_id=1, message=message)
+
+
+def test_concurrent_conversation_handler_queues_updates_of_a_busy_conversation():
+    # setup
+    handled = []
+    started, release = threading.Event(), threading.Event()
+
+    def first(update, context):
+        started.set()
+        release.wait(5)
+        handled.append(update.message.text)
+        return 1
+
+    def second(update, context):
+        handled.append(update.message.text)
+        return 1
+
+    handler = common.ConcurrentConversationHandler(
+        entry_points=[MessageHandler(Filters.regex('^start$'), first)],
+        states={1: [MessageHandler(Filters.text, second)]},
+        fallbacks=[]
+    )
+    dispatcher = Dispatcher(mock.Mock(), queue.Queue(), workers=2, use_context=True)
+    dispatcher.add_handler(handler)
+    ready = threading.Event()
+    threading.Thread(target=dispatcher.start, kwargs={'ready': ready}, daemon=True).start()
+    ready.wait()
+
+    # test
+    try:
+        dispatcher.process_update(make_text_update('start'))
+        started.wait(5)
+        for text in ('one', 'two'):
+            # returns while the conversation's first callback is still running
+            dispatcher.process_update(make_text_update(text))
+        handled_while_busy = list(handled)
+        release.set()
+        for _ in range(100):
+            if len(handled) == 3 and not handler._waiting:
+                break
+            time.sleep(0.01)
+    finally:
+        release.set()
+        dispatcher.stop()
+
+    # assertions
+    assert handled_while_busy == []
+    assert handled == ['start', 'one', 'two']
+    assert handler._waiting == {}
+
+
+def test_concurrent_conversation_handler_leaves_other_updates_while_busy():
+    # setup
+    answered = threading.Event()
+    started, release = threading.Event(), threading.Event()
+
+    def est(update, context):
+        started.set()
+        release.wait(5)
+        return 1
+
+    handler = common.ConcurrentConversationHandler(
+        entry_points=[CommandHandler('est', est)],
+        states={1: [MessageHandler(Filters.regex('^[0-9]+m$'), lambda u, c: None)]},
+        fallbacks=[CommandHandler('cancel', lambda u, c: None)]
+    )
+    dispatcher = Dispatcher(mock.Mock(), queue.Queue(), workers=2, use_context=True)
+    dispatcher.add_handler(handler)
+    dispatcher.add_handler(CommandHandler('help', lambda u, c: answered.set()))
+    ready = threading.Event()
+    threading.Thread(target=dispatcher.start, kwargs={'ready': ready}, daemon=True).start()
+    ready.wait()
+
+    # test
+    try:
+        dispatcher.process_update(make_text_update('/est'))
+        started.wait(5)
+        dispatcher.process_update(make_text_update('/help'))
+        unknown = handler.check_update(make_text_update('hello'))
+        duration = handler.check_update(make_text_update('45m'))
+    finally:
+        release.set()
+        dispatcher.stop()
+
+    # assertions
+    assert answered.is_set()
+    assert unknown is None
+    assert duration == ((1, 1), None, None)
+
+
+def test_concurrent_conversation_handler_does_not_wait_in_check_update():
+    # setup
+    handler = common.ConcurrentConversationHandler(
+        entry_points=[],
+        states={0: [MessageHandler(Filters.text, lambda u, c: 1)]},
+        fallbacks=[]
+    )
+    handler.conversations[(1, 1)] = (0, Promise(lambda: 1, [], {}))
+    handler._waiting[(1, 1)] = collections.deque()
+
+    # test
+    check = handler.check_update(make_text_update('hi'))
+    handler.handle_update(make_text_update('hi'), mock.Mock(), check, 'context')
+
+    # assertions
+    assert check == ((1, 1), None, None)
+    assert [context for _, context in handler._waiting[(1, 1)]] == ['context']
+
+
+def test_concurrent_conversation_handler_runs_async():
+    handler = common.ConcurrentConversationHandler(
+        entry_points=[MessageHandler(Filters.text, lambda u, c: 0)],
+        states={},
+        fallbacks=[]
+    )
+
+    assert all(h.run_async for h in handler.entry_points)
+
+
+@pytest.mark.parametrize(
+    "text, kinds, expected",
+    [
+        ('930a', (utils.TIME,), True),
+        ('930a', (utils.DURATION,), False),
+        ('1h 30m', (utils.DURATION,), True),
+        ('hello', (utils.TIME, utils.DURATION), False),
+    ]
+)
+def test_input_filter(text, kinds, expected):
+    update = make_text_update(text)
+
+    assert common.InputFilter(*kinds)(update) is expected
+
+
+@pytest.mark.parametrize("routes, expected", [(None, False), (mock.Mock(), True)])
+def test_routes_filter(monkeypatch, routes, expected):
+    monkeypatch.setattr(common.UpdateContext, 'routes', routes)
+
+    assert common.RoutesFilter()(make_text_update('Bishan to City Hall')) is expected
+
+
+def test_update_context_reads_clock_once(frozen_clock):
+    # setup
+    context = common.UpdateContext(mock.Mock(use_context=True))
+    context.clock = mock.Mock(wraps=frozen_clock)
+
+    # test
+    first = context.now
+    frozen_clock.advance(datetime.timedelta(minutes=1))
+    second = context.now
+
+    # assertions
+    assert first == second
+    context.clock.now.assert_called_once()
@@ -0,0 +1,50 @@
+from error_reports import ErrorReports, error_fingerprint, error_summary
+
+
+def raise_value_error(text):
+    raise ValueError(f'{text} is not a valid timezone')
+
+
+def raise_key_error(key):
+    raise KeyError(key)
+
+
+def catch(func, *args):
+    try:
+        func(*args)
+    except Exception as err:
+        return err
+
+
+def test_error_fingerprint():
+    # same bug, different messages
+    assert error_fingerprint(catch(raise_value_error, 'a')) == error_fingerprint(catch(raise_value_error, 'b'))
+    assert error_fingerprint(catch(raise_value_error, 'a')) != error_fingerprint(catch(raise_key_error, 'a'))
+
+
+def test_error_summary():
+    summary = error_summary(catch(raise_value_error, 'x' * 500))
+
+    assert summary.startswith('ValueError: xxx')
+    assert summary.endswith(' in raise_value_error)')
+    assert '(test_error_reports.py:' in summary
+    assert len(summary) < 300
+
+
+def test_error_reports():
+    # setup
+    reports = ErrorReports()
+
+    # test
+    first = [reports.record(catch(raise_value_error, i)) for i in range(5)]
+    first.append(reports.record(catch(raise_key_error, 'reach_time')))
+    digest = reports.digest()
+
+    # assertions
+    assert first == [True, False, False, False, False, True]
+    assert [(entry.count, entry.total) for entry in digest] == [(4, 5)]
+    assert digest[0].summary.startswith('ValueError: 0 is not a valid timezone')
+    # counts start over after every digest
+    assert reports.digest() == []
+    reports.record(catch(raise_key_error, 'reach_time'))
+    assert [(entry.count, entry.total) for entry in reports.digest()] == [(1, 2)]
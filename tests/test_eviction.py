@@ -0,0 +1,141 @@
+import datetime
+import pytest
+from unittest import mock
+
+from telegram.ext import CommandHandler, ConversationHandler, MessageHandler, Filters
+
+import eviction
+import registry
+from persistence import SqlitePersistence
+
+
+def make_conversation():
+    return ConversationHandler(
+        entry_points=[CommandHandler('plan', lambda update, context: 0)],
+        states={0: [MessageHandler(Filters.text, lambda update, context: ConversationHandler.END)]},
+        fallbacks=[],
+        name='plan',
+        persistent=True
+    )
+
+
+@pytest.fixture
+def persistence(tmp_path):
+    persistence = SqlitePersistence(str(tmp_path / 'persistence.sqlite3'), flush_interval=60)
+    yield persistence
+    persistence.flush()
+
+
+@pytest.fixture
+def commands():
+    conversation = make_conversation()
+    commands = mock.Mock(names=['plan'])
+    commands.all_loaded.return_value = True
+    commands.loaded.return_value = [
+        registry.Command('plan', None, None, [conversation], user_data_keys=('plan_time',))]
+    return commands
+
+
+@pytest.fixture
+def dispatcher(persistence, commands):
+    dispatcher = mock.Mock(persistence=persistence)
+    dispatcher.user_data = persistence.get_user_data()
+    conversation = commands.loaded.return_value[0].handlers[0]
+    conversation.persistence = persistence
+    conversation.conversations = persistence.get_conversations('plan')
+    return dispatcher
+
+
+def test_evictor_times_out_idle_conversations(frozen_clock, persistence, commands, dispatcher):
+    # setup
+    notify = mock.Mock()
+    conversation = commands.loaded.return_value[0].handlers[0]
+    evictor = eviction.StateEvictor(commands, dispatcher, notify, conversation_ttl=datetime.timedelta(minutes=30),
+                                    clock=frozen_clock)
+    for user_id in (1, 2):
+        evictor.touch(10 + user_id, user_id)
+        conversation.conversations[(10 + user_id, user_id)] = 0
+        dispatcher.user_data[user_id].update(plan_time=1, timezone='Europe/London')
+
+    # test
+    frozen_clock.advance(datetime.timedelta(minutes=20))
+    evictor.touch(12, 2)
+    frozen_clock.advance(datetime.timedelta(minutes=15))
+    result = evictor.evict()
+
+    # assertions
+    assert result == (1, 0)
+    assert conversation.conversations == {(12, 2): 0}
+    assert dispatcher.user_data[1] == {'timezone': 'Europe/London'}
+    assert dispatcher.user_data[2] == {'plan_time': 1, 'timezone': 'Europe/London'}
+    notify.assert_called_once_with(11, eviction.timed_out_text('plan'))
+
+
+def test_evictor_keeps_conversations_being_handled(frozen_clock, commands, dispatcher):
+    # setup
+    notify = mock.Mock()
+    conversation = commands.loaded.return_value[0].handlers[0]
+    evictor = eviction.StateEvictor(commands, dispatcher, notify, clock=frozen_clock)
+    evictor.touch(11, 1)
+    conversation.conversations[(11, 1)] = (0, mock.Mock(spec=eviction.Promise))
+
+    # test
+    frozen_clock.advance(datetime.timedelta(hours=1))
+    evictor.evict()
+
+    # assertions
+    assert (11, 1) in conversation.conversations
+    notify.assert_not_called()
+
+
+def test_evictor_times_out_persisted_conversations(frozen_clock, persistence, commands, dispatcher):
+    # setup
+    conversation = commands.loaded.return_value[0].handlers[0]
+    conversation.conversations[(11, 1)] = 0
+
+    # test
+    evictor = eviction.StateEvictor(commands, dispatcher, mock.Mock(), clock=frozen_clock)
+    frozen_clock.advance(datetime.timedelta(hours=1))
+    result = evictor.evict()
+
+    # assertions
+    assert result == (1, 0)
+    assert conversation.conversations == {}
+
+
+def test_evictor_evicts_user_data_over_the_memory_cap(frozen_clock, persistence, commands, dispatcher):
+    # setup
+    evictor = eviction.StateEvictor(commands, dispatcher, mock.Mock(), max_user_data_bytes=1000,
+                                    clock=frozen_clock)
+    for user_id in range(1, 11):
+        evictor.touch(user_id, user_id)
+        persistence.update_user_data(user_id, {'notes': 'x' * 200})
+        dispatcher.user_data[user_id] = {'notes': 'x' * 200}
+
+    # test
+    result = evictor.evict()
+
+    # assertions
+    assert result == (0, 6)
+    assert persistence.user_data_bytes <= 1000
+    assert sorted(dict.keys(dispatcher.user_data)) == [7, 8, 9, 10]
+    # evicted user_data is loaded again when it is needed
+    assert dispatcher.user_data[1] == {'notes': 'x' * 200}
+
+
+def test_evictor_evicts_idle_user_data(frozen_clock, persistence, commands, dispatcher):
+    # setup
+    evictor = eviction.StateEvictor(commands, dispatcher, mock.Mock(), user_data_ttl=datetime.timedelta(days=1),
+                                    clock=frozen_clock)
+    evictor.touch(1, 1)
+    persistence.update_user_data(1, {'timezone': 'Europe/London'})
+    dispatcher.user_data[1] = {'timezone': 'Europe/London'}
+
+    # test
+    frozen_clock.advance(datetime.timedelta(days=2))
+    evictor.evict()
+
+    # assertions
+    assert not dict.__contains__(dispatcher.user_data, 1)
+    assert persistence.user_data_bytes == 0
+    assert dispatcher.user_data[1] == {'timezone': 'Europe/London'}
@@ -0,0 +1,87 @@
+import os
+import queue
+import threading
+import time
+from unittest import mock
+
+from telegram.ext import Dispatcher, Filters, MessageHandler
+
+# main reads its configuration when it is imported
+os.environ.setdefault('API_KEY', '123:token')
+os.environ.setdefault('DEV', '')
+import main  # noqa: E402
+import webhook  # noqa: E402
+from error_reports import DigestEntry  # noqa: E402
+from tests.test_webhook import post  # noqa: E402
+
+WebhookServer = webhook.WebhookServer
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': text,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Shawn'}}}
+
+
+def test_run_webhook_runs_async_handlers(monkeypatch):
+    # setup
+    handled = threading.Event()
+    stop = threading.Event()
+    bot = mock.Mock()
+    dispatcher = Dispatcher(bot, queue.Queue(), workers=2, use_context=True)
+    dispatcher.add_handler(MessageHandler(Filters.text, lambda update, context: handled.set(), run_async=True))
+    updater = mock.Mock(bot=bot, dispatcher=dispatcher, persistence=None)
+    servers = []
+
+    def make_server(**kwargs):
+        servers.append(WebhookServer(**kwargs))
+        return servers[-1]
+
+    monkeypatch.setattr(webhook, 'WebhookServer', make_server)
+    monkeypatch.setattr(main.common.UpdateContext, 'reminders', mock.Mock())
+    monkeypatch.setattr(main, 'PORT', 0)
+    monkeypatch.setattr(main, 'wait_for_stop_signal', stop.wait)
+    monkeypatch.setenv('HEROKU_APP_NAME', 'gfhelper')
+    errors = []
+
+    def run_webhook():
+        try:
+            main.run_webhook(updater)
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=run_webhook)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not bot.set_webhook.called and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # test
+    status = post(servers[0], make_update(1, 42, 'hi'), path='/' + main.API_KEY)
+    ran = handled.wait(5)
+    stop.set()
+    thread.join(5)
+
+    # assertions
+    assert status == 200
+    assert ran
+    assert not thread.is_alive() and errors == []
+
+
+def test_send_error_digest_splits_between_lines(monkeypatch):
+    # setup
+    summary = 'ValueError: ' + '<b>' * 60
+    digest = [DigestEntry(str(i), summary, 1, 2) for i in range(40)]
+    monkeypatch.setenv('DEVELOPER_CHAT_ID', '1')
+    context = mock.Mock()
+    context.error_reports.digest.return_value = digest
+
+    # test
+    main.send_error_digest(context)
+    texts = [call.kwargs['text'] for call in context.bot.send_message.call_args_list]
+
+    # assertions
+    assert len(texts) > 1
+    assert all(len(text) <= 4096 and text.count('<code>') == text.count('</code>') for text in texts)
+    assert sum(text.count('<code>') for text in texts) == 40
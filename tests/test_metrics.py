@@ -0,0 +1,93 @@
+import datetime
+import pytest
+
+from telegram import Update, Message, Chat, User
+from telegram.ext import CommandHandler, ConversationHandler, MessageHandler, Filters
+
+import metrics
+
+
+def make_text_update(text):
+    user = User(id=1, first_name='test', is_bot=False)
+    chat = Chat(id=1, type='private')
+    message = Message(message_id=1, date=datetime.datetime.now(), chat=chat, from_user=user, text=text)
+    return Update(update_id=1, message=message)
+
+
+def test_histogram_render():
+    # setup
+    histogram = metrics.Histogram('test_seconds', 'test', ('handler',), buckets=(0.1, 1.0))
+
+    # test
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(('est',), value)
+    text = metrics.render([histogram.collect()])
+
+    # assertions
+    assert text.splitlines() == [
+        '# HELP test_seconds test',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{handler="est",le="0.1"} 2',
+        'test_seconds_bucket{handler="est",le="1"} 3',
+        'test_seconds_bucket{handler="est",le="+Inf"} 4',
+        'test_seconds_sum{handler="est"} 3.65',
+        'test_seconds_count{handler="est"} 4',
+    ]
+
+
+def test_counter_render_escapes_labels():
+    counter = metrics.Counter('test_total', 'test', ('text',))
+
+    counter.inc(('say "hi"\n',), 2)
+
+    assert metrics.render([counter.collect()]).splitlines()[-1] == 'test_total{text="say \\"hi\\"\\n"} 2'
+
+
+def test_merge():
+    # setup
+    family = metrics.gauge('test_depth', 'test', [((('lane', 'bulk'),), 1)])
+
+    # test
+    merged = metrics.merge({1: [family], 0: [family]}, 'worker')
+
+    # assertions
+    assert merged == [('test_depth', 'gauge', 'test', [
+        ('', (('worker', '0'), ('lane', 'bulk')), 1),
+        ('', (('worker', '1'), ('lane', 'bulk')), 1),
+    ])]
+
+
+def test_instrument_conversation_handler():
+    # setup
+    def start(update, context):
+        return 0
+
+    def fail(update, context):
+        raise ValueError('bad input')
+
+    def finish(update, context):
+        return ConversationHandler.END
+
+    handler = ConversationHandler(
+        entry_points=[CommandHandler('start', start)],
+        states={0: [MessageHandler(Filters.regex('fail'), fail), MessageHandler(Filters.text, finish)]},
+        fallbacks=[],
+        name='test_instrument'
+    )
+    metrics.instrument_handler(handler)
+    metrics.instrument_handler(handler)
+    update = make_text_update('hi')
+
+    # test
+    handler.entry_points[0].callback(update, None)
+    handler.conversations[(1, 1)] = 0
+    with pytest.raises(ValueError):
+        handler.states[0][0].callback(update, None)
+    handler.states[0][1].callback(update, None)
+
+    # assertions
+    assert metrics.state_transitions.value(('test_instrument', 'start', '0')) == 1
+    assert metrics.state_transitions.value(('test_instrument', '0', 'end')) == 1
+    assert metrics.handler_errors.value(('test_instrument', 'fail')) == 1
+    # instrumenting twice does not count twice
+    assert metrics.handler_seconds.count(('test_instrument', 'finish')) == 1
@@ -0,0 +1,148 @@
+import time
+import pytest
+from unittest import mock
+
+from telegram import Bot
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+import outbound
+
+
+def test_token_bucket():
+    bucket = outbound.TokenBucket(rate=1, capacity=2)
+    now = bucket.updated_at
+
+    bucket.consume(now)
+    bucket.consume(now)
+
+    assert bucket.delay(now) == pytest.approx(1)
+    assert bucket.delay(now + 0.5) == pytest.approx(0.5)
+    assert bucket.delay(now + 1) == 0
+
+
+def test_outbound_queue_priority_lanes():
+    # setup
+    queue = outbound.OutboundQueue(workers=0)
+    queue.submit(1, lambda: 'bulk', outbound.BULK)
+    queue.submit(2, lambda: 'notification', outbound.NOTIFICATION)
+    queue.submit(3, lambda: 'interactive', outbound.INTERACTIVE)
+
+    # test
+    sent = [queue._next_item().send() for _ in range(3)]
+
+    # assertions
+    assert sent == ['interactive', 'notification', 'bulk']
+
+
+def test_outbound_queue_chat_rate_limit():
+    # setup
+    queue = outbound.OutboundQueue(chat_rate=1000, chat_burst=1, workers=0)
+    queue.submit(1, lambda: 'first to chat 1')
+    queue.submit(1, lambda: 'second to chat 1')
+    queue.submit(2, lambda: 'first to chat 2')
+
+    # test
+    sent = [queue._next_item().send() for _ in range(3)]
+
+    # assertions
+    assert sent == ['first to chat 1', 'first to chat 2', 'second to chat 1']
+
+
+def test_outbound_queue_retries_flood_limited_sends():
+    # setup
+    attempts = []
+
+    def send():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RetryAfter(0.05)
+        return 'sent'
+
+    queue = outbound.OutboundQueue(workers=1)
+
+    # test
+    result = queue.submit(1, send).result(timeout=5)
+    queue.stop()
+
+    # assertions
+    assert result == 'sent'
+    assert attempts[1] - attempts[0] >= 0.05
+
+
+def test_outbound_queue_logs_failed_lower_priority_sends(caplog):
+    # setup
+    def send():
+        raise ValueError('chat not found')
+
+    queue = outbound.OutboundQueue(workers=1)
+
+    # test
+    with pytest.raises(ValueError):
+        queue.submit(1, send).result(timeout=5)
+    with pytest.raises(ValueError):
+        queue.submit(2, send, outbound.BULK).result(timeout=5)
+    queue.stop()
+
+    # assertions
+    assert [record.getMessage() for record in caplog.records] == ['Failed to send a bulk message to 2']
+
+
+def test_outbound_queue_stats():
+    queue = outbound.OutboundQueue(workers=1)
+
+    queue.submit(1, lambda: None).result(timeout=5)
+    queue.submit(1, lambda: None, outbound.BULK).result(timeout=5)
+    stats = queue.stats()
+    queue.stop()
+
+    assert stats['interactive']['sent'] == 1
+    assert stats['bulk']['sent'] == 1
+    assert stats['notification'] == {'depth': 0, 'sent': 0, 'mean_wait': 0.0, 'max_wait': 0.0}
+
+
+def test_outbound_queue_stop_fails_queued_sends():
+    # setup
+    queue = outbound.OutboundQueue(chat_rate=0.001, chat_burst=1, workers=1)
+    queue.submit(1, lambda: 'sent').result(timeout=5)
+    # waits for its chat's bucket
+    waiting = queue.submit(1, lambda: 'sent')
+
+    # test
+    queue.stop()
+
+    # assertions
+    with pytest.raises(NetworkError):
+        waiting.result(timeout=0)
+
+
+def test_queued_bot_send_message_times_out():
+    # setup
+    queue = outbound.OutboundQueue(chat_rate=0.001, chat_burst=1, workers=1)
+    bot = outbound.QueuedBot('123:token', outbound=queue, send_timeout=0.05)
+    queue.submit(1, lambda: 'sent').result(timeout=5)
+
+    # test
+    with mock.patch.object(Bot, 'send_message', return_value='message') as send_message:
+        with pytest.raises(TimedOut):
+            bot.send_message(1, 'hi')
+        queue.stop()
+
+    # assertions
+    send_message.assert_not_called()
+
+
+def test_queued_bot_send_message():
+    # setup
+    queue = outbound.OutboundQueue(workers=1)
+    bot = outbound.QueuedBot('123:token', outbound=queue)
+
+    # test
+    with mock.patch.object(Bot, 'send_message', return_value='message') as send_message:
+        interactive = bot.send_message(1, 'hi')
+        notification = bot.send_message(1, 'error', priority=outbound.NOTIFICATION).result(timeout=5)
+    queue.stop()
+
+    # assertions
+    assert interactive == 'message'
+    assert notification == 'message'
+    send_message.assert_called_with(1, 'error')
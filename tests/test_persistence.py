@@ -0,0 +1,131 @@
+import pytest
+import sqlite3
+import datetime
+
+from telegram.ext import ConversationHandler
+from telegram.ext.utils.promise import Promise
+
+from persistence import SqlitePersistence
+
+
+def test_sqlite_persistence_roundtrip(tmp_path):
+    # setup
+    filename = str(tmp_path / 'persistence.sqlite3')
+    reach_time = datetime.datetime(2022, 1, 1, 1, 30, tzinfo=datetime.timezone.utc)
+    persistence = SqlitePersistence(filename, flush_interval=60)
+
+    # test
+    persistence.update_user_data(1, {'reach_time': reach_time})
+    persistence.update_chat_data(2, {'members': 3})
+    persistence.update_conversation('est', (2, 1), 1)
+    persistence.flush()
+    reloaded = SqlitePersistence(filename)
+
+    # assertions
+    assert reloaded.get_user_data()[1] == {'reach_time': reach_time}
+    assert reloaded.get_chat_data()[2] == {'members': 3}
+    assert reloaded.get_conversations('est') == {(2, 1): 1}
+    reloaded.flush()
+
+
+def test_sqlite_persistence_ended_conversation_is_deleted(tmp_path):
+    filename = str(tmp_path / 'persistence.sqlite3')
+    persistence = SqlitePersistence(filename, flush_interval=60)
+
+    persistence.update_conversation('est', (2, 1), 1)
+    persistence.update_conversation('est', (2, 1), None)
+    persistence.flush()
+    reloaded = SqlitePersistence(filename)
+
+    assert reloaded.get_conversations('est') == {}
+    reloaded.flush()
+
+
+def test_sqlite_persistence_failed_batch_is_retried(tmp_path):
+    # setup
+    filename = str(tmp_path / 'persistence.sqlite3')
+    persistence = SqlitePersistence(filename, flush_interval=60)
+    persistence._connection.execute(
+        "CREATE TRIGGER fail BEFORE INSERT ON store BEGIN SELECT RAISE(ABORT, 'disk is full'); END")
+    persistence.update_user_data(1, {'members': 1})
+    persistence.update_chat_data(2, {'members': 3})
+
+    # test
+    with pytest.raises(sqlite3.Error):
+        persistence._write_pending()
+    persistence.update_user_data(1, {'members': 2})
+    persistence._connection.execute('DROP TRIGGER fail')
+    persistence.flush()
+    reloaded = SqlitePersistence(filename)
+
+    # assertions
+    assert reloaded.get_user_data()[1] == {'members': 2}
+    assert reloaded.get_chat_data()[2] == {'members': 3}
+    reloaded.flush()
+
+
+def test_sqlite_persistence_pending_conversation_state(tmp_path):
+    # setup
+    filename = str(tmp_path / 'persistence.sqlite3')
+    persistence = SqlitePersistence(filename, flush_interval=60)
+    handler = ConversationHandler(entry_points=[], states={}, fallbacks=[], name='sleep', persistent=True)
+    handler.persistence = persistence
+    handler.conversations = {(2, 1): 0}
+    promise = Promise(lambda: ConversationHandler.END, [], {})
+
+    # test
+    # a run_async handler is still running, ConversationHandler persists ((0, promise), promise)
+    handler._update_state(promise, (2, 1))
+    persistence._write_pending()
+    pending_state = persistence._load('conversation:sleep')
+    promise.run()
+    persistence.flush()
+    reloaded = SqlitePersistence(filename)
+
+    # assertions
+    assert pending_state == [('[2, 1]', 0)]
+    assert reloaded.get_conversations('sleep') == {}
+    reloaded.flush()
+
+
+def test_sqlite_persistence_loads_user_data_on_demand(tmp_path):
+    # setup
+    filename = str(tmp_path / 'persistence.sqlite3')
+    persistence = SqlitePersistence(filename, flush_interval=60)
+    # the dispatcher's copy, which only gets the users' user_data when they send an update
+    user_data = persistence.get_user_data()
+    persistence.update_user_data(1, {'timezone': 'Europe/London'})
+    persistence._write_pending()
+    persistence.update_user_data(2, {'timezone': 'Asia/Tokyo'})
+
+    # test
+    persistence.evict_user_data(1)
+    persistence.evict_user_data(2)
+    evicted_bytes = persistence.user_data_bytes
+    # one written to disk and one still pending
+    loaded = (user_data[1], user_data[2], user_data[3])
+
+    # assertions
+    assert evicted_bytes == 0
+    assert loaded == ({'timezone': 'Europe/London'}, {'timezone': 'Asia/Tokyo'}, {})
+    assert persistence.user_data_bytes > 0
+    persistence.flush()
+
+
+def test_sqlite_persistence_shared_user_data(tmp_path):
+    # setup
+    filename = str(tmp_path / 'persistence.sqlite3')
+    first = SqlitePersistence(filename, flush_interval=60, shared_user_data=True)
+    second = SqlitePersistence(filename, flush_interval=60, shared_user_data=True)
+    # the dispatcher's dict in the second process, from before the first changed it
+    user_data = second.get_user_data()[1]
+    user_data.update({'timezone': 'Europe/London', 'reach_time': 1})
+
+    # test
+    first.update_user_data(1, {'timezone': 'Asia/Tokyo'})
+    second.refresh_user_data(1, user_data)
+
+    # assertions
+    assert user_data == {'timezone': 'Asia/Tokyo'}
+    first.flush()
+    second.flush()
@@ -0,0 +1,58 @@
+import datetime
+import pytest
+
+import planner
+import utils
+
+
+def utc(day, hour, minute):
+    return datetime.datetime(2022, 3, day, hour, minute, tzinfo=utils.UTC)
+
+
+def test_plan_leave_times():
+    reach_time = utc(1, 1, 30)
+    reach = utils.to_epoch_minutes(reach_time)
+
+    leave_times, get_ready_times = planner.plan_leave_times(reach_time, [45, 90], [30, 0])
+
+    assert leave_times == [reach - 45, reach - 90]
+    assert get_ready_times == [reach - 75, reach - 90]
+
+
+@pytest.mark.parametrize(
+    "times, tz_name",
+    [
+        ([utc(1, 1, 30), utc(1, 0, 45), utc(1, 16, 0)], 'Asia/Singapore'),
+        # London clocks go forward at 1:00 UTC on 27 March 2022
+        ([utc(27, 0, 30), utc(27, 1, 30)], 'Europe/London'),
+    ]
+)
+def test_label_epoch_minutes(times, tz_name):
+    expected = [utils.convert_utc_to_local(time, tz_name).strftime('%I:%M %p') for time in times]
+
+    labels = planner.label_epoch_minutes([utils.to_epoch_minutes(time) for time in times], tz_name)
+
+    assert labels == expected
+
+
+def test_outing_summary_texts_order():
+    members = [planner.Member('late', 15, 0), planner.Member('early', 60, 30)]
+
+    texts = planner.outing_summary_texts(utc(1, 1, 30), members, 'Asia/Singapore')
+
+    assert texts == [
+        planner.common.hedgehog +
+        "To reach by 09:30 AM:\n"
+        "early: get ready by 08:00 AM, leave at 08:30 AM\n"
+        "late: get ready by 09:15 AM, leave at 09:15 AM\n"
+    ]
+
+
+def test_outing_summary_texts_splits_long_summaries():
+    members = [planner.Member(f'member {i}', i % 120 + 1, i % 60) for i in range(1000)]
+
+    texts = planner.outing_summary_texts(utc(1, 1, 30), members)
+
+    assert len(texts) > 1
+    assert all(len(text) <= planner.max_message_length for text in texts)
+    assert sum(text.count('\n') for text in texts) == 1000 + 2
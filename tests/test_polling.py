@@ -0,0 +1,102 @@
+import threading
+import time
+
+from polling import PipelinedPoller
+
+
+def make_update(update_id: int) -> dict:
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'chat': {'id': 1}, 'text': 'hi'}}
+
+
+class FakeTelegram:
+    """Answers getUpdates from a list of batches, later requests wait as if nothing was sent to the bot"""
+
+    def __init__(self, batches: list):
+        self.batches = list(batches)
+        self.offsets = []
+
+    def fetch(self, offset, limit, timeout):
+        self.offsets.append(offset)
+        if self.batches:
+            return [make_update(update_id) for update_id in self.batches.pop(0)][:limit]
+        time.sleep(0.01)
+        return []
+
+
+def wait_until(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_poller_handles_batches_in_order(tmp_path):
+    # setup
+    telegram = FakeTelegram([[1, 2], [3], [4, 5]])
+    processed = []
+    poller = PipelinedPoller(str(tmp_path / 'journal.sqlite3'), telegram.fetch,
+                             lambda data: processed.append(data['update_id']), poll_timeout=1)
+
+    # test
+    poller.start()
+    wait_until(lambda: len(processed) == 5)
+    poller.stop()
+
+    # assertions
+    assert processed == [1, 2, 3, 4, 5]
+    assert telegram.offsets[:4] == [None, 3, 4, 6]
+
+
+def test_poller_stops_fetching_when_handlers_fall_behind(tmp_path):
+    # setup
+    telegram = FakeTelegram([[update_id] for update_id in range(1, 11)])
+    release = threading.Event()
+    poller = PipelinedPoller(str(tmp_path / 'journal.sqlite3'), telegram.fetch, lambda data: release.wait(5),
+                             prefetch=2, poll_timeout=1)
+
+    # test
+    poller.start()
+    wait_until(lambda: poller.buffered() == 2)
+    time.sleep(0.05)
+
+    # assertions
+    # one batch being handled and two waiting
+    assert len(telegram.offsets) == 3
+    release.set()
+    poller.stop()
+
+
+def test_poller_resumes_from_the_journal(tmp_path):
+    # setup
+    filename = str(tmp_path / 'journal.sqlite3')
+    processed = []
+    handling = threading.Event()
+    release = threading.Event()
+
+    def process_update(data):
+        processed.append(data['update_id'])
+        if data['update_id'] == 2:
+            handling.set()
+            release.wait(5)
+
+    poller = PipelinedPoller(filename, FakeTelegram([[1, 2, 3], [4]]).fetch, process_update, poll_timeout=1)
+    poller.start()
+    assert handling.wait(5)
+    wait_until(lambda: poller.buffered() == 1)
+    stopper = threading.Thread(target=poller.stop)
+    stopper.start()
+    poller._stopped.wait(5)
+    release.set()
+    stopper.join()
+
+    # test
+    telegram = FakeTelegram([[5]])
+    poller = PipelinedPoller(filename, telegram.fetch, lambda data: processed.append(data['update_id']),
+                             poll_timeout=1)
+    poller.start()
+    wait_until(lambda: len(processed) == 5)
+    poller.stop()
+
+    # assertions
+    assert processed == [1, 2, 3, 4, 5]
+    assert telegram.offsets[0] == 5
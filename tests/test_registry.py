@@ -0,0 +1,166 @@
+import datetime
+import sys
+import pytest
+from unittest import mock
+
+from telegram import Update, Message, Chat, User, MessageEntity, InlineQuery
+
+import metrics
+import registry
+from commands import est, inline
+
+
+def make_text_update(text):
+    user = User(id=1, first_name='test', is_bot=False)
+    chat = Chat(id=1, type='private')
+    entities = []
+    if text.startswith('/'):
+        entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text.split(' ')[0]))]
+    message = Message(message_id=1, date=datetime.datetime.now(), chat=chat, from_user=user, text=text,
+                      entities=entities, bot=mock.Mock(username='gfhelper_bot'))
+    return Update(update_id=1, message=message)
+
+
+def make_inline_update(query):
+    user = User(id=1, first_name='test', is_bot=False)
+    return Update(update_id=1, inline_query=InlineQuery(id='1', from_user=user, query=query, offset=''))
+
+
+@pytest.fixture
+def fake_commands(tmp_path, monkeypatch):
+    """A commands package whose modules record when they are imported"""
+    package = tmp_path / 'fake_commands'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    for name in ('alpha', 'beta'):
+        (package / f'{name}.py').write_text(
+            'import registry\n'
+            'from unittest import mock\n'
+            'from telegram.ext import CommandHandler\n'
+            f'handler = CommandHandler("{name}", mock.Mock(__name__="{name}"))\n'
+            f'command = registry.Command("{name}", "{name} things", "{name} help", [handler])\n'
+        )
+    (package / 'wrong.py').write_text(
+        'import registry\n'
+        'command = registry.Command("right", None, None, [])\n'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield registry.CommandRegistry('fake_commands')
+    for name in [name for name in sys.modules if name.startswith('fake_commands')]:
+        del sys.modules[name]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('/est 930a', 'est'),
+        ('/est@gfhelper_bot', 'est'),
+        ('/EST', 'est'),
+        ('est', ''),
+        ('hello /est', ''),
+    ]
+)
+def test_command_name(text, expected):
+    assert registry.command_name(text) == expected
+
+
+def test_registry_imports_commands_on_first_use(fake_commands):
+    # test
+    names = fake_commands.names
+    alpha = fake_commands.get('alpha')
+
+    # assertions
+    assert names == ['alpha', 'beta', 'wrong']
+    assert alpha.help == 'alpha help'
+    assert 'fake_commands.alpha' in sys.modules
+    assert 'fake_commands.beta' not in sys.modules
+    assert fake_commands.get('gamma') is None
+
+
+def test_registry_rejects_misnamed_commands(fake_commands):
+    with pytest.raises(ValueError):
+        fake_commands.get('wrong')
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('/est 930a 45m', est.est_args_handler),
+        ('/est', est.est_convo_handler),
+        ('/unknown', None),
+        ('930a', None),
+    ]
+)
+def test_command_dispatcher_routes_by_command(text, expected):
+    # setup
+    dispatcher = registry.CommandDispatcher(registry.CommandRegistry('commands'))
+
+    # test
+    match = dispatcher.check_update(make_text_update(text))
+
+    # assertions
+    assert (match[0] if match else None) is expected
+    assert dispatcher.run_async is (expected is not None)
+
+
+def test_command_dispatcher_routes_messages_to_conversations(monkeypatch):
+    # setup
+    commands = registry.CommandRegistry('commands')
+    commands.all()
+    dispatcher = registry.CommandDispatcher(commands)
+    monkeypatch.setitem(est.est_convo_handler.conversations, (1, 1), est.EST_TRAVEL)
+
+    # test
+    duration = dispatcher.check_update(make_text_update('45m'))
+    cancel = dispatcher.check_update(make_text_update('/cancel'))
+
+    # assertions
+    assert duration[0] is est.est_convo_handler
+    assert cancel[0] is est.est_convo_handler
+
+
+def test_command_dispatcher_routes_inline_queries():
+    dispatcher = registry.CommandDispatcher(registry.CommandRegistry('commands'))
+
+    match = dispatcher.check_update(make_inline_update('sleep 7a'))
+
+    assert match[0] is inline.inline_handler
+
+
+def test_command_dispatcher_only_checks_the_command(fake_commands):
+    # setup
+    dispatcher = registry.CommandDispatcher(fake_commands)
+
+    # test
+    match = dispatcher.check_update(make_text_update('/beta'))
+
+    # assertions
+    assert match[0] is sys.modules['fake_commands.beta'].handler
+    assert 'fake_commands.alpha' not in sys.modules
+
+
+def test_command_dispatcher_loads_persisted_conversations(fake_commands):
+    # setup
+    persistence = mock.Mock()
+    persistence.get_conversations.side_effect = lambda name: {(1, 1): 0} if name == 'alpha' else {}
+    dispatcher = registry.CommandDispatcher(fake_commands, persistence)
+
+    # test
+    match = dispatcher.check_update(make_text_update('hello'))
+
+    # assertions
+    assert match is None
+    assert fake_commands.is_loaded('alpha')
+    assert not fake_commands.is_loaded('beta')
+
+
+def test_command_dispatcher_instrumented_on_load(fake_commands):
+    # setup
+    dispatcher = registry.CommandDispatcher(fake_commands)
+
+    # test
+    metrics.instrument_handler(dispatcher)
+    dispatcher.check_update(make_text_update('/alpha'))
+
+    # assertions
+    assert getattr(sys.modules['fake_commands.alpha'].handler.callback, 'instrumented', False)
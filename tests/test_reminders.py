@@ -0,0 +1,102 @@
+import datetime
+import sqlite3
+import threading
+
+import pytest
+
+from reminders import ReminderScheduler
+
+
+def minutes(n):
+    return datetime.timedelta(minutes=n)
+
+
+def test_reminder_scheduler_pops_due_reminders_in_order(tmp_path, frozen_clock):
+    # setup
+    scheduler = ReminderScheduler(str(tmp_path / 'reminders.sqlite3'), fire=None, clock=frozen_clock)
+    now = frozen_clock.now()
+    scheduler.schedule(now + minutes(10), 1, 'leave')
+    scheduler.schedule(now + minutes(5), 1, 'get ready')
+    cancelled = scheduler.schedule(now + minutes(1), 2, 'cancelled')
+    scheduler.schedule(now + minutes(60), 3, 'later')
+
+    # test
+    assert scheduler.cancel(cancelled)
+    frozen_clock.advance(minutes(10))
+    due = scheduler.pop_due()
+
+    # assertions
+    assert [reminder.text for reminder in due] == ['get ready', 'leave']
+    assert not scheduler.cancel(cancelled)
+    assert len(scheduler) == 1
+    scheduler.stop()
+
+
+def test_reminder_scheduler_survives_restart(tmp_path, frozen_clock):
+    # setup
+    filename = str(tmp_path / 'reminders.sqlite3')
+    scheduler = ReminderScheduler(filename, fire=None, clock=frozen_clock)
+    now = frozen_clock.now()
+    scheduler.schedule(now + minutes(5), 1, 'chat 1')
+    scheduler.schedule(now + minutes(5), 2, 'chat 2')
+    scheduler.cancel(scheduler.schedule(now + minutes(5), 1, 'cancelled'))
+    scheduler.schedule(now - minutes(30), 1, 'stale')
+    scheduler.stop()
+
+    # test
+    reloaded = ReminderScheduler(filename, fire=None, owns=lambda chat_id: chat_id == 1, clock=frozen_clock)
+    frozen_clock.advance(minutes(5))
+    due = reloaded.pop_due()
+
+    # assertions
+    assert [(reminder.chat_id, reminder.text, reminder.due) for reminder in due] == [(1, 'chat 1', now + minutes(5))]
+    reloaded.stop()
+
+
+def test_reminder_scheduler_retries_a_failed_write(tmp_path, frozen_clock):
+    # setup
+    filename = str(tmp_path / 'reminders.sqlite3')
+    scheduler = ReminderScheduler(filename, fire=None, clock=frozen_clock)
+    now = frozen_clock.now()
+    first = scheduler.schedule(now + minutes(5), 1, 'first')
+    second = scheduler.schedule(now + minutes(5), 1, 'second')
+    scheduler._connection.execute(
+        "CREATE TRIGGER fail BEFORE INSERT ON reminders BEGIN SELECT RAISE(ABORT, 'disk is full'); END")
+
+    # test
+    with pytest.raises(sqlite3.Error):
+        scheduler.write_pending()
+    scheduler.cancel(second)
+    scheduler._connection.execute('DROP TRIGGER fail')
+    scheduler.stop()
+    reloaded = ReminderScheduler(filename, fire=None, clock=frozen_clock)
+    frozen_clock.advance(minutes(5))
+    due = reloaded.pop_due()
+
+    # assertions
+    assert [(reminder.id, reminder.text) for reminder in due] == [(first, 'first')]
+    reloaded.stop()
+
+
+def test_reminder_scheduler_fires_in_batches(tmp_path):
+    # setup
+    batches = []
+    fired = threading.Event()
+
+    def fire(batch):
+        batches.append(batch)
+        fired.set()
+
+    scheduler = ReminderScheduler(str(tmp_path / 'reminders.sqlite3'), fire=fire, flush_interval=0.01)
+    scheduler.start()
+    due = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(milliseconds=50)
+
+    # test
+    for chat_id in range(100):
+        scheduler.schedule(due, chat_id, 'leave')
+
+    # assertions
+    assert fired.wait(5)
+    scheduler.stop()
+    assert sum(len(batch) for batch in batches) == 100
+    assert len(batches[0]) == 100
@@ -0,0 +1,162 @@
+import csv
+import pytest
+import datetime as dt
+
+import routing
+
+# 08:00 in Singapore on a Monday
+monday_8am = dt.datetime(2022, 1, 3, 0, 0, tzinfo=dt.timezone.utc)
+# 00:00 in Singapore, between Monday and Tuesday
+midnight_tuesday = dt.datetime(2022, 1, 3, 16, 0, tzinfo=dt.timezone.utc)
+
+
+def write_table(directory, name: str, rows: list[list]) -> None:
+    with open(directory / name, 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+
+
+@pytest.fixture
+def feed(tmp_path):
+    """
+    two lines on weekdays, changing between them takes a 100m walk from City Hall to its exit B,
+    and a last train from Ang Mo Kio to Bishan at 00:10 the next day
+    """
+    write_table(tmp_path, 'agency.txt', [['agency_name', 'agency_timezone'], ['SBS', 'Asia/Singapore']])
+    write_table(tmp_path, 'stops.txt', [
+        ['stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon'],
+        ['AMK', '54009', 'Ang Mo Kio', '1.3000', '103.8000'],
+        ['BSH', '53009', 'Bishan', '1.3000', '103.8100'],
+        ['CTH', '04167', 'City Hall', '1.3000', '103.8200'],
+        ['CTHB', '04168', 'City Hall Exit B', '1.3009', '103.8200'],
+        ['DBG', '08057', 'Dhoby Ghaut', '1.3009', '103.8300'],
+    ])
+    write_table(tmp_path, 'calendar.txt', [
+        ['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+         'start_date', 'end_date'],
+        ['weekday', '1', '1', '1', '1', '1', '0', '0', '20220101', '20221231'],
+    ])
+    trips = [['route_id', 'service_id', 'trip_id']]
+    stop_times = [['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']]
+    for route_id, stop_ids, first_departure, hop in (('NS', ['AMK', 'BSH', 'CTH'], '08:00', 5),
+                                                     ('NE', ['CTHB', 'DBG'], '08:12', 8)):
+        hour, minute = map(int, first_departure.split(':'))
+        for departure in range(hour * 60 + minute, hour * 60 + minute + 45, 15):
+            trip_id = f'{route_id}{departure}'
+            trips.append([route_id, 'weekday', trip_id])
+            for sequence, stop_id in enumerate(stop_ids):
+                minutes = departure + sequence * hop
+                time = f'{minutes // 60:02d}:{minutes % 60:02d}:00'
+                stop_times.append([trip_id, time, time, stop_id, sequence + 1])
+    # the last train of the service day leaves after midnight
+    trips.append(['NS', 'weekday', 'NS_late'])
+    stop_times += [['NS_late', '24:10:00', '24:10:00', 'AMK', 1], ['NS_late', '24:15:00', '24:15:00', 'BSH', 2]]
+    write_table(tmp_path, 'trips.txt', trips)
+    write_table(tmp_path, 'stop_times.txt', stop_times)
+    return tmp_path
+
+
+@pytest.fixture
+def planner(feed):
+    planner = routing.RoutePlanner(str(feed))
+    planner.load()
+    return planner
+
+
+@pytest.mark.parametrize(
+    "origin, destination, departure, expected_arrival",
+    [
+        ('Ang Mo Kio', 'Bishan', monday_8am, monday_8am + dt.timedelta(minutes=5)),
+        # walks to exit B in time for the 08:12 train
+        ('Ang Mo Kio', 'Dhoby Ghaut', monday_8am, monday_8am + dt.timedelta(minutes=20)),
+        ('ang mo kio', '08057', monday_8am + dt.timedelta(minutes=1), monday_8am + dt.timedelta(minutes=35)),
+    ]
+)
+def test_leave_at(planner, origin, destination, departure, expected_arrival):
+    # test
+    route = planner.leave_at(origin, destination, departure)
+
+    # assertions
+    assert route.arrival == expected_arrival
+    assert route.minutes == (expected_arrival - departure) // dt.timedelta(minutes=1)
+
+
+def test_reach_by(planner):
+    # test
+    route = planner.reach_by('Ang Mo Kio', 'Dhoby Ghaut', monday_8am + dt.timedelta(minutes=40))
+
+    # assertions
+    assert route == routing.Route('Ang Mo Kio', 'Dhoby Ghaut', monday_8am + dt.timedelta(minutes=15),
+                                  monday_8am + dt.timedelta(minutes=40))
+
+
+@pytest.mark.parametrize(
+    "departure, expected_arrival",
+    [
+        # the last train of Monday's service
+        (midnight_tuesday - dt.timedelta(minutes=5), midnight_tuesday + dt.timedelta(minutes=15)),
+        (midnight_tuesday + dt.timedelta(minutes=5), midnight_tuesday + dt.timedelta(minutes=15)),
+        # the first train of Tuesday's service
+        (midnight_tuesday + dt.timedelta(minutes=11), monday_8am + dt.timedelta(days=1, minutes=5)),
+        # after Friday's service, on a Saturday without service
+        (midnight_tuesday + dt.timedelta(days=4, minutes=5), midnight_tuesday + dt.timedelta(days=4, minutes=15)),
+    ]
+)
+def test_leave_at_around_midnight(planner, departure, expected_arrival):
+    # test
+    route = planner.leave_at('Ang Mo Kio', 'Bishan', departure)
+
+    # assertions
+    assert route.arrival == expected_arrival
+
+
+def test_reach_by_after_midnight(planner):
+    # test
+    route = planner.reach_by('Ang Mo Kio', 'Bishan', midnight_tuesday + dt.timedelta(minutes=20))
+
+    # assertions
+    assert route.departure == midnight_tuesday + dt.timedelta(minutes=10)
+
+
+@pytest.mark.parametrize(
+    "query, message",
+    [
+        ('Changi', 'there is no stop called Changi'),
+        ('city', 'city could be City Hall, City Hall Exit B'),
+    ]
+)
+def test_find_stops_invalid(planner, query, message):
+    with pytest.raises(ValueError, match=message):
+        planner.find_stops(query)
+
+
+def test_find_stops_by_part_of_a_name(planner):
+    assert planner.find_stops('ghaut') == ('Dhoby Ghaut', (4,))
+
+
+def test_parse_route(planner):
+    assert planner.parse_route('from Ang Mo Kio to City Hall') == ('Ang Mo Kio', 'City Hall')
+
+
+def test_no_route_on_a_day_without_service(planner):
+    # 2022-01-01 is a Saturday
+    with pytest.raises(ValueError, match='there is no way to get from Ang Mo Kio to Bishan by then'):
+        planner.leave_at('Ang Mo Kio', 'Bishan', monday_8am - dt.timedelta(days=2))
+
+
+def test_queries_fail_until_loaded(feed):
+    with pytest.raises(ValueError, match='still loading'):
+        routing.RoutePlanner(str(feed)).leave_at('Ang Mo Kio', 'Bishan', monday_8am)
+
+
+def test_saved_index_is_loaded_instead_of_the_feed(feed, tmp_path, monkeypatch):
+    # setup
+    index_file = str(tmp_path / 'routes.index')
+    routing.RoutePlanner(str(feed), index_file=index_file).load()
+    monkeypatch.setattr(routing, 'load_gtfs', lambda *args: pytest.fail('the feed was loaded again'))
+
+    # test
+    planner = routing.RoutePlanner(str(feed), index_file=index_file)
+    planner.load()
+
+    # assertions
+    assert planner.leave_at('Ang Mo Kio', 'Bishan', monday_8am).arrival == monday_8am + dt.timedelta(minutes=5)
@@ -0,0 +1,33 @@
+import logging
+import pytest
+
+import startup
+
+
+def test_startup_profile_phases():
+    # setup
+    profile = startup.StartupProfile()
+
+    # test
+    import_phase = profile.mark('imports')
+    updater_phase = profile.mark('updater')
+
+    # assertions
+    assert [phase.name for phase in profile.phases] == ['imports', 'updater']
+    assert profile.elapsed() == pytest.approx(import_phase.seconds + updater_phase.seconds)
+    assert profile.report().splitlines()[-1].startswith('total')
+
+
+def test_startup_profile_first_update_over_budget(caplog):
+    # setup
+    profile = startup.StartupProfile(budget=0)
+    profile.mark('imports')
+
+    # test
+    with caplog.at_level(logging.INFO, logger='startup'):
+        profile.first_update()
+        profile.first_update()
+
+    # assertions
+    assert [phase.name for phase in profile.phases] == ['imports', 'first update']
+    assert any('budget' in record.message for record in caplog.records)
@@ -0,0 +1,113 @@
+import functools
+import multiprocessing
+import os
+import queue
+import pytest
+
+from supervisor import HashRing, Supervisor
+
+
+def record_updates(results, index: int, processes: int, update_queue) -> None:
+    """Worker that reports which worker handled which update, and exits on a 'crash' update"""
+    for data in iter(update_queue.get, None):
+        if data.get('crash'):
+            os._exit(1)
+        results.put((index, data['message']['chat']['id'], data['update_id']))
+
+
+def make_update(update_id: int, chat_id: int, **kwargs) -> dict:
+    return {'update_id': update_id, 'message': {'chat': {'id': chat_id}}, **kwargs}
+
+
+def collect(results, count: int) -> list:
+    return [results.get(timeout=30) for _ in range(count)]
+
+
+@pytest.fixture
+def make_supervisor():
+    supervisors = []
+
+    def make(processes):
+        results = multiprocessing.get_context('spawn').Queue()
+        supervisor = Supervisor(functools.partial(record_updates, results), processes,
+                                queue_size=10, restart_delay=0.05)
+        supervisor.start()
+        supervisors.append(supervisor)
+        return supervisor, results
+
+    yield make
+    for supervisor in supervisors:
+        supervisor.stop()
+
+
+def test_hash_ring_is_balanced():
+    ring = HashRing(4)
+
+    counts = [0] * 4
+    for chat_id in range(10000):
+        counts[ring.shard(chat_id)] += 1
+
+    assert min(counts) > 1500
+
+
+@pytest.mark.parametrize('shards', [1, 2, 4, 7])
+def test_hash_ring_moves_few_chats_when_resized(shards):
+    # setup
+    ring = HashRing(shards)
+    bigger_ring = HashRing(shards + 1)
+
+    # test
+    moved = [chat_id for chat_id in range(10000) if ring.shard(chat_id) != bigger_ring.shard(chat_id)]
+
+    # assertions
+    # only chats taken over by the new shard move
+    assert all(bigger_ring.shard(chat_id) == shards for chat_id in moved)
+    assert len(moved) < 10000 / (shards + 1) * 1.5
+
+
+def test_supervisor_routes_chats_to_one_worker_in_order(make_supervisor):
+    # setup
+    supervisor, results = make_supervisor(3)
+
+    # test
+    for update_id in range(60):
+        supervisor.dispatch(make_update(update_id, update_id % 6))
+    handled = collect(results, 60)
+
+    # assertions
+    for chat_id in range(6):
+        chat_handled = [(index, update_id) for index, chat, update_id in handled if chat == chat_id]
+        assert len({index for index, _ in chat_handled}) == 1
+        assert [update_id for _, update_id in chat_handled] == list(range(chat_id, 60, 6))
+
+
+def test_supervisor_restarts_crashed_workers(make_supervisor):
+    # setup
+    supervisor, results = make_supervisor(1)
+
+    # test
+    supervisor.dispatch(make_update(1, 42, crash=True))
+    supervisor.dispatch(make_update(2, 42))
+
+    # assertions
+    assert collect(results, 1) == [(0, 42, 2)]
+
+
+def test_supervisor_resize(make_supervisor):
+    # setup
+    supervisor, results = make_supervisor(2)
+    for update_id in range(10):
+        supervisor.dispatch(make_update(update_id, update_id))
+
+    # test
+    supervisor.resize(3)
+    for update_id in range(10, 40):
+        supervisor.dispatch(make_update(update_id, update_id))
+    handled = collect(results, 40)
+
+    # assertions
+    assert supervisor.processes == 3
+    assert sorted(update_id for _, _, update_id in handled) == list(range(40))
+    assert {index for index, _, update_id in handled if update_id >= 10} == {0, 1, 2}
+    with pytest.raises(queue.Empty):
+        results.get(timeout=0.2)
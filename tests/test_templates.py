@@ -0,0 +1,60 @@
+import datetime
+import json
+import pytest
+from unittest import mock
+
+from telegram import ParseMode, ReplyKeyboardMarkup
+
+import templates
+
+
+@pytest.mark.parametrize(
+    "source, values, expected",
+    [
+        ('(e.g. 1h or 15m)', {}, r'\(e\.g\. 1h or 15m\)'),
+        ('leave at __{time}__!', {'time': '9.30'}, r'leave at __9\.30__\!'),
+        ('*Sleep Now*', {}, '*Sleep Now*'),
+        ('Hi {first_name}!', {'first_name': 'a_b*c'}, r'Hi a\_b\*c\!'),
+        ('{{braces}} {name}', {'name': '{x}'}, r'\{braces\} \{x\}'),
+        ('{times!m}.', {'times': '__1__ or\n__2__'}, '__1__ or\n__2__\\.'),
+    ]
+)
+def test_template_escapes_text_and_slots(source, values, expected):
+    assert templates.Template(source).render(**values) == expected
+
+
+@pytest.mark.parametrize(
+    "reach, expected",
+    [
+        (datetime.datetime(2022, 1, 1, 9, 30), r'at 09:30 AM on 01 Jan \(09\.30\.05\)'),
+        (datetime.datetime(2022, 1, 1, 23, 5, tzinfo=datetime.timezone.utc), r'at 11:05 PM on 01 Jan \(23\.05\.05\)'),
+    ]
+)
+def test_template_formats_times(reach, expected):
+    template = templates.Template('at {reach:time} on {reach:%d %b} ({reach:%H.%M.%S})')
+
+    text = template.render(reach=reach.replace(second=5))
+
+    assert text == expected
+
+
+def test_plain_template():
+    template = templates.Template("It's time (now)! {name}", parse_mode=None)
+
+    assert template.render(name='a.b') == "It's time (now)! a.b"
+    assert template.kwargs == {}
+
+
+def test_template_reply_payload():
+    # setup
+    keyboard = ReplyKeyboardMarkup([['Sleep Now', 'Wake Time']], one_time_keyboard=True)
+    template = templates.Template('Choose!', reply_markup=keyboard)
+    message = mock.Mock()
+
+    # test
+    template.reply(message)
+
+    # assertions
+    message.reply_text.assert_called_once_with(r'Choose\!', parse_mode=ParseMode.MARKDOWN_V2,
+                                               reply_markup=keyboard.to_json())
+    assert json.loads(template.kwargs['reply_markup']) == keyboard.to_dict()
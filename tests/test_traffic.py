@@ -0,0 +1,124 @@
+from unittest import mock
+
+import pytest
+
+import traffic
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': text,
+        'chat': {'id': user_id, 'type': 'private', 'first_name': 'Shawn'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Shawn', 'username': 'shawn'}}}
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('/est 930a 45m 30m', '/est 930a 45m 30m'),
+        ('/sleep@gfhelper_bot 7a', '/sleep@gfhelper_bot 7a'),
+        ('1h 30m', '1h 30m'),
+        ('Sleep Now', 'Sleep Now'),
+        ('sleep 7a', 'sleep 7a'),
+        ('meet alice at 7p', 'xxxx xxxxx xx 7p'),
+        ('/cancel', '/cancel'),
+        ('/est 930 p', '/est 930 p'),
+        ('call me at 91234567', 'xxxx xx xx xxxxxxxx'),
+        ('91234567p', 'xxxxxxxxx'),
+        ('i am at home', 'x xx xx xxxx'),
+    ]
+)
+def test_scrub_text(text, expected):
+    assert traffic.scrub_text(text) == expected
+
+
+def test_anonymizer_replaces_ids_and_names():
+    # setup
+    anonymizer = traffic.Anonymizer(key=b'key')
+
+    # test
+    first = anonymizer.anonymize(make_update(1, 42, 'call mum at 7p'))
+    second = anonymizer.anonymize(make_update(2, 42, '/est'))
+    other = traffic.Anonymizer(key=b'other key').anonymize(make_update(1, 42, '/est'))
+
+    # assertions
+    message = first['message']
+    assert message['text'] == 'xxxx xxx xx 7p'
+    assert message['chat'] == {'id': message['from']['id'], 'type': 'private'}
+    assert message['from'] == {'id': message['chat']['id'], 'is_bot': False, 'first_name': 'user'}
+    assert message['chat']['id'] != 42
+    assert second['message']['chat']['id'] == message['chat']['id']
+    assert other['message']['chat']['id'] != message['chat']['id']
+
+
+def test_recorder_round_trip(tmp_path):
+    # setup
+    filename = str(tmp_path / 'traffic.jsonl.gz')
+    recorder = traffic.TrafficRecorder(filename, anonymize=False, flush_interval=60)
+
+    # test
+    for update_id in range(1, 4):
+        recorder.record(make_update(update_id, 42, '/est'))
+    recorder.stop()
+    recorder = traffic.TrafficRecorder(filename, anonymize=False, flush_interval=60)
+    recorder.record(make_update(4, 42, '/sleep'))
+    recorder.stop()
+    recorded = list(traffic.read_traffic(filename))
+
+    # assertions
+    assert [data for received, data in recorded] == [make_update(update_id, 42, text) for update_id, text in
+                                                     ((1, '/est'), (2, '/est'), (3, '/est'), (4, '/sleep'))]
+    assert recorded[0][0] <= recorded[-1][0]
+
+
+def test_read_traffic_of_an_interrupted_recording(tmp_path):
+    # setup
+    filename = str(tmp_path / 'traffic.jsonl.gz')
+    recorder = traffic.TrafficRecorder(filename, flush_interval=60)
+    recorder.record(make_update(1, 42, '/est'))
+    recorder.write_pending()
+
+    # test
+    # the recorder is never stopped, as if the bot crashed
+    recorded = list(traffic.read_traffic(filename))
+
+    # assertions
+    assert [data['update_id'] for received, data in recorded] == [1]
+
+
+def test_recorder_skips_an_update_it_can_not_record(tmp_path):
+    # setup
+    filename = str(tmp_path / 'traffic.jsonl.gz')
+    recorder = traffic.TrafficRecorder(filename, anonymize=False, flush_interval=60)
+
+    # test
+    recorder.record(make_update(1, 42, '/est'))
+    recorder.record({'update_id': 2, 'message': object()})
+    recorder.record(make_update(3, 42, '/est'))
+    recorder.stop()
+    recorded = list(traffic.read_traffic(filename))
+
+    # assertions
+    assert [data['update_id'] for received, data in recorded] == [1, 3]
+    assert recorder.recorded == 2
+
+
+def test_recorder_retries_a_failed_write(tmp_path):
+    # setup
+    filename = str(tmp_path / 'traffic.jsonl.gz')
+    recorder = traffic.TrafficRecorder(filename, anonymize=False, flush_interval=60)
+    file = recorder._file
+    recorder._file = mock.Mock(write=mock.Mock(side_effect=OSError('disk is full')))
+    recorder.record(make_update(1, 42, '/est'))
+    recorder.record(make_update(2, 42, '/est'))
+
+    # test
+    with pytest.raises(OSError):
+        recorder.write_pending()
+    recorder._file = file
+    recorder.record(make_update(3, 42, '/est'))
+    recorder.stop()
+    recorded = list(traffic.read_traffic(filename))
+
+    # assertions
+    assert [data['update_id'] for received, data in recorded] == [1, 2, 3]
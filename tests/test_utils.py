@@ -109,3 +109,135 @@ def test_process_hhmm_time_exceptions(hm_str, except_msg):
     with pytest.raises(ValueError) as exc_info:
         utils.process_hm_time(hm_str)
     assert str(exc_info.value) == except_msg
+
+
+@pytest.mark.parametrize(
+    "txt, expected",
+    [
+        ('930a', utils.ParsedInput(utils.TIME, 9, 30, 'a')),
+        ('0930 p', utils.ParsedInput(utils.TIME, 9, 30, 'p')),
+        ('000a', utils.ParsedInput(utils.TIME, 0, 0, 'a')),
+        ('7a', utils.ParsedInput(utils.TIME, 7, 0, 'a')),
+        ('11 p', utils.ParsedInput(utils.TIME, 11, 0, 'p')),
+        ('1h', utils.ParsedInput(utils.DURATION, hours=1)),
+        ('999m', utils.ParsedInput(utils.DURATION, minutes=999)),
+        ('1h 30m', utils.ParsedInput(utils.DURATION, 1, 30)),
+        ('930', utils.UNKNOWN_INPUT),
+        ('1h30m', utils.UNKNOWN_INPUT),
+        ('hello', utils.UNKNOWN_INPUT),
+    ]
+)
+def test_parse_input(txt, expected):
+    assert utils.parse_input(txt) == expected
+
+
+@pytest.mark.parametrize(
+    "txt, expected",
+    [
+        ('1h', utils.process_h_or_m_time('1h')),
+        ('45m', utils.process_h_or_m_time('45m')),
+        ('1h 10m', utils.process_hm_time('1h 10m')),
+    ]
+)
+def test_parsed_to_timedelta(txt, expected):
+    assert utils.parsed_to_timedelta(utils.parse_input(txt)) == expected
+
+
+@pytest.mark.parametrize(
+    "txt, except_msg",
+    [
+        ('0h', 'hours cannot be 0'),
+        ('0m', 'minutes cannot be 0'),
+        ('1h 60m', 'minutes cannot be more than 59'),
+        ('1300p', 'hours cannot be more than 23'),
+    ]
+)
+def test_parsed_input_failure(txt, except_msg):
+    parsed = utils.parse_input(txt)
+    with pytest.raises(ValueError) as exc_info:
+        if parsed.kind == utils.TIME:
+            utils.parsed_to_datetime(parsed)
+        else:
+            utils.parsed_to_timedelta(parsed)
+    assert str(exc_info.value) == except_msg
+
+
+def test_get_timezone_is_cached():
+    assert utils.get_timezone('Europe/London') is utils.get_timezone('Europe/London')
+
+
+def test_get_timezone_invalid():
+    with pytest.raises(ValueError) as exc_info:
+        utils.get_timezone('Mars/Olympus')
+    assert str(exc_info.value) == 'Mars/Olympus is not a valid timezone'
+
+
+@pytest.mark.parametrize(
+    "utc_datetime, expected_hour",
+    [
+        # London is UTC+0 in winter and UTC+1 in summer
+        (datetime.datetime(2022, 1, 15, 9, 30, tzinfo=utils.UTC), 9),
+        (datetime.datetime(2022, 7, 15, 9, 30, tzinfo=utils.UTC), 10),
+    ]
+)
+def test_convert_utc_to_local_dst(utc_datetime, expected_hour):
+    assert utils.convert_utc_to_local(utc_datetime, 'Europe/London').hour == expected_hour
+
+
+def test_process_hhmm_time_timezone():
+    test_dt = utils.process_hhmm_time('930a', 'America/New_York')
+    local_dt = utils.convert_utc_to_local(test_dt, 'America/New_York')
+
+    assert (local_dt.hour, local_dt.minute) == (9, 30)
+    assert test_dt >= utils.get_datetime_utc_now().replace(second=0, microsecond=0)
+
+
+@pytest.mark.parametrize(
+    "hhmm_string, expected",
+    [
+        # frozen clock is at 8:00 a.m. SGT on 1 Jan 2022
+        ('930a', datetime.datetime(2022, 1, 1, 1, 30, tzinfo=utils.UTC)),
+        ('800a', datetime.datetime(2022, 1, 1, 0, 0, tzinfo=utils.UTC)),
+        ('759a', datetime.datetime(2022, 1, 1, 23, 59, tzinfo=utils.UTC)),
+    ]
+)
+def test_process_hhmm_time_frozen_clock(frozen_clock, hhmm_string, expected):
+    assert utils.process_hhmm_time(hhmm_string, now=frozen_clock.now()) == expected
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (['1h', '15m', '30m'], ['1h 15m', '30m']),
+        (['45m', '1h'], ['45m', '1h']),
+        (['1h', '2h'], ['1h', '2h']),
+        ([], []),
+    ]
+)
+def test_group_duration_args(args, expected):
+    assert utils.group_duration_args(args) == expected
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (['930a', '45m'], (utils.ParsedInput(utils.TIME, 9, 30, 'a'), ['45m'])),
+        (['930', 'p', '1h', '15m'], (utils.ParsedInput(utils.TIME, 9, 30, 'p'), ['1h', '15m'])),
+        (['7a'], (utils.ParsedInput(utils.TIME, 7, 0, 'a'), [])),
+    ]
+)
+def test_time_from_args(args, expected):
+    assert utils.time_from_args(args) == expected
+
+
+@pytest.mark.parametrize(
+    "args, except_msg",
+    [
+        ([], 'send a time (e.g 930a or 1030p)'),
+        (['45m', '930a'], '45m is not a time (e.g 930a or 1030p)'),
+    ]
+)
+def test_time_from_args_exceptions(args, except_msg):
+    with pytest.raises(ValueError) as exc_info:
+        utils.time_from_args(args)
+    assert str(exc_info.value) == except_msg
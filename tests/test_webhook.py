@@ -0,0 +1,130 @@
+import json
+import threading
+import pytest
+
+from http.client import HTTPConnection
+
+from webhook import WebhookServer, update_chat_id
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'chat': {'id': chat_id}, 'text': 'hi'}}
+
+
+def post(server: WebhookServer, body, path: str = '/token', headers: dict = None) -> int:
+    connection = HTTPConnection('127.0.0.1', server.port, timeout=5)
+    body = body if isinstance(body, bytes) else json.dumps(body).encode()
+    connection.request('POST', path, body, {'Content-Type': 'application/json', **(headers or {})})
+    status = connection.getresponse().status
+    connection.close()
+    return status
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(process_update, **kwargs):
+        server = WebhookServer('127.0.0.1', 0, 'token', process_update, **kwargs)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+@pytest.mark.parametrize('data,expected', [
+    (make_update(1, 42), 42),
+    ({'update_id': 1, 'callback_query': {'from': {'id': 7}, 'message': {'chat': {'id': 42}}}}, 42),
+    ({'update_id': 1, 'inline_query': {'from': {'id': 7}, 'query': ''}}, 7),
+    ({'update_id': 1}, 0),
+])
+def test_update_chat_id(data, expected):
+    assert update_chat_id(data) == expected
+
+
+def test_webhook_server_processes_updates(make_server):
+    # setup
+    processed = []
+    done = threading.Event()
+
+    def process_update(data):
+        processed.append(data['update_id'])
+        if len(processed) == 20:
+            done.set()
+
+    server = make_server(process_update, workers=2)
+
+    # test
+    statuses = [post(server, make_update(i, 42)) for i in range(20)]
+
+    # assertions
+    assert statuses == [200] * 20
+    assert done.wait(5)
+    # updates of one chat are handled in the order they arrived
+    assert processed == list(range(20))
+
+
+@pytest.mark.parametrize('body,path,headers,expected', [
+    (make_update(1, 42), '/other', {}, 404),
+    (b'not json', '/token', {}, 400),
+    ({'message': {}}, '/token', {}, 400),
+    (make_update(1, 42), '/token', {'Content-Type': 'text/plain'}, 415),
+    (make_update(1, 42), '/token', {'X-Telegram-Bot-Api-Secret-Token': 'wrong'}, 403),
+])
+def test_webhook_server_rejects_invalid_requests(make_server, body, path, headers, expected):
+    # setup
+    processed = []
+    server = make_server(processed.append, secret_token='secret')
+    headers.setdefault('X-Telegram-Bot-Api-Secret-Token', 'secret')
+
+    # test
+    status = post(server, body, path, headers)
+
+    # assertions
+    assert status == expected
+    assert processed == []
+
+
+def test_webhook_server_routes(make_server):
+    # setup
+    server = make_server(lambda data: None)
+    server.add_route('/metrics', lambda: (200, 'text/plain', b'up 1\n'))
+    connection = HTTPConnection('127.0.0.1', server.port, timeout=5)
+
+    # test
+    connection.request('GET', '/metrics')
+    response = connection.getresponse()
+    body = response.read()
+    connection.request('GET', '/other')
+    other_status = connection.getresponse().status
+    connection.close()
+
+    # assertions
+    assert (response.status, body) == (200, b'up 1\n')
+    assert other_status == 404
+
+
+def test_webhook_server_answers_503_when_queue_is_full(make_server):
+    # setup
+    started = threading.Event()
+    release = threading.Event()
+
+    def process_update(data):
+        started.set()
+        release.wait(5)
+
+    server = make_server(process_update, queue_size=2, workers=1)
+
+    # test
+    # the first update is taken by the worker, the next two fill the queue
+    statuses = [post(server, make_update(0, 42))]
+    started.wait(5)
+    statuses += [post(server, make_update(i, 42)) for i in range(1, 4)]
+    release.set()
+
+    # assertions
+    assert statuses[-1] == 503
+    assert statuses.count(200) == 3
@@ -0,0 +1,203 @@
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+
+from typing import Iterator, Optional
+
+import registry
+import utils
+
+logger = logging.getLogger(__name__)
+
+# fields with what the user typed
+text_fields = ('text', 'query', 'caption')
+# fields with a user or chat, their ids are replaced and their names dropped
+identity_fields = ('from', 'user', 'chat', 'sender_chat', 'forward_from', 'forward_from_chat')
+name_fields = ('first_name', 'last_name', 'username', 'title')
+# fields that only identify the user and that no handler reads
+dropped_fields = ('contact', 'location', 'venue', 'photo', 'document', 'voice', 'video', 'sticker')
+# the reply keyboard buttons of the conversations, kept like the commands
+kept_texts = frozenset({'Sleep Now', 'Wake Time'})
+# commands, e.g. /cancel or /est@gfhelper_bot, and the halves of a time sent with a space, e.g. 930 p
+kept_word_regex = re.compile(r'/\w+(?:@\w+)?|\d{1,4}|[ap]', re.IGNORECASE)
+# no time or duration has more digits than this, longer numbers are phone numbers and the like
+long_number_regex = re.compile(r'\d{5,}')
+
+
+def scrub_text(text: str) -> str:
+    """
+    Replaces the words of a message that are not commands, times or durations with x's
+
+    Every word keeps its length, so the offsets of the message's entities still match, and a
+    replayed message is routed to the same handler as the original.
+    """
+    if text in kept_texts:
+        return text
+
+    def scrub(match: re.Match) -> str:
+        word = match.group()
+        # inline queries name the command without the slash, e.g. sleep 7a
+        if long_number_regex.search(word):
+            return 'x' * len(word)
+        if (kept_word_regex.fullmatch(word) or utils.parse_input(word.lower()).kind != utils.UNKNOWN
+                or word.lower() in registry.bot_commands.names):
+            return word
+        return 'x' * len(word)
+
+    return re.sub(r'\S+', scrub, text)
+
+
+class Anonymizer:
+    """
+    Takes what identifies a user out of raw updates
+
+    Names are dropped, free text is scrubbed with `scrub_text` and every chat and user id is
+    replaced with a keyed hash of it. The key is random, so the ids can not be reversed, but the
+    same id is replaced the same way for the whole recording, so the updates of a chat still
+    belong together when they are replayed.
+    """
+
+    def __init__(self, key: bytes = None):
+        self.key = key or secrets.token_bytes(16)
+
+    def user_id(self, user_id: int) -> int:
+        digest = hmac.new(self.key, str(user_id).encode(), hashlib.sha256).digest()
+        pseudonym = int.from_bytes(digest[:6], 'big') or 1
+        # group chats have negative ids
+        return -pseudonym if user_id < 0 else pseudonym
+
+    def anonymize(self, data: dict) -> dict:
+        """Returns an anonymized copy of a raw update"""
+        anonymized = {}
+        for key, value in data.items():
+            if key in dropped_fields:
+                continue
+            if key in text_fields and isinstance(value, str):
+                value = scrub_text(value)
+            elif key in identity_fields and isinstance(value, dict):
+                value = {field: field_value for field, field_value in self.anonymize(value).items()
+                         if field not in name_fields}
+                if 'id' in value:
+                    value['id'] = self.user_id(value['id'])
+                if key in ('from', 'user', 'forward_from'):
+                    # sleep greets the user by their first name
+                    value['first_name'] = 'user'
+            elif key == 'chat_id' and isinstance(value, int):
+                value = self.user_id(value)
+            elif isinstance(value, dict):
+                value = self.anonymize(value)
+            elif isinstance(value, list):
+                value = [self.anonymize(item) if isinstance(item, dict) else item for item in value]
+            anonymized[key] = value
+        return anonymized
+
+
+class TrafficRecorder:
+    """
+    Records the raw updates the bot receives to a compressed log, for benchmarks.bench_load
+
+    Each line of the log is the JSON of the time an update arrived, in seconds since the epoch,
+    and the update. `record` only appends to a list, the bot's updates are not held up by the
+    disk: a thread of the recorder writes the list to the gzip file every `flush_interval`
+    seconds and flushes it, so a crash loses at most the updates of that interval. A file that
+    already exists is appended to.
+
+    Parameters
+    ----------
+    filename
+        path to the log, read back with `read_traffic`
+    anonymize
+        whether updates are recorded with their names, ids and free text replaced, see `Anonymizer`
+    flush_interval
+        maximum number of seconds an update stays in memory before it is written to disk
+    """
+
+    def __init__(self, filename: str, anonymize: bool = True, flush_interval: float = 1.0):
+        self.filename = filename
+        self.anonymizer = Anonymizer() if anonymize else None
+        self.flush_interval = flush_interval
+        self.recorded = 0
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._running = True
+        self._file = gzip.open(filename, 'at', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name='TrafficRecorder', daemon=True)
+        self._thread.start()
+
+    def record(self, data: dict) -> None:
+        with self._cond:
+            self._pending.append((time.time(), data))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                self._cond.wait(self.flush_interval)
+            try:
+                self.write_pending()
+            except OSError:
+                logger.exception('Failed to write the recorded traffic to %s', self.filename)
+
+    def write_pending(self) -> None:
+        """Writes the recorded updates to disk"""
+        with self._cond:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        written = 0
+        try:
+            for received, data in pending:
+                line = self._encode(received, data)
+                if line is not None:
+                    self._file.write(line)
+                    self.recorded += 1
+                written += 1
+            self._file.flush()
+        except OSError:
+            # put the updates that were not written back to be retried, ahead of those recorded since
+            with self._cond:
+                self._pending = pending[written:] + self._pending
+            raise
+
+    def _encode(self, received: float, data: dict) -> Optional[str]:
+        """Returns the line of the log for an update, or None for an update that can not be recorded"""
+        try:
+            if self.anonymizer:
+                data = self.anonymizer.anonymize(data)
+            return json.dumps([round(received, 3), data], separators=(',', ':'), ensure_ascii=False) + '\n'
+        except Exception:
+            # one odd update must not stop the recording of the others
+            logger.exception('Failed to record update %s', data.get('update_id'))
+            return None
+
+    def stop(self) -> None:
+        """Stops the recorder's thread and writes everything that is still pending to disk"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.write_pending()
+        self._file.close()
+        logger.info('Recorded %d updates to %s', self.recorded, self.filename)
+
+
+def read_traffic(filename: str) -> Iterator[tuple[float, dict]]:
+    """Yields the time each recorded update arrived and the update, in the order they were recorded"""
+    with gzip.open(filename, 'rt', encoding='utf-8') as file:
+        try:
+            for line in file:
+                received, data = json.loads(line)
+                yield received, data
+        except (EOFError, json.JSONDecodeError):
+            # the end of a log whose recorder did not stop cleanly
+            logger.warning('%s ends with an incomplete record', filename)
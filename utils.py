@@ -1,34 +1,240 @@
+import re
 import datetime as dt
+import functools
 import common
-import pytz
+
+from typing import NamedTuple, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 PYTZ_SGT = "Asia/Singapore"
+DEFAULT_TIMEZONE = PYTZ_SGT
+UTC = dt.timezone.utc
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=UTC)
+
+# kinds of user input recognised by `parse_input`
+TIME, DURATION, UNKNOWN = 'time', 'duration', 'unknown'
+
+# the whole time input grammar, matched in a single pass
+input_regex = re.compile(
+    r'^(?:'
+    r'(?P<clock>\d{1,}\d{2})\s?(?P<period>[ap])'
+    r'|(?P<hour>\d{1,2})\s?(?P<hour_period>[ap])'
+    r'|(?P<hm_hours>\d{1,2})h\s(?P<hm_minutes>\d{1,2})m'
+    r'|(?P<amount>\d{1,3})(?P<unit>[hm])'
+    r')$'
+)
+
+
+class ParsedInput(NamedTuple):
+    """
+    The classification of a message sent by the user
+
+    `kind` is one of TIME, DURATION or UNKNOWN. For TIME, `hours` and `minutes` hold the 12 hour
+    clock time and `period` is 'a' or 'p'. For DURATION, `hours` and `minutes` are None when the
+    user did not give that unit.
+    """
+    kind: str
+    hours: Optional[int] = None
+    minutes: Optional[int] = None
+    period: Optional[str] = None
+
+
+UNKNOWN_INPUT = ParsedInput(UNKNOWN)
 
 
 def get_datetime_utc_now() -> dt.datetime:
     """Creates and returns an 'aware' datetime object at the current time in UTC"""
-    return pytz.utc.localize(dt.datetime.utcnow())
+    return dt.datetime.now(UTC)
+
+
+@functools.lru_cache(maxsize=None)
+def get_timezone(name: str) -> dt.tzinfo:
+    """
+    Returns the timezone for an IANA timezone name, e.g. 'Asia/Singapore'
+
+    Each zone is only resolved once. ZoneInfo loads the zone's table of UTC offset transitions
+    when it is created, so every conversion afterwards is a lookup in that table, and stays
+    correct across daylight saving transitions.
+
+    Raises
+    ------
+    ValueError
+        If `name` is not a known timezone
+    """
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'{name} is not a valid timezone')
+
+
+def get_user_timezone(user_data: dict) -> str:
+    """Returns the name of the timezone the user picked with /timezone, or the default timezone"""
+    return user_data.get('timezone', DEFAULT_TIMEZONE)
+
+
+def get_datetime_local_now(tz_name: str = DEFAULT_TIMEZONE) -> dt.datetime:
+    """Creates and returns an 'aware' datetime object at the current time in the given timezone"""
+    return dt.datetime.now(get_timezone(tz_name))
+
+
+def convert_utc_to_local(date: dt.datetime, tz_name: str = DEFAULT_TIMEZONE) -> dt.datetime:
+    """Converts an 'aware' datetime object from UTC to the given timezone"""
+    return date.astimezone(get_timezone(tz_name))
+
+
+def convert_local_to_utc(date: dt.datetime) -> dt.datetime:
+    """Converts an 'aware' datetime object from any timezone to UTC time"""
+    return date.astimezone(UTC)
+
+
+def has_utc_offset_change(start: dt.datetime, end: dt.datetime, tz_name: str = DEFAULT_TIMEZONE) -> bool:
+    """Returns whether the timezone's UTC offset differs between two 'aware' datetime objects, e.g. across DST"""
+    tz = get_timezone(tz_name)
+    return start.astimezone(tz).utcoffset() != end.astimezone(tz).utcoffset()
+
+
+def to_epoch_minutes(date: dt.datetime) -> int:
+    """Returns the whole minutes since the unix epoch of an 'aware' datetime object, dropping any seconds"""
+    return int(date.timestamp()) // 60
+
+
+def from_epoch_minutes(minutes: int) -> dt.datetime:
+    """Creates and returns an 'aware' datetime object in UTC from minutes since the unix epoch"""
+    return EPOCH + dt.timedelta(minutes=minutes)
 
 
 def get_datetime_sgt_now():
     """Creates and returns an 'aware' datetime object in SGT at the current time in SGT"""
-    sg_timezone = pytz.timezone(PYTZ_SGT)
-    d_naive = dt.datetime.now()
-    return sg_timezone.localize(d_naive)
+    return get_datetime_local_now(PYTZ_SGT)
 
 
 def convert_utc_to_sgt(date: dt.datetime) -> dt.datetime:
     """Converts an 'aware' datetime object from UTC to SGT time"""
-    return date.astimezone(pytz.timezone(PYTZ_SGT))
+    return convert_utc_to_local(date, PYTZ_SGT)
 
 
 def convert_sgt_to_utc(date: dt.datetime) -> dt.datetime:
     """Converts an 'aware' datetime object from SGT to UTC time"""
-    return date.astimezone(pytz.timezone("Etc/UTC"))
+    return convert_local_to_utc(date)
 
 
-def process_hhmm_time(txt: str) -> dt.datetime:
+@functools.lru_cache(maxsize=1024)
+def parse_input(txt: str) -> ParsedInput:
     """
+    Tokenizes a message once and classifies it as an absolute time, a duration or unknown
+
+    The result is cached, so the filters that route a message and the handler that processes it
+    share a single parse.
+
+    Examples
+    --------
+    >>> parse_input('930 a')
+    ParsedInput(kind='time', hours=9, minutes=30, period='a')
+
+    >>> parse_input('7p')
+    ParsedInput(kind='time', hours=7, minutes=0, period='p')
+
+    >>> parse_input('1h 30m')
+    ParsedInput(kind='duration', hours=1, minutes=30, period=None)
+
+    >>> parse_input('15m')
+    ParsedInput(kind='duration', hours=None, minutes=15, period=None)
+    """
+    match = input_regex.match(txt)
+    if match is None:
+        return UNKNOWN_INPUT
+
+    clock, period, hour, hour_period, hm_hours, hm_minutes, amount, unit = match.groups()
+    if clock is not None:
+        return ParsedInput(TIME, int(clock[:-2]), int(clock[-2:]), period)
+    if hour is not None:
+        return ParsedInput(TIME, int(hour), 0, hour_period)
+    if hm_hours is not None:
+        return ParsedInput(DURATION, int(hm_hours), int(hm_minutes))
+    if unit == 'h':
+        return ParsedInput(DURATION, hours=int(amount))
+    return ParsedInput(DURATION, minutes=int(amount))
+
+
+def parsed_to_datetime(parsed: ParsedInput, tz_name: str = DEFAULT_TIMEZONE,
+                       now: dt.datetime = None) -> dt.datetime:
+    """Returns the 'aware' datetime in UTC for a TIME input, see `process_hhmm_time`"""
+    return hhmm_to_datetime(parsed.hours, parsed.minutes, parsed.period, tz_name, now)
+
+
+def parsed_to_timedelta(parsed: ParsedInput) -> dt.timedelta:
+    """Returns the negative timedelta for a DURATION input, see `process_h_or_m_time` and `process_hm_time`"""
+    if parsed.hours is not None and parsed.minutes is not None:
+        return hm_to_timedelta(parsed.hours, parsed.minutes)
+    if parsed.hours is not None:
+        return hours_to_timedelta(parsed.hours)
+    return minutes_to_timedelta(parsed.minutes)
+
+
+def hhmm_to_datetime(raw_hour: int, minute: int, period: str,
+                     tz_name: str = DEFAULT_TIMEZONE, now: dt.datetime = None) -> dt.datetime:
+    """Validates a 12 hour clock time in the given timezone and returns the next occurrence of it in UTC"""
+    hour = raw_hour
+    if period == 'p' and hour != 12:
+        hour += 12
+
+    if period == 'a' and hour == 12:
+        # handle 1200a
+        hour = 0
+
+    if hour > 23:
+        raise ValueError('hours cannot be more than 23')
+    if minute > 59:
+        raise ValueError('minutes cannot be more than 59')
+
+    utc_now = now if now is not None else get_datetime_utc_now()
+    local_now = convert_utc_to_local(utc_now, tz_name)
+
+    local_now = local_now.replace(second=0, microsecond=0)
+    local_processed_dt = local_now.replace(hour=hour, minute=minute)
+    if local_processed_dt < local_now:
+        # move forward by a calendar day in local time, which is not always 24 hours across DST
+        next_date = local_now.date() + dt.timedelta(days=1)
+        local_processed_dt = local_processed_dt.replace(
+            year=next_date.year, month=next_date.month, day=next_date.day)
+
+    return convert_local_to_utc(local_processed_dt)
+
+
+def hours_to_timedelta(hours: int) -> dt.timedelta:
+    """Validates a duration given in hours only and returns it as a negative timedelta"""
+    if hours > 23:
+        raise ValueError('hours cannot be more than 23')
+    if hours == 0:
+        raise ValueError('hours cannot be 0')
+
+    return dt.timedelta(hours=-hours)
+
+
+def minutes_to_timedelta(minutes: int) -> dt.timedelta:
+    """Validates a duration given in minutes only and returns it as a negative timedelta"""
+    if minutes == 0:
+        raise ValueError('minutes cannot be 0')
+
+    return dt.timedelta(minutes=-minutes)
+
+
+def hm_to_timedelta(hours: int, minutes: int) -> dt.timedelta:
+    """Validates a duration given in hours and minutes and returns it as a negative timedelta"""
+    if minutes > 59:
+        raise ValueError('minutes cannot be more than 59')
+
+    if hours > 23:
+        raise ValueError('hours cannot be more than 23')
+
+    if minutes == 0 and hours == 0:
+        raise ValueError('hours and minutes cannot both be 0')
+
+    return dt.timedelta(hours=-hours, minutes=-minutes)
+
+
+def process_hhmm_time(txt: str, tz_name: str = DEFAULT_TIMEZONE, now: dt.datetime = None) -> dt.datetime:
+    r"""
     processes the HH:MM period format in SGT and creates an 'aware' datetime object in UTC 
 
     Takes in a string matching the regex `^\d{1,}\d{2}\s?[ap]$`
@@ -40,6 +246,10 @@ def process_hhmm_time(txt: str) -> dt.datetime:
     ----------
     txt
         A string following either formats: 'HH:MM p' or 'HH:MMp'
+    tz_name
+        The timezone `txt` is in, SGT by default
+    now
+        The current time in UTC, read from the clock if not given
 
 
     Returns
@@ -72,33 +282,11 @@ def process_hhmm_time(txt: str) -> dt.datetime:
     minute = int(txt[-3:-1])
     period = txt[-1]
 
-    hour = int(raw_hour)
-    if period == 'p' and hour != 12:
-        hour += 12
-
-    if period == 'a' and hour == 12:
-        # handle 1200a
-        hour = 0
-
-    if hour > 23:
-        raise ValueError('hours cannot be more than 23')
-    if minute > 59:
-        raise ValueError('minutes cannot be more than 59')
-
-    sgt_now = get_datetime_sgt_now()
-    utc_now = get_datetime_utc_now()
-
-    sgt_processed_dt = sgt_now.replace(hour=int(hour), minute=minute)
-    utc_process_dt = convert_sgt_to_utc(sgt_processed_dt)
-
-    if utc_process_dt < utc_now:
-        utc_process_dt += dt.timedelta(days=1)
-
-    return utc_process_dt
+    return hhmm_to_datetime(raw_hour, minute, period, tz_name, now)
 
 
 def process_h_or_m_time(txt: str) -> dt.timedelta:
-    """
+    r"""
     process the h or m time format, e.g. 10 m or 1 h and returns a timedelta object
 
     Takes in a string matching the regex `^\d{1,3}[hm]$` which is either 'MMm' or either 'HHh'
@@ -139,26 +327,13 @@ def process_h_or_m_time(txt: str) -> dt.timedelta:
         ValueError: 'hours cannot be 0'
     """
     if txt[-1] == 'h':
-        # hours
-        hours = int(txt[:-1].strip())
-        if hours > 23:
-            raise ValueError('hours cannot be more than 23')
-        if hours == 0:
-            raise ValueError('hours cannot be 0')
-
-        return dt.timedelta(hours=-hours)
-
-    else:
-        # minutes
-        minutes = int(txt[:-1].strip())
-        if minutes == 0:
-            raise ValueError('minutes cannot be 0')
+        return hours_to_timedelta(int(txt[:-1].strip()))
 
-        return dt.timedelta(minutes=-minutes)
+    return minutes_to_timedelta(int(txt[:-1].strip()))
 
 
 def process_hm_time(txt: str):
-    """
+    r"""
         process the hm time format, e.g. 1h 10m and returns a timedelta object
 
         Takes in a string matching the regex `^\d{1,2}h\s\d{1,2}m$` which is either 'Hh MMm'
@@ -211,16 +386,74 @@ def process_hm_time(txt: str):
 
     minutes = int(minutes_str)
 
-    if minutes > 59:
-        raise ValueError('minutes cannot be more than 59')
+    return hm_to_timedelta(hours, minutes)
 
-    if hours > 23:
-        raise ValueError('hours cannot be more than 23')
 
-    if minutes == 0 and hours == 0:
-        raise ValueError('hours and minutes cannot both be 0')
+def group_duration_args(args: list[str]) -> list[str]:
+    """
+    Groups command arguments into duration strings
 
-    return dt.timedelta(hours=-hours, minutes=-minutes)
+    An 'Hh' argument followed by an 'MMm' argument is one duration, every other argument is a
+    duration of its own.
+
+    Examples
+    --------
+    >>> group_duration_args(['1h', '15m', '30m'])
+    ['1h 15m', '30m']
+    """
+    durations = []
+    i = 0
+    while i < len(args):
+        if (i + 1 < len(args) and args[i].endswith('h') and args[i + 1].endswith('m')
+                and parse_input(f'{args[i]} {args[i + 1]}').kind == DURATION):
+            durations.append(f'{args[i]} {args[i + 1]}')
+            i += 2
+        else:
+            durations.append(args[i])
+            i += 1
+    return durations
+
+
+def durations_from_args(args: list[str]) -> list[dt.timedelta]:
+    """
+    Parses command arguments into the negative timedelta objects of each duration
+
+    Raises
+    ------
+    ValueError
+        If an argument is not a duration, or a duration is invalid
+    """
+    deltas = []
+    for txt in group_duration_args(args):
+        parsed = parse_input(txt)
+        if parsed.kind != DURATION:
+            raise ValueError(f'{txt} is not a duration (e.g. 1h or 1h 30m or 15m)')
+        deltas.append(parsed_to_timedelta(parsed))
+    return deltas
+
+
+def time_from_args(args: list[str]) -> tuple[ParsedInput, list[str]]:
+    """
+    Parses the time at the start of command arguments, returns it and the arguments after it
+
+    Raises
+    ------
+    ValueError
+        If the arguments do not start with a time
+
+    Examples
+    --------
+    >>> time_from_args(['930', 'p', '45m'])
+    (ParsedInput(kind='time', hours=9, minutes=30, period='p'), ['45m'])
+    """
+    if not args:
+        raise ValueError('send a time (e.g 930a or 1030p)')
+    used = 2 if len(args) > 1 and args[1] in ('a', 'p') else 1
+    txt = ' '.join(args[:used])
+    parsed = parse_input(txt)
+    if parsed.kind != TIME:
+        raise ValueError(f'{txt} is not a time (e.g 930a or 1030p)')
+    return parsed, args[used:]
 
 
 def underline_str(text: str) -> str:
@@ -237,3 +470,12 @@ def time_input_err_to_str(err_msg: str) -> str:
         f'{err_msg}\n' +
         'please try again!'
     )
+
+
+def route_input_err_to_str(err_msg: str) -> str:
+    return (
+        common.hedgehog +
+        'Sorry I could not plan that route as:\n' +
+        f'{err_msg}\n' +
+        'please try again!'
+    )
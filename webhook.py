@@ -0,0 +1,190 @@
+import hmac
+import json
+import logging
+import queue
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# telegram's updates are a few kilobytes, anything much larger is not from telegram
+max_body_size = 1024 * 1024
+
+
+def update_chat_id(data: dict) -> int:
+    """
+    Returns the id of the chat a raw update belongs to, or of its user when it has no chat
+
+    Updates of the same chat are always handled by the same worker, in the order they arrived.
+    """
+    for key, value in data.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = value.get('from') or value.get('user')
+        if user:
+            return user['id']
+    return 0
+
+
+class WebhookServer:
+    """
+    Receives telegram's webhook requests and acknowledges them before the update is handled
+
+    Each valid update is put into a bounded queue and answered with 200 right away, and worker
+    threads behind the queues pass the updates on to `process_update`. Updates are spread over
+    the workers by chat, so the updates of a chat are still handled one at a time and in order.
+    When a worker's queue is full the request is answered with 503, and telegram delivers the
+    update again later instead of the bot running out of memory.
+
+    Parameters
+    ----------
+    listen
+        address to listen on
+    port
+        port to listen on
+    url_path
+        path telegram posts updates to
+    process_update
+        called with every decoded update
+    queue_size
+        number of updates waiting to be handled that are accepted before answering 503
+    workers
+        number of threads handling updates
+    secret_token
+        if given, requests without this X-Telegram-Bot-Api-Secret-Token header are rejected
+    """
+
+    def __init__(self, listen: str, port: int, url_path: str, process_update: Callable[[dict], None],
+                 queue_size: int = 1000, workers: int = 4, secret_token: str = None):
+        self.url_path = '/' + url_path.lstrip('/')
+        self.process_update = process_update
+        self.secret_token = secret_token
+        self.routes = {}
+
+        self._queues = [queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self._workers = [
+            threading.Thread(target=self._work, args=(update_queue,), name=f'WebhookWorker_{i}', daemon=True)
+            for i, update_queue in enumerate(self._queues)
+        ]
+
+        self.httpd = ThreadingHTTPServer((listen, port), self._make_request_handler())
+        self.httpd.daemon_threads = True
+        self._serve_thread = threading.Thread(
+            target=self.httpd.serve_forever, args=(0.1,), name='WebhookServer', daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def add_route(self, path: str, handler: Callable[[], tuple]) -> None:
+        """
+        Serves GET requests for `path`, e.g. /metrics, next to the webhook
+
+        `handler` is called without arguments and returns the status, content type and body
+        """
+        self.routes[path] = handler
+
+    def queue_depth(self) -> int:
+        """Returns the number of updates waiting to be handled"""
+        return sum(update_queue.qsize() for update_queue in self._queues)
+
+    def enqueue(self, data: dict) -> bool:
+        """Queues a decoded update, returns False if its worker's queue is full"""
+        update_queue = self._queues[update_chat_id(data) % len(self._queues)]
+        try:
+            update_queue.put_nowait(data)
+            return True
+        except queue.Full:
+            return False
+
+    def _work(self, update_queue: queue.Queue) -> None:
+        while True:
+            data = update_queue.get()
+            if data is None:
+                return
+            try:
+                self.process_update(data)
+            except Exception:
+                logger.exception('Failed to process update %s', data.get('update_id'))
+
+    def _make_request_handler(self) -> type:
+        server = self
+
+        class WebhookRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self, status: int, content_type: str = 'text/plain', body: bytes = b'') -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                if status == 503:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                route = server.routes.get(self.path)
+                if route is None:
+                    self._respond(404)
+                    return
+                self._respond(*route())
+
+            def do_POST(self):
+                if self.path != server.url_path:
+                    self._respond(404)
+                    return
+
+                secret_token = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+                if server.secret_token and not hmac.compare_digest(secret_token, server.secret_token):
+                    self._respond(403)
+                    return
+
+                try:
+                    length = int(self.headers.get('Content-Length'))
+                except (TypeError, ValueError):
+                    self._respond(411)
+                    return
+                if length > max_body_size:
+                    self._respond(413)
+                    self.close_connection = True
+                    return
+
+                body = self.rfile.read(length)
+                if not self.headers.get('Content-Type', '').startswith('application/json'):
+                    self._respond(415)
+                    return
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    self._respond(400)
+                    return
+                if not isinstance(data, dict) or 'update_id' not in data:
+                    self._respond(400)
+                    return
+
+                self._respond(200 if server.enqueue(data) else 503)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return WebhookRequestHandler
+
+    def start(self) -> None:
+        for worker in self._workers:
+            worker.start()
+        self._serve_thread.start()
+        logger.info('Webhook server listening on port %d', self.port)
+
+    def stop(self) -> None:
+        """Stops accepting updates and waits for the queued updates to be handled"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for update_queue in self._queues:
+            update_queue.put(None)
+        for worker in self._workers:
+            worker.join()